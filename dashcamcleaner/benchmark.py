@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from cli import parse_arguments as parse_cli_arguments
+from src.benchmark import filter_benchmark, pipeline_benchmark, startup_benchmark, thread_benchmark, tile_benchmark
+from src.weights import get_inference_size
+
+
+def parse_arguments():
+    """
+    Argument parser
+    :return: set of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks to keep DashcamCleaner's performance from regressing.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    startup = subparsers.add_parser("startup", help="Measure CLI startup and import time.")
+    startup.add_argument("-n", "--repeats", help="Measurements per command.", type=int, default=5)
+    startup.add_argument(
+        "--max_seconds",
+        help="Fail if the median startup time of any command exceeds this budget.",
+        type=float,
+        default=None,
+    )
+
+    pipeline = subparsers.add_parser(
+        "pipeline", help="Time every stage of the blurring pipeline on synthetic videos, CPU-only unless --weights is given."
+    )
+    pipeline.add_argument("-r", "--resolutions", help="Comma separated resolutions.", type=str, default="720p,1080p,2160p")
+    pipeline.add_argument("-f", "--frames", help="Frames per synthetic video.", type=int, default=60)
+    pipeline.add_argument("--boxes", help="Comma separated amounts of fake detections per frame.", type=str, default="0,4,16")
+    pipeline.add_argument("-s", "--batch_size", help="Inference batch size.", type=int, default=2)
+    pipeline.add_argument("-bw", "--blur_workers", help="Processes used for blurring.", type=int, default=2)
+    pipeline.add_argument(
+        "-w", "--weights", help="Run real inference with these weights instead of using fake detections.", type=str, default=None
+    )
+    pipeline.add_argument("-o", "--output", help="Write the JSON report to this file instead of stdout.", type=str, default=None)
+
+    filters = subparsers.add_parser("filters", help="Compare the latency of all obfuscation filters on synthetic frames.")
+    filters.add_argument("-r", "--resolutions", help="Comma separated resolutions.", type=str, default="1080p,2160p")
+    filters.add_argument("-f", "--frames", help="Frames per measurement.", type=int, default=20)
+    filters.add_argument("--boxes", help="Comma separated amounts of fake detections per frame.", type=str, default="4,16")
+    filters.add_argument("-b", "--blur_sizes", help="Comma separated filter strengths.", type=str, default="9,25")
+    filters.add_argument("-o", "--output", help="Write the JSON report to this file instead of stdout.", type=str, default=None)
+
+    tiles = subparsers.add_parser(
+        "tiles", help="Compare cost and recall of full frame, tiled and native resolution inference on a video, requires weights."
+    )
+    tiles.add_argument("-i", "--input_path", help="Input video, ideally 4K footage with distant plates.", type=str, required=True)
+    tiles.add_argument("-w", "--weights", help="Weights file to use.", type=str, default="720p_medium_mosaic")
+    tiles.add_argument("-f", "--frames", help="Frames to run detection on.", type=int, default=60)
+    tiles.add_argument("-s", "--batch_size", help="Inference batch size, also the amount of tiles per detector call.", type=int, default=2)
+    tiles.add_argument("-tb", "--tile_bands", help="Bands to tile, see cli.py --help.", type=str, default="0.35-0.65")
+    tiles.add_argument("-ts", "--tile_size", help="Tile size in pixels, 0 uses the inference size.", type=int, default=0)
+    tiles.add_argument("-to", "--tile_overlap", help="Overlap of neighbouring tiles.", type=float, default=0.2)
+    tiles.add_argument("-o", "--output", help="Write the JSON report to this file instead of stdout.", type=str, default=None)
+
+    threads = subparsers.add_parser(
+        "threads", help="Compare blur_video with the libraries' default threads to thread budgets, CPU-only unless --weights is given."
+    )
+    threads.add_argument("-r", "--resolution", help="Resolution of the synthetic video.", type=str, default="1080p")
+    threads.add_argument("-f", "--frames", help="Frames of the synthetic video.", type=int, default=120)
+    threads.add_argument("--boxes", help="Fake detections per frame.", type=int, default=8)
+    threads.add_argument(
+        "-th", "--budgets", help="Comma separated thread budgets, defaults to the amount of cores.", type=str, default=str(os.cpu_count())
+    )
+    threads.add_argument("-s", "--batch_size", help="Inference batch size.", type=int, default=2)
+    threads.add_argument("-bw", "--blur_workers", help="Processes used for blurring.", type=int, default=2)
+    threads.add_argument(
+        "-w", "--weights", help="Run real inference with these weights instead of using fake detections.", type=str, default=None
+    )
+    threads.add_argument("-o", "--output", help="Write the JSON report to this file instead of stdout.", type=str, default=None)
+    return parser.parse_args()
+
+
+def get_blur_parameters(opt) -> dict:
+    """
+    Blurring parameters for benchmarks, the CLI defaults overridden by the benchmark's arguments
+    :param opt: parsed benchmark arguments
+    :return: blurring parameters
+    """
+    parameters = vars(parse_cli_arguments(["-i", ".", "-o", "."]))
+    if opt.benchmark == "tiles":
+        parameters.update(
+            weights=opt.weights,
+            inference_size=get_inference_size(opt.weights),
+            batch_size=opt.batch_size,
+            tile_bands=opt.tile_bands,
+            tile_size=opt.tile_size,
+            tile_overlap=opt.tile_overlap,
+        )
+    if opt.benchmark not in ["pipeline", "threads"]:
+        return parameters
+    parameters["batch_size"] = opt.batch_size
+    parameters["blur_workers"] = opt.blur_workers
+    if opt.weights:
+        parameters["weights"] = opt.weights
+        parameters["inference_size"] = get_inference_size(opt.weights)
+    return parameters
+
+
+def write_report(report: dict, output: str = None) -> None:
+    """
+    Print a JSON report or write it to a file
+    :param report: benchmark results
+    :param output: optional output file
+    """
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    opt = parse_arguments()
+    if opt.benchmark == "startup":
+        report = startup_benchmark(opt.repeats)
+        print(json.dumps(report, indent=2))
+        if report["eager_heavy_imports"]:
+            sys.exit(f"Importing cli.py loads {', '.join(report['eager_heavy_imports'])} eagerly.")
+        if opt.max_seconds and any(result["median"] > opt.max_seconds for result in report["commands"].values()):
+            sys.exit(f"Startup exceeded the budget of {opt.max_seconds} seconds.")
+    elif opt.benchmark == "pipeline":
+        parameters = get_blur_parameters(opt)
+        detector = None
+        if opt.weights:
+            from src.blurrer import VideoBlurrer
+
+            detector = VideoBlurrer(opt.weights, parameters)
+        report = pipeline_benchmark(
+            opt.resolutions.split(","), opt.frames, [int(boxes) for boxes in opt.boxes.split(",")], parameters, detector
+        )
+        write_report(report, opt.output)
+    elif opt.benchmark == "filters":
+        report = filter_benchmark(
+            opt.resolutions.split(","),
+            [int(boxes) for boxes in opt.boxes.split(",")],
+            [int(blur_size) for blur_size in opt.blur_sizes.split(",")],
+            opt.frames,
+            get_blur_parameters(opt),
+        )
+        write_report(report, opt.output)
+    elif opt.benchmark == "tiles":
+        from src.blurrer import VideoBlurrer
+
+        parameters = get_blur_parameters(opt)
+        report = tile_benchmark(Path(opt.input_path), opt.frames, parameters, VideoBlurrer(opt.weights, parameters))
+        write_report(report, opt.output)
+    elif opt.benchmark == "threads":
+        report = thread_benchmark(
+            opt.resolution, opt.frames, opt.boxes, [int(budget) for budget in opt.budgets.split(",")],
+            get_blur_parameters(opt),
+            opt.weights,
+        )
+        write_report(report, opt.output)
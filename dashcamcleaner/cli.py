@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
+import queue
 import signal
 import sys
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Union
-import re
+from shutil import which
+from typing import Dict, List, Tuple, Union
 
-from src.blurrer import VideoBlurrer
+from src.filter_names import FILTER_NAMES
+from src.prometheus import exporter
+from src.watcher import FolderWatcher
+from src.weights import get_inference_size, get_weights_path
 
 # makes it possible to interrupt while running in other thread
 signal.signal(signal.SIGINT, signal.SIG_DFL)
@@ -28,6 +34,10 @@ class CLI:
         Sanity check for paths in input arguments
         """
         input_path, output_path = Path(self.opt.input_path), Path(self.opt.output_path)
+        if self.opt.watch:  # daemon mode, existing outputs are skipped instead of aborting
+            if not input_path.is_dir() or not output_path.is_dir():
+                sys.exit("For watch mode, both input_path and output_path must be directories!")
+            return
         if input_path.is_file() and output_path.is_dir():  # if input refers a file, output must refer to a file too
             self.opt.output_path = (output_path / input_path.name).absolute()
             output_path = Path(self.opt.output_path)
@@ -45,12 +55,54 @@ class CLI:
         elif not input_path.is_file():
             sys.exit("input_path is invalid")
 
+    def check(self):
+        """
+        Validate weights and external tools without loading the detector, input paths are already checked by sanitize_opts
+        """
+        weights_path = get_weights_path(self.opt.weights)
+        if not weights_path.is_file():
+            sys.exit(f'The weights file "{weights_path}" does not exist.')
+        try:
+            inference_size = get_inference_size(self.opt.weights)
+        except AttributeError:
+            sys.exit(f'The weights name "{self.opt.weights}" does not contain a training resolution like "720p_".')
+        print(f"Weights: {weights_path} (inference size {inference_size})")
+        if self.opt.profile:
+            from src.profiles import get_profile_path, load_profile
+
+            try:
+                profile = load_profile(self.opt.profile)
+            except (OSError, ValueError) as e:
+                sys.exit(f'The profile "{get_profile_path(self.opt.profile)}" could not be loaded: {e}')
+            print(f"Profile: {profile.name} (crop {list(profile.crop)}, {len(profile.exclusions)} exclusion regions)")
+        if self.opt.tile_bands:
+            from src.tiling import parse_bands
+
+            try:
+                bands = parse_bands(self.opt.tile_bands)
+            except ValueError as e:
+                sys.exit(str(e))
+            if not 0 <= self.opt.tile_overlap <= 0.9:
+                sys.exit(f"Tile overlap {self.opt.tile_overlap} is out of range [0.0, 0.9].")
+            print(f"Tile bands: {bands}")
+        if which("ffmpeg") is None and not os.getenv("FFMPEG_BINARY"):
+            print("Warning: ffmpeg could not be found, audio will not be copied to the output.")
+        print("All checks passed.")
+
     def start_blurring(self):
         """
         Start the blurring process(es)
         """
         input_path, output_path = Path(self.opt.input_path), Path(self.opt.output_path)
-        if input_path.is_dir():  # batch mode
+        if self.opt.metrics_port:
+            exporter.start_server(self.opt.metrics_port)
+        if self.opt.watch:
+            self.start_watching()
+        elif input_path.is_dir() and self.opt.concurrent_files > 1:  # batch mode, several videos at once
+            self.start_blurring_concurrently(
+                [(input_file.absolute(), (output_path / input_file.name).absolute()) for input_file in sorted(input_path.glob("*.*"))]
+            )
+        elif input_path.is_dir():  # batch mode
             for input_file in sorted(input_path.glob("*.*")):
                 self.opt.input_path = input_file.absolute()
                 self.opt.output_path = (output_path / input_file.name).absolute()
@@ -58,31 +110,114 @@ class CLI:
         else:
             self.start_blurring_file()
 
+    def start_watching(self):
+        """
+        Continuously blur new videos appearing in the input folder
+        """
+        from src.blurrer import VideoBlurrer
+
+        parameters = self.get_parameters()
+        print("Blurring parameter:", parameters)
+        blurrer = VideoBlurrer(self.opt.weights, parameters)
+        watcher = FolderWatcher(
+            blurrer, parameters, Path(self.opt.input_path), Path(self.opt.output_path), self.opt.poll_interval
+        )
+        watcher.run()
+
+    def get_parameters(self) -> Dict[str, Union[bool, int, float, str]]:
+        """
+        Convert the input arguments to a blurring parameter dictionary
+        :return: blurring parameters
+        """
+        parameters: Dict[str, Union[bool, int, float, str]] = vars(self.opt)  # convert opt to dict type
+
+        # read inference size
+        parameters["inference_size"] = get_inference_size(parameters["weights"])
+        if parameters["threads"]:
+            from src.threads import allocate_threads
+
+            print("Thread allocation:", allocate_threads(parameters["threads"], parameters["blur_workers"], parameters["concurrent_files"]))
+        return parameters
+
+    def start_blurring_concurrently(self, files: List[Tuple[Path, Path]]):
+        """
+        Blur several videos at the same time, their frames are batched together by a shared inference service
+        :param files: input and output path of every video
+        """
+        from src.blurrer import VideoBlurrer
+        from src.inference_service import InferenceService
+
+        parameters = self.get_parameters()
+        print("Blurring parameter:", parameters)
+        service = InferenceService(parameters["batch_size"])
+        pending: "queue.Queue[Tuple[Path, Path]]" = queue.Queue()
+        for paths in files:
+            pending.put(paths)
+
+        def work():
+            # every worker keeps its blurrer and blur process pool for all of its videos
+            blurrer = VideoBlurrer(self.opt.weights, dict(parameters))
+            blurrer.inference_service = service
+            try:
+                while True:
+                    try:
+                        input_file, output_file = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    print("Start blurring video:", input_file)
+                    blurrer.parameters = {**parameters, "input_path": str(input_file), "output_path": str(output_file)}
+                    try:
+                        blurrer.blur_video()
+                    except Exception:
+                        exporter.file_finished(False)
+                        raise
+                    exporter.file_finished(True)
+                    print("Blurred video successfully written to:", output_file)
+            finally:
+                blurrer.close()
+
+        try:
+            with ThreadPoolExecutor(self.opt.concurrent_files) as executor:
+                for future in [executor.submit(work) for _ in range(min(self.opt.concurrent_files, len(files)))]:
+                    future.result()
+        finally:
+            service.close()
+        statistics = service.statistics()
+        print(f"Ran {statistics['batches']} inference batches, {statistics['mean_batch_fill']:.0%} full on average.")
+
     def start_blurring_file(self):
         """
         Blur a single video file
         """
+        from src.blurrer import VideoBlurrer
+
         print("Start blurring video:", self.opt.input_path)
         print("Blurring parameter:", vars(self.opt))
 
         # set up parameters
-        parameters: Dict[str, Union[bool, int, float, str]] = vars(self.opt)  # convert opt to dict type
-
-        # read inference size
-        model_name: str = parameters["weights"]
-        training_inference_size: int = int(re.search(r"(?P<imgsz>\d*)p\_", model_name).group("imgsz"))
-        parameters["inference_size"] = int(training_inference_size * 16 / 9)
+        parameters = self.get_parameters()
 
         # setup blurrer
         blurrer = VideoBlurrer(self.opt.weights, parameters)
-        blurrer.blur_video()
+        try:
+            blurrer.blur_video()
+        except Exception:
+            exporter.file_finished(False)
+            raise
+        finally:
+            blurrer.close()
+        exporter.file_finished(True)
+        if self.opt.motion_threshold:
+            gating = blurrer.metrics.summary()["inference_gating"]
+            print(f"Skipped inference on {gating['skipped_frames']} frames ({gating['skipped_fraction']:.1%}) without motion.")
 
         print("Blurred video successfully written to:", self.opt.output_path)
 
 
-def parse_arguments():
+def parse_arguments(args: List[str] = None):
     """
     Argument parser
+    :param args: arguments to parse, defaults to sys.argv
     :return: set of parsed arguments
     """
 
@@ -176,6 +311,25 @@ Not recommended for CPU usage.""",
         metavar="[1, 99]",
         default=9,
     )
+    optional.add_argument(
+        "-fi",
+        "--filter",
+        required=False,
+        help="""Obfuscation filter applied to detected regions, the blur_size sets its strength.
+box: box blur. gaussian: smoother, slowest for large sizes. pixelate: mosaic of (blur_size + 1) pixel blocks, cheaper than blurring. solid: black fill, cheapest.""",
+        type=str,
+        choices=FILTER_NAMES,
+        default="box",
+    )
+    optional.add_argument(
+        "-p",
+        "--profile",
+        required=False,
+        help="""Camera profile, the name of a JSON file in the profiles folder or a path to one.
+Detection only runs on the profile's crop (e.g. without sky and hood), detections in its exclusion regions (e.g. a timestamp overlay) are not blurred.""",
+        type=str,
+        default=None,
+    )
     optional.add_argument(
         "-t",
         "--threshold",
@@ -232,12 +386,95 @@ Not recommended for CPU usage.""",
         choices=range(10 + 1),
         default=0
     )
+    advanced.add_argument(
+        "-tb",
+        "--tile_bands",
+        required=False,
+        help="""Additionally run the detector on full resolution tiles of these horizontal bands, e.g. 0.35-0.65 for the horizon of a 4K dashcam.
+Bands are relative y_min-y_max pairs of the frame (or of the profile's crop), separate several bands by commas.
+Finds distant plates that are too small after downscaling the frame to the inference size, at the cost of one inference per tile.""",
+        type=str,
+        default=None,
+    )
+    advanced.add_argument(
+        "-ts",
+        "--tile_size",
+        required=False,
+        help="Maximum width and height of tiles in pixels, 0 uses the inference size of the weights.",
+        type=int,
+        default=0,
+    )
+    advanced.add_argument(
+        "-to",
+        "--tile_overlap",
+        required=False,
+        help="Minimum overlap of neighbouring tiles relative to the tile size, objects smaller than the overlap are never cut.",
+        type=float,
+        metavar="[0.0, 0.9]",
+        default=0.2,
+    )
+    advanced.add_argument(
+        "-mt",
+        "--motion_threshold",
+        required=False,
+        help="""Skip inference on frames without motion, e.g. while waiting at a red light, and reuse the detections of the last frame detection ran on.
+A frame counts as moving once a block of its downscaled grayscale image differs from that frame by more than this many gray levels on average (0-255), 4 is a good start.
+0 runs detection on every frame.""",
+        type=float,
+        metavar="[0.0, 255.0]",
+        default=0,
+    )
+    advanced.add_argument(
+        "-ri",
+        "--refresh_interval",
+        required=False,
+        help="With --motion_threshold, run detection at least once every n frames even if nothing moves.",
+        type=int,
+        default=30,
+    )
+    advanced.add_argument(
+        "-th",
+        "--threads",
+        required=False,
+        help="""Thread budget for the whole run, e.g. the cores of this machine or of its share of a node.
+It is split between the detector (torch), OpenCV in every blur worker, the encoder and the decoder, which otherwise each start one thread per core and oversubscribe large machines.
+0 keeps the libraries' defaults. --export_metrics reports the allocation and the thread counts in effect.""",
+        type=int,
+        default=0,
+    )
+    advanced.add_argument(
+        "-md",
+        "--merge_distance",
+        required=False,
+        help="""Merge detections of the same kind that overlap or are at most this many pixels apart into a single blur region, as long as the merged box does not grow much beyond them.
+0 merges overlapping and touching detections only. Fewer regions bound the work per frame for crowds and shrink JSON exports, the merged regions still cover every detection.""",
+        type=int,
+        default=None,
+    )
+    advanced.add_argument(
+        "-mr",
+        "--max_regions",
+        required=False,
+        help="""Maximum amount of blur regions per frame, e.g. 32 to bound the blurring time of crowded frames or low thresholds.
+Excess detections are not dropped but merged with the neighbours that add the least area, so everything stays covered, a tight limit blurs more area around them. Faces that no ellipse within the frame can cover together stay separate. 0 means no limit.""",
+        type=int,
+        default=0,
+    )
+    advanced.add_argument(
+        "-cf",
+        "--concurrent_files",
+        required=False,
+        help="""Batch processing mode: blur this many videos at the same time, each with its own blur workers.
+Frames of all of them are collected into full inference batches, which keeps the detector busy with many short clips.""",
+        type=int,
+        default=1,
+    )
     advanced.add_argument(
         "-m",
         "--export_mask",
         action="store_true",
         required=False,
-        help="Export a black and white only video of the blur-mask without applying it to the input clip.",
+        help="Export a black and white only video of the blur-mask without applying it to the input clip. Much faster than blurring.",
         default=False,
     )
     advanced.add_argument(
@@ -250,7 +487,7 @@ The value represents the confidence of the detector.
 Lower values mean less confidence, brighter colors mean more confidence.
 If the --threshold setting is larger than 0 then detections with a lower confidence are discarded.
 Channels; Red: Faces, Green: Numberplates.
-Hint: turn off --feather_edges by setting -fe=0 and turn --quality to 10""",
+Hint: turn off --feather_edges by setting -fe=0 and turn --quality to 10, which encodes masks losslessly""",
         default=False,
     )
     advanced.add_argument(
@@ -261,14 +498,69 @@ Hint: turn off --feather_edges by setting -fe=0 and turn --quality to 10""",
         help="Export detections (based on index) to a JSON file.",
         default=False,
     )
+    advanced.add_argument(
+        "-em",
+        "--export_metrics",
+        action="store_true",
+        required=False,
+        help="""Export per-stage timings, queue occupancy, blur worker utilization, detections per frame and peak memory to a .metrics.json file next to the output.
+The limiting_stage entry names the stage that took the most time.""",
+        default=False,
+    )
+    advanced.add_argument(
+        "-mi",
+        "--metrics_interval",
+        required=False,
+        help="Additionally stream a snapshot of the metrics every n seconds as a line of JSON to a .metrics.jsonl file next to the output. 0 disables streaming.",
+        type=float,
+        default=0,
+    )
+    advanced.add_argument(
+        "-mp",
+        "--metrics_port",
+        required=False,
+        help="""Serve Prometheus metrics (frames processed, frames per second, inference and blur latency histograms, encoder backlog, failed files, cache hit rates) on http://127.0.0.1:port/metrics.
+0 disables the endpoint. Most useful for batch processing and watch mode.""",
+        type=int,
+        default=0,
+    )
+    advanced.add_argument(
+        "-wa",
+        "--watch",
+        action="store_true",
+        required=False,
+        help="""Keep running and blur every new video that appears in the input_path folder.
+Files are only picked up once their size stopped changing. Finished videos are atomically moved to the output_path folder, existing outputs are skipped.
+The queue is stored in the output folder and recovered on restart, queue depth and throughput are written to .dashcamcleaner_status.json.""",
+        default=False,
+    )
+    advanced.add_argument(
+        "-pi",
+        "--poll_interval",
+        required=False,
+        help="Seconds between two scans of the input folder in watch mode.",
+        type=float,
+        default=10.0,
+    )
+    advanced.add_argument(
+        "-c",
+        "--check",
+        action="store_true",
+        required=False,
+        help="Only validate input and output paths, weights, the camera profile, tile bands and ffmpeg, then exit. Does not load the detector.",
+        default=False,
+    )
     optional.add_argument(
         "-h", "--help", action="help", default=argparse.SUPPRESS, help="Show this help message and exit."
     )
 
-    return parser.parse_args()
+    return parser.parse_args(args)
 
 
 if __name__ == "__main__":
     opt = parse_arguments()
     cli = CLI(opt)
-    cli.start_blurring()
+    if opt.check:
+        cli.check()
+    else:
+        cli.start_blurring()
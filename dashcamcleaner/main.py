@@ -1,24 +1,28 @@
 #!/usr/bin/env python3
 import inspect
-import re
+import math
 import sys
-import time
 from pathlib import Path
+from timeit import default_timer as timer
 
-from PySide6.QtCore import QSettings
+from PySide6.QtCore import QSettings, Qt
+from PySide6.QtGui import QImage, QPixmap
 from PySide6.QtWidgets import (
     QApplication,
     QComboBox,
     QDoubleSpinBox,
     QFileDialog,
     QLineEdit,
+    QListWidgetItem,
     QMainWindow,
     QMessageBox,
     QRadioButton,
     QSpinBox,
 )
-from src.qt_wrapper import qtVideoBlurWrapper
+from src.preview import PreviewSession, detector_key
+from src.qt_wrapper import ModelLoader, PreviewLoader, qtVideoBlurWrapper
 from src.ui_mainwindow import Ui_MainWindow
+from src.weights import get_inference_size
 
 
 class MainWindow(QMainWindow):
@@ -34,12 +38,33 @@ class MainWindow(QMainWindow):
         self.ui.setupUi(self)
         self.restore()
         self.load_weights_options()
-        self.blur_wrapper = self.setup_blurrer()
+        self.blur_wrapper = None
+        self.model_loader = None
+        # videos to process, each one a dict of input_path, output_path and state (queued, running, done, failed or aborted)
+        self.jobs = []
+        self.queue_started = 0.0
+        self.queue_aborted = False
+        # decoded frames and detections of the preview, re-rendered whenever a blurring parameter changes
+        self.preview = PreviewSession()
+        self.preview_loader = None
+        self.preview_frame = None
+        self.setup_blurrer()
         self.ui.button_source.clicked.connect(self.button_source_clicked)
         self.ui.button_start.clicked.connect(self.button_start_clicked)
         self.ui.button_target.clicked.connect(self.button_target_clicked)
         self.ui.button_abort.clicked.connect(self.button_abort_clicked)
+        self.ui.button_queue_add.clicked.connect(self.button_queue_add_clicked)
+        self.ui.button_queue_remove.clicked.connect(self.button_queue_remove_clicked)
         self.ui.combo_box_weights.currentIndexChanged.connect(self.setup_blurrer)
+        self.ui.button_preview.clicked.connect(self.button_preview_clicked)
+        for spin_box in [
+            self.ui.spin_blur,
+            self.ui.spin_feather_edges,
+            self.ui.double_spin_threshold,
+            self.ui.double_spin_roimulti,
+            self.ui.spin_memory,
+        ]:
+            spin_box.valueChanged.connect(self.update_preview)
 
     def load_weights_options(self):
         self.ui.combo_box_weights.clear()
@@ -51,20 +76,98 @@ class MainWindow(QMainWindow):
 
     def setup_blurrer(self):
         """
-        Create and connect a blurrer thread
+        Load the selected model in the background, the blurrer thread is created once it is loaded
         """
         weights_name = self.ui.combo_box_weights.currentText()
-        init_params = self.aggregate_parameters()
-        blur_wrapper = qtVideoBlurWrapper(weights_name, init_params)
+        if self.blur_wrapper:
+            # the previous blurrer is idle, but keeps its blur worker processes alive until it is closed
+            self.blur_wrapper.close()
+        self.blur_wrapper = None
+        self.ui.button_start.setEnabled(False)
+        self.ui.combo_box_weights.setEnabled(False)
+        self.ui.label_status.setText(f"Loading {weights_name}...")
+        self.model_loader = ModelLoader(weights_name, get_inference_size(weights_name))
+        self.model_loader.failed.connect(self.blur_wrapper_alert)
+        self.model_loader.finished.connect(self.model_loaded)
+        self.model_loader.start()
+
+    def model_loaded(self):
+        """
+        Create and connect a blurrer thread for the model that was just loaded
+        """
+        self.ui.combo_box_weights.setEnabled(True)
+        if self.model_loader.error:
+            self.ui.label_status.setText("idle")
+            return
+        # the detector is cached in the model registry by now, so this does not block the UI
+        blur_wrapper = qtVideoBlurWrapper(self.model_loader.weights_name, self.aggregate_parameters())
         blur_wrapper.setMaximum.connect(self.setMaximumValue)
         blur_wrapper.updateProgress.connect(self.setProgress)
+        blur_wrapper.throughput.connect(self.setThroughput)
         blur_wrapper.finished.connect(self.blur_wrapper_finished)
         blur_wrapper.alert.connect(self.blur_wrapper_alert)
         blur_wrapper.status.connect(self.blur_wrapper_status)
-        msg_box = QMessageBox()
-        msg_box.setText(f"Successfully loaded {weights_name}.pt")
-        msg_box.exec()
-        return blur_wrapper
+        self.blur_wrapper = blur_wrapper
+        self.ui.label_status.setText(f"Loaded {self.model_loader.weights_name}.pt")
+        self.ui.button_start.setEnabled(True)
+
+    def button_preview_clicked(self):
+        """
+        Callback for button_preview, shows the selected frame blurred with the current parameters
+        """
+        if not self.blur_wrapper:
+            self.blur_wrapper_alert("Please wait until the model is loaded.")
+            return
+        if not self.ui.line_source.text():
+            self.blur_wrapper_alert("Please select a video first.")
+            return
+        self.preview_frame = self.ui.spin_preview_frame.value()
+        self.update_preview()
+
+    def update_preview(self):
+        """
+        Re-render the preview right away if its frames and detections are cached, otherwise load them in the background first
+        """
+        if self.preview_frame is None or not self.blur_wrapper:
+            return
+        if self.preview_loader and self.preview_loader.isRunning():
+            # preview_loaded picks up the latest parameters
+            return
+        parameters = self.aggregate_parameters()
+        input_path, blur_memory = parameters["input_path"], parameters["blur_memory"]
+        if self.preview.is_loaded(input_path, self.preview_frame, blur_memory, detector_key(self.blur_wrapper)):
+            self.show_preview(parameters)
+            return
+        self.ui.button_preview.setEnabled(False)
+        self.ui.label_status.setText(f"Loading preview of frame {self.preview_frame}...")
+        self.preview_loader = PreviewLoader(self.preview, self.blur_wrapper, input_path, self.preview_frame, blur_memory)
+        self.preview_loader.failed.connect(self.blur_wrapper_alert)
+        self.preview_loader.finished.connect(self.preview_loaded)
+        self.preview_loader.start()
+
+    def preview_loaded(self):
+        """
+        Show the preview once its frames are loaded
+        """
+        self.ui.button_preview.setEnabled(True)
+        if self.preview_loader.error:
+            self.preview_frame = None
+            self.ui.label_status.setText("idle")
+            return
+        self.update_preview()
+
+    def show_preview(self, parameters: dict):
+        """
+        Blur the preview frame and show it
+        :param parameters: blurring parameters
+        """
+        start = timer()
+        frame = self.preview.render(self.preview_frame, parameters)
+        height, width = frame.shape[:2]
+        image = QImage(frame.data, width, height, frame.strides[0], QImage.Format_BGR888)
+        pixmap = QPixmap.fromImage(image).scaled(min(width, self.width() - 40), 360, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.ui.label_preview.setPixmap(pixmap)
+        self.ui.label_status.setText(f"Preview of frame {self.preview_frame} rendered in {(timer() - start) * 1000:.0f} ms")
 
     def blur_wrapper_status(self, message: str):
         self.ui.label_status.setText(message)
@@ -80,12 +183,12 @@ class MainWindow(QMainWindow):
 
     def button_abort_clicked(self):
         """
-        Callback for button_abort
+        Callback for button_abort, stops the current video and the rest of the queue
         """
+        self.queue_aborted = True
         self.blur_wrapper.abort()
-        self.ui.progress.setValue(0)
-        self.ui.button_start.setEnabled(True)
         self.ui.button_abort.setEnabled(False)
+        self.ui.label_status.setText("Aborting...")
 
     def setProgress(self, value: int):
         """
@@ -94,6 +197,19 @@ class MainWindow(QMainWindow):
         """
         self.ui.progress.setValue(value)
 
+    def setThroughput(self, fps: float, remaining_seconds: float):
+        """
+        Show the current frame rate and the estimated remaining time of the current video
+        :param fps: smoothed frames per second
+        :param remaining_seconds: estimated remaining seconds, NaN if unknown
+        """
+        self.ui.label_fps.setText(f"{fps:.1f} fps" if fps else "- fps")
+        if math.isnan(remaining_seconds):
+            self.ui.label_eta.setText("ETA -")
+        else:
+            minutes, seconds = divmod(round(remaining_seconds), 60)
+            self.ui.label_eta.setText(f"ETA {minutes}:{seconds:02d}")
+
     def setMaximumValue(self, value: int):
         """
         Set progress bar's maximum value
@@ -102,13 +218,12 @@ class MainWindow(QMainWindow):
         self.ui.progress.setMaximum(value)
 
     def aggregate_parameters(self):
-        model_name = self.ui.combo_box_weights.currentText()
-        training_inference_size = int(re.search(r"(?P<imgsz>\d*)p\_", model_name).group("imgsz"))
-        inference_size = int(training_inference_size * 16 / 9)
+        inference_size = get_inference_size(self.ui.combo_box_weights.currentText())
         return {
             "input_path": self.ui.line_source.text(),
             "output_path": self.ui.line_target.text(),
             "blur_size": self.ui.spin_blur.value(),
+            "filter": "box",
             "threshold": self.ui.double_spin_threshold.value(),
             "roi_multi": self.ui.double_spin_roimulti.value(),
             "inference_size": inference_size,
@@ -118,27 +233,105 @@ class MainWindow(QMainWindow):
             "feather_edges": self.ui.spin_feather_edges.value(),
             "export_mask": False,
             "export_colored_mask": False,
+            "export_json": False,
             "blur_workers": self.ui.spin_blur_workers.value(),
             "blur_memory": self.ui.spin_memory.value(),
         }
 
+    def add_job(self) -> bool:
+        """
+        Add the selected source and target to the queue
+        :return: whether a job was added
+        """
+        input_path, output_path = self.ui.line_source.text(), self.ui.line_target.text()
+        if not input_path or not output_path:
+            self.blur_wrapper_alert("Please select a video and a target first.")
+            return False
+        if Path(input_path).resolve() == Path(output_path).resolve():
+            self.blur_wrapper_alert("The target must not be the source video itself.")
+            return False
+        if any(job["output_path"] == output_path and job["state"] in ["queued", "running"] for job in self.jobs):
+            self.blur_wrapper_alert(f"{output_path} is already the target of a queued video.")
+            return False
+        self.jobs.append({"input_path": input_path, "output_path": output_path, "state": "queued"})
+        self.refresh_queue()
+        return True
+
+    def refresh_queue(self):
+        """
+        Show all jobs and their states in the queue list
+        """
+        self.ui.list_queue.clear()
+        for job in self.jobs:
+            self.ui.list_queue.addItem(QListWidgetItem(f"[{job['state']}] {job['input_path']} -> {job['output_path']}"))
+
+    def button_queue_add_clicked(self):
+        """
+        Callback for button_queue_add
+        """
+        self.add_job()
+
+    def button_queue_remove_clicked(self):
+        """
+        Callback for button_queue_remove, removes the selected jobs except for a running one
+        """
+        selected = {index.row() for index in self.ui.list_queue.selectedIndexes()}
+        self.jobs = [job for row, job in enumerate(self.jobs) if row not in selected or job["state"] == "running"]
+        self.refresh_queue()
+
     def button_start_clicked(self):
         """
-        Callback for button_start
+        Callback for button_start, processes all queued videos one after another with the loaded model
         """
+        if not any(job["state"] == "queued" for job in self.jobs) and not self.add_job():
+            return
 
         self.ui.button_abort.setEnabled(True)
         self.ui.button_start.setEnabled(False)
+        self.ui.combo_box_weights.setEnabled(False)
+        self.queue_started = timer()
+        self.queue_aborted = False
+        self.start_next_job()
+
+    def start_next_job(self):
+        """
+        Start blurring the next queued video, or finish the queue if there is none left
+        """
+        job = next((job for job in self.jobs if job["state"] == "queued"), None)
+        if job is None or self.queue_aborted:
+            self.queue_finished()
+            return
+        job["state"] = "running"
+        self.refresh_queue()
 
         # set up parameters
         parameters = self.aggregate_parameters()
-        if self.blur_wrapper:
-            self.blur_wrapper.parameters = parameters
-            self.blur_wrapper.start()
-        else:
-            print("No blurrer object!")
+        parameters.update(input_path=job["input_path"], output_path=job["output_path"])
+        self.blur_wrapper.parameters = parameters
+        self.blur_wrapper.start()
         print("Blurrer started!")
 
+    def queue_finished(self):
+        """
+        Reset the UI and notify the user once the queue is processed or aborted
+        """
+        done = sum(1 for job in self.jobs if job["state"] == "done")
+        failed = sum(1 for job in self.jobs if job["state"] == "failed")
+        minutes, seconds = divmod(round(timer() - self.queue_started), 60)
+        msg_box = QMessageBox()
+        if self.queue_aborted:
+            msg_box.setText(f"Aborted after blurring {done} videos.")
+        elif failed:
+            msg_box.setText(f"Blurring {failed} of {done + failed} videos resulted in errors.")
+        else:
+            msg_box.setText(f"{done} videos blurred successfully in {minutes} minutes and {seconds} seconds.")
+        msg_box.exec()
+        self.ui.button_start.setEnabled(True)
+        self.ui.button_abort.setEnabled(False)
+        self.ui.combo_box_weights.setEnabled(True)
+        self.ui.progress.setValue(0)
+        self.setThroughput(0.0, float("nan"))
+
     def button_source_clicked(self):
         """
         Callback for button_source
@@ -196,21 +389,18 @@ class MainWindow(QMainWindow):
 
     def blur_wrapper_finished(self):
         """
-        Create a new blurrer, setup UI and notify the user
+        Record the result of the current video and continue with the next one
         """
-        msg_box = QMessageBox()
-        if self.blur_wrapper and self.blur_wrapper.result["success"]:
-            minutes = int(self.blur_wrapper.result["elapsed_time"] // 60)
-            seconds = round(self.blur_wrapper.result["elapsed_time"] % 60)
-            msg_box.setText(f"Video blurred successfully in {minutes} minutes and {seconds} seconds.")
+        job = next(job for job in self.jobs if job["state"] == "running")
+        if self.blur_wrapper.result["success"]:
+            job["state"] = "done"
+            minutes, seconds = divmod(round(self.blur_wrapper.result["elapsed_time"]), 60)
+            print(f"{job['input_path']} blurred successfully in {minutes} minutes and {seconds} seconds.")
         else:
-            msg_box.setText("Blurring resulted in errors.")
-        msg_box.exec()
-        if not self.blur_wrapper:
-            self.setup_blurrer()
-        self.ui.button_start.setEnabled(True)
-        self.ui.button_abort.setEnabled(False)
+            job["state"] = "aborted" if self.queue_aborted else "failed"
+        self.refresh_queue()
         self.ui.progress.setValue(0)
+        self.start_next_job()
 
     def save(self):
         """
@@ -247,11 +437,17 @@ class MainWindow(QMainWindow):
         Overload closeEvent to shut down blurrer and save UI settings
         :param event:
         """
-        self.blur_wrapper.abort()
         self.save()
         print("saved settings")
-        while self.blur_wrapper.isRunning():
-            time.sleep(1)
+        if self.model_loader:
+            self.model_loader.wait()
+        if self.preview_loader:
+            self.preview_loader.wait()
+        if self.blur_wrapper:
+            self.queue_aborted = True
+            self.blur_wrapper.abort()
+            self.blur_wrapper.wait()
+            self.blur_wrapper.close()
         QMainWindow.closeEvent(self, event)
 
 
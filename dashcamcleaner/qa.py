@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Tuple
+
+from cli import parse_arguments
+from src.weights import get_inference_size
+
+
+def contact_sheet_size(value: str) -> Tuple[int, int]:
+    """
+    Parse a contact sheet size given as COLUMNSxROWS
+    :param value: size from the command line, e.g. 4x4
+    :return: columns and rows, both at least 1
+    """
+    columns, _, rows = value.lower().partition("x")
+    if not (columns.isdigit() and rows.isdigit() and int(columns) >= 1 and int(rows) >= 1):
+        raise argparse.ArgumentTypeError(f"invalid contact sheet size {value}, expected at least one column and row, e.g. 4x4")
+    return int(columns), int(rows)
+
+
+def parse_qa_arguments():
+    """
+    Argument parser for the QA mode
+    :return: set of parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Review detections without rendering a video: writes annotated thumbnails or contact sheets of frames with detections, low-confidence detections and detection dropouts."
+    )
+    parser.add_argument("-i", "--input_path", help="Input video file.", type=str, required=True)
+    parser.add_argument("-o", "--output_folder", help="Folder for the review images and the review's index.", type=str, required=True)
+    parser.add_argument(
+        "-d",
+        "--detections",
+        help="Detections exported with --export_json, detection is skipped if given. Otherwise detections are cached in the output folder.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument("-w", "--weights", help="Weights file to use for detection.", type=str, default="720p_medium_mosaic")
+    parser.add_argument("-t", "--threshold", help="Detection threshold.", type=float, default=0.4)
+    parser.add_argument("-s", "--batch_size", help="Inference batch size.", type=int, default=2)
+    parser.add_argument(
+        "-lc", "--low_confidence", help="Sample frames with detections scoring below this value.", type=float, default=0.5
+    )
+    parser.add_argument(
+        "-iv", "--interval", help="Minimum seconds between two samples taken for the same reason.", type=float, default=5.0
+    )
+    parser.add_argument(
+        "-g", "--max_gap", help="Sample frames where detections vanish for at most this many frames.", type=int, default=5
+    )
+    parser.add_argument("-tw", "--thumbnail_width", help="Width of the thumbnails in pixels.", type=int, default=480)
+    parser.add_argument(
+        "-cs",
+        "--contact_sheet",
+        help="Tile thumbnails into contact sheets of COLUMNSxROWS, e.g. 4x4, instead of writing single thumbnails.",
+        type=contact_sheet_size,
+        default=None,
+    )
+    parser.add_argument("-n", "--workers", help="Threads annotating and writing images.", type=int, default=4)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_qa_arguments()
+    input_path = Path(opt.input_path)
+    output_folder = Path(opt.output_folder)
+    if not input_path.is_file():
+        sys.exit(f"Input video {input_path} does not exist.")
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    # opencv and imageio take a while to import, only pay for them once the arguments are valid
+    import imageio
+    from src.qa import detect_video, load_detections, save_detections, select_frames, summarize, write_review
+
+    start = timer()
+    if opt.detections:
+        frame_detections = load_detections(Path(opt.detections))
+    else:
+        from src.blurrer import VideoBlurrer
+
+        parameters = vars(parse_arguments(["-i", str(input_path), "-o", str(output_folder), "-w", opt.weights]))
+        parameters.update(inference_size=get_inference_size(opt.weights), threshold=opt.threshold, batch_size=opt.batch_size)
+        blurrer = VideoBlurrer(opt.weights, parameters)
+        frame_detections = detect_video(blurrer, input_path, opt.batch_size)
+        save_detections(output_folder / f"{input_path.stem}.json", frame_detections)
+    detection_seconds = timer() - start
+
+    with imageio.get_reader(input_path) as reader:
+        fps = reader.get_meta_data()["fps"]
+    samples = select_frames(frame_detections, max(round(opt.interval * fps), 1), opt.low_confidence, opt.max_gap)
+    start = timer()
+    images = write_review(input_path, output_folder, frame_detections, samples, opt.thumbnail_width, opt.contact_sheet, opt.workers)
+
+    summary = summarize(frame_detections, samples)
+    summary.update(
+        images=[image.name for image in images], detection_seconds=detection_seconds, review_seconds=timer() - start
+    )
+    with open(output_folder / f"{input_path.stem}_review.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Wrote {len(images)} images for {len(samples)} of {summary['frames']} frames to {output_folder}.")
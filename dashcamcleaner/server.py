@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import argparse
+from pathlib import Path
+
+from cli import parse_arguments
+from src.job_server import JobManager, serve
+from src.prometheus import exporter
+from src.weights import get_inference_size
+
+
+def parse_server_arguments():
+    """
+    Argument parser for the job server
+    :return: set of parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Local HTTP service that blurs videos with models kept in memory. Job parameters default to the CLI defaults."
+    )
+    parser.add_argument(
+        "-w", "--weights", help="Weights file to use for all jobs.", type=str, default="720p_medium_mosaic"
+    )
+    parser.add_argument(
+        "-o", "--output_folder", help="Folder for results of jobs without an output_path.", type=str, required=True
+    )
+    parser.add_argument(
+        "-n", "--workers", help="Amount of videos processed at the same time, all workers share the loaded model.", type=int, default=1
+    )
+    parser.add_argument(
+        "-th", "--threads", help="Thread budget shared by all workers, see cli.py --help. 0 keeps the libraries' defaults.", type=int, default=0
+    )
+    parser.add_argument("--host", help="Interface to listen on.", type=str, default="127.0.0.1")
+    parser.add_argument("-p", "--port", help="Port to listen on.", type=int, default=8080)
+    parser.add_argument(
+        "-mp", "--metrics_port", help="Serve Prometheus metrics on this port, 0 disables the endpoint.", type=int, default=0
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_server_arguments()
+    output_folder = Path(opt.output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    # the CLI's parameter dict with all defaults serves as the base for every job
+    default_parameters = vars(parse_arguments(["-i", str(output_folder), "-o", str(output_folder), "-w", opt.weights]))
+    default_parameters["inference_size"] = get_inference_size(opt.weights)
+    default_parameters.update(threads=opt.threads, concurrent_files=opt.workers)
+
+    if opt.metrics_port:
+        exporter.start_server(opt.metrics_port, opt.host)
+    manager = JobManager(opt.weights, default_parameters, output_folder, opt.workers)
+    serve(manager, opt.host, opt.port)
@@ -0,0 +1,450 @@
+import multiprocessing as mp
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Dict, List, Tuple
+
+import cv2
+import imageio
+import numpy as np
+from src.blurrer import VideoBlurrer, apply_blur, blur_helper, copy_audio, get_ffmpeg_exe, recent_detections
+from src.bounds import Bounds
+from src.detection import Detection
+from src.filters import FILTERS
+from src.tiling import box_iou
+
+APP_FOLDER = Path(__file__).resolve().parents[1]
+
+# modules that must not be imported before a detector is actually needed
+HEAVY_MODULES = ["torch", "ultralytics", "cv2", "imageio"]
+
+STARTUP_COMMANDS = {
+    "cli --help": ["cli.py", "--help"],
+    "cli invalid input": ["cli.py", "-i", "does_not_exist.mp4", "-o", "out.mp4"],
+    "import cli": ["-c", "import cli"],
+}
+
+
+def time_command(arguments: List[str], repeats: int) -> List[float]:
+    """
+    Measure the wall time of a fresh Python interpreter running a command
+    :param arguments: arguments to the interpreter
+    :param repeats: amount of measurements
+    :return: wall times in seconds
+    """
+    times = []
+    for _ in range(repeats):
+        start = timer()
+        subprocess.run([sys.executable, *arguments], cwd=APP_FOLDER, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(timer() - start)
+    return times
+
+
+def loaded_heavy_modules(module: str) -> List[str]:
+    """
+    Import a module in a fresh interpreter and check which heavy modules it pulled in
+    :param module: module to import
+    :return: names of imported heavy modules
+    """
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=APP_FOLDER, capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def startup_benchmark(repeats: int = 5) -> Dict:
+    """
+    Measure startup time of the CLI entry points and check that no heavy modules are imported eagerly
+    :param repeats: amount of measurements per command
+    :return: median and maximum wall time per command, eagerly imported heavy modules
+    """
+    report = {"commands": {}, "eager_heavy_imports": loaded_heavy_modules("cli")}
+    for name, arguments in STARTUP_COMMANDS.items():
+        times = time_command(arguments, repeats)
+        report["commands"][name] = {"median": statistics.median(times), "max": max(times)}
+    return report
+
+
+def parse_resolution(resolution: str) -> Tuple[int, int]:
+    """
+    Parse a resolution like 720p or 1920x1080
+    :param resolution: resolution string
+    :return: width and height
+    """
+    if resolution.endswith("p"):
+        height = int(resolution[:-1])
+        return int(height * 16 / 9), height
+    width, height = resolution.lower().split("x")
+    return int(width), int(height)
+
+
+def generate_synthetic_video(path: Path, width: int, height: int, frames: int, fps: float = 30.0) -> None:
+    """
+    Write a video of a slowly panning, smooth noise pattern, which encodes and decodes similar to real footage
+    :param path: output path
+    :param width: frame width
+    :param height: frame height
+    :param frames: amount of frames
+    :param fps: frame rate
+    """
+    rng = np.random.default_rng(0)
+    pattern = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    pattern = cv2.resize(pattern, (width * 2, height), interpolation=cv2.INTER_CUBIC)
+    with imageio.get_writer(path, codec="libx264", fps=fps, quality=8, macro_block_size=None) as writer:
+        for index in range(frames):
+            offset = (index * 4) % width
+            writer.append_data(pattern[:, offset:offset + width])
+
+
+def add_synthetic_audio(ffmpeg_exe: str, video_path: Path, output_path: Path) -> None:
+    """
+    Add a sine tone audio track to a video
+    :param ffmpeg_exe: ffmpeg executable
+    :param video_path: muted video
+    :param output_path: video with audio track
+    """
+    subprocess.run(
+        [ffmpeg_exe, "-y", "-i", video_path, "-f", "lavfi", "-i", "sine=frequency=440", "-c:v", "copy", "-c:a", "aac", "-shortest", output_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def synthetic_detections(width: int, height: int, boxes: int, index: int) -> List[Detection]:
+    """
+    Create moving fake detections, alternating between plates and faces
+    :param width: frame width
+    :param height: frame height
+    :param boxes: amount of detections
+    :param index: frame index, moves the boxes
+    :return: detections
+    """
+    rng = np.random.default_rng(boxes)
+    box_width, box_height = max(width // 20, 2), max(height // 20, 2)
+    detections = []
+    for box in range(boxes):
+        x_min = (int(rng.integers(0, width - box_width)) + index * 2) % (width - box_width)
+        y_min = int(rng.integers(0, height - box_height))
+        kind = "plate" if box % 2 == 0 else "face"
+        detections.append(Detection(Bounds(x_min, y_min, x_min + box_width, y_min + box_height), 0.9, kind))
+    return detections
+
+
+def latency_summary(latencies: List[float], frames: int) -> Dict[str, float]:
+    """
+    Summarize per-frame latencies of a stage
+    :param latencies: per-frame latencies in seconds
+    :param frames: amount of processed frames
+    :return: frames per second and p50/p99 latency in milliseconds
+    """
+    total = sum(latencies)
+    return {
+        "fps": frames / total if total else float("inf"),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else 0.0,
+        "total_s": total,
+    }
+
+
+def run_pipeline(input_path: Path, output_path: Path, parameters: Dict, boxes: int, detector=None) -> Dict:
+    """
+    Run the stages of VideoBlurrer.blur_video one after another on a video and time each of them separately
+    :param input_path: input video
+    :param output_path: output video
+    :param parameters: blurring parameters
+    :param boxes: amount of synthetic detections per frame, unused if a detector is passed
+    :param detector: optional VideoBlurrer whose detector is used instead of synthetic detections
+    :return: per-stage statistics
+    """
+    batch_size = parameters["batch_size"]
+    latencies: Dict[str, List[float]] = {stage: [] for stage in ["decode", "color_conversion", "inference", "apply_blur", "blur_executor", "encode"]}
+    frame_detections = {}
+    frames = 0
+    temp_output = output_path.parent / f"{output_path.stem}_copy{output_path.suffix}"
+
+    with imageio.get_reader(input_path) as reader, ProcessPoolExecutor(parameters["blur_workers"]) as executor:
+        fps = reader.get_meta_data()["fps"]
+        with imageio.get_writer(temp_output, codec="libx264", fps=fps, quality=parameters["quality"], macro_block_size=None) as writer:
+            frame_iterator = iter(reader)
+            while True:
+                batch, conversion_times = [], []
+                for _ in range(batch_size):
+                    start = timer()
+                    frame = next(frame_iterator, None)
+                    if frame is None:
+                        break
+                    latencies["decode"].append(timer() - start)
+                    start = timer()
+                    batch.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    conversion_times.append(timer() - start)
+                if not batch:
+                    break
+
+                start = timer()
+                if detector:
+                    batch_detections = detector.detect_identifiable_information(batch)
+                else:
+                    height, width = batch[0].shape[:2]
+                    batch_detections = [synthetic_detections(width, height, boxes, frames + index) for index in range(len(batch))]
+                latencies["inference"].extend([(timer() - start) / len(batch)] * len(batch))
+                for index, detections in enumerate(batch_detections):
+                    frame_detections[frames + index] = detections
+
+                # only the detections a frame is blurred with are sent to the worker processes, as in blur_video
+                args = [
+                    [frame, frames + index, recent_detections(frame_detections, frames + index, parameters["blur_memory"]), parameters]
+                    for index, frame in enumerate(batch)
+                ]
+
+                # apply_blur in this process, without the executor overhead
+                for arg in args:
+                    start = timer()
+                    apply_blur(*arg)
+                    latencies["apply_blur"].append(timer() - start)
+
+                # the same work through the process pool, as blur_video does it
+                start = timer()
+                blurred_frames = list(executor.map(blur_helper, args))
+                latencies["blur_executor"].extend([(timer() - start) / len(batch)] * len(batch))
+
+                for index, frame_blurred in enumerate(blurred_frames):
+                    start = timer()
+                    frame_blurred_rgb = cv2.cvtColor(frame_blurred, cv2.COLOR_BGR2RGB)
+                    latencies["color_conversion"].append(conversion_times[index] + timer() - start)
+                    start = timer()
+                    writer.append_data(frame_blurred_rgb)
+                    latencies["encode"].append(timer() - start)
+                frames += len(batch)
+
+    stages = {stage: latency_summary(values, frames) for stage, values in latencies.items()}
+    ffmpeg_exe = get_ffmpeg_exe()
+    if ffmpeg_exe:
+        start = timer()
+        copy_audio(ffmpeg_exe, temp_output, input_path, output_path)
+        stages["audio_mux"] = {"total_s": timer() - start}
+    return {"frames": frames, "stages": stages}
+
+
+def pipeline_benchmark(resolutions: List[str], frames: int, box_counts: List[int], parameters: Dict, detector=None) -> Dict:
+    """
+    Benchmark all pipeline stages on synthetic videos
+    :param resolutions: resolutions to benchmark, e.g. ["720p", "1080p"]
+    :param frames: amount of frames per synthetic video
+    :param box_counts: amounts of synthetic detections per frame to benchmark
+    :param parameters: blurring parameters
+    :param detector: optional VideoBlurrer to benchmark real inference instead of synthetic detections
+    :return: report with results per resolution and box count
+    """
+    report = {"frames": frames, "batch_size": parameters["batch_size"], "blur_workers": parameters["blur_workers"], "results": []}
+    ffmpeg_exe = get_ffmpeg_exe()
+    with tempfile.TemporaryDirectory() as temp_folder:
+        for resolution in resolutions:
+            width, height = parse_resolution(resolution)
+            input_path = Path(temp_folder) / f"synthetic_{width}x{height}.mp4"
+            generate_synthetic_video(input_path, width, height, frames)
+            if ffmpeg_exe:
+                muted_path = input_path.with_name(f"muted_{input_path.name}")
+                input_path.rename(muted_path)
+                add_synthetic_audio(ffmpeg_exe, muted_path, input_path)
+            for boxes in box_counts:
+                output_path = Path(temp_folder) / f"blurred_{width}x{height}_{boxes}.mp4"
+                result = run_pipeline(input_path, output_path, parameters, boxes, detector)
+                report["results"].append({"resolution": f"{width}x{height}", "boxes": boxes, **result})
+    return report
+
+
+def filter_benchmark(resolutions: List[str], box_counts: List[int], blur_sizes: List[int], frames: int, parameters: Dict) -> Dict:
+    """
+    Benchmark apply_blur with every obfuscation filter on synthetic frames, without decoding or encoding
+    :param resolutions: resolutions to benchmark, e.g. ["720p", "1080p"]
+    :param box_counts: amounts of synthetic detections per frame to benchmark
+    :param blur_sizes: filter strengths to benchmark
+    :param frames: amount of frames per measurement
+    :param parameters: blurring parameters
+    :return: report with the cost of every filter and its latency per resolution, box count and strength
+    """
+    report = {"frames": frames, "filters": {name: f.cost for name, f in FILTERS.items()}, "results": []}
+    rng = np.random.default_rng(0)
+    for resolution in resolutions:
+        width, height = parse_resolution(resolution)
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for boxes in box_counts:
+            frame_detections = {index: synthetic_detections(width, height, boxes, index) for index in range(frames)}
+            for blur_size in blur_sizes:
+                for name in FILTERS:
+                    filter_parameters = {**parameters, "filter": name, "blur_size": blur_size}
+                    latencies = []
+                    for index in range(frames):
+                        start = timer()
+                        apply_blur(frame, index, frame_detections, filter_parameters)
+                        latencies.append(timer() - start)
+                    report["results"].append(
+                        {
+                            "resolution": f"{width}x{height}",
+                            "boxes": boxes,
+                            "blur_size": blur_size,
+                            "filter": name,
+                            **latency_summary(latencies, frames),
+                        }
+                    )
+    return report
+
+
+def matched_detections(reference: List[Detection], detections: List[Detection], iou_threshold: float = 0.5) -> int:
+    """
+    Count reference detections that were also found, i.e. overlap a detection of the same kind by at least the IoU threshold
+    :param reference: reference detections of a frame
+    :param detections: detections to evaluate
+    :param iou_threshold: minimum IoU of a match
+    :return: amount of matched reference detections
+    """
+    matched = 0
+    for kind in {detection.kind for detection in reference}:
+        boxes = np.array(
+            [[d.bounds.x_min, d.bounds.y_min, d.bounds.x_max, d.bounds.y_max] for d in detections if d.kind == kind], dtype=np.float64
+        )
+        for detection in (d for d in reference if d.kind == kind):
+            box = np.array([detection.bounds.x_min, detection.bounds.y_min, detection.bounds.x_max, detection.bounds.y_max])
+            if len(boxes) and box_iou(boxes, box).max() >= iou_threshold:
+                matched += 1
+    return matched
+
+
+def tile_benchmark(input_path: Path, frames: int, parameters: Dict, blurrer) -> Dict:
+    """
+    Compare the cost and recall of detection on downscaled full frames, on full frames plus tiles of the configured bands
+    and on full frames at their native resolution. Native inference is the expensive reference recall is measured against,
+    since real footage has no ground truth.
+    :param input_path: input video, ideally 4K footage with distant plates
+    :param frames: amount of frames to run detection on
+    :param parameters: blurring parameters with tile_bands, tile_size and tile_overlap
+    :param blurrer: VideoBlurrer providing the detector
+    :return: report with frames per second, detections and recall per mode
+    """
+    with imageio.get_reader(input_path) as reader:
+        frame_buffer = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for _, frame in zip(range(frames), reader)]
+    height, width = frame_buffer[0].shape[:2]
+    modes = {
+        "full": {**parameters, "tile_bands": None},
+        "tiled": parameters,
+        "native": {**parameters, "tile_bands": None, "inference_size": -(-width // 32) * 32},
+    }
+    batch_size = parameters["batch_size"]
+    report = {"resolution": f"{width}x{height}", "frames": len(frame_buffer), "tile_bands": parameters["tile_bands"], "modes": {}}
+    mode_detections = {}
+    for mode, mode_parameters in modes.items():
+        blurrer.parameters = mode_parameters
+        # the first call of a new inference size includes warmup, keep it out of the measurement
+        blurrer.detect_identifiable_information(frame_buffer[:batch_size])
+        latencies, detections = [], []
+        for start in range(0, len(frame_buffer), batch_size):
+            batch = frame_buffer[start:start + batch_size]
+            begin = timer()
+            detections.extend(blurrer.detect_identifiable_information(batch))
+            latencies.extend([(timer() - begin) / len(batch)] * len(batch))
+        mode_detections[mode] = detections
+        report["modes"][mode] = {
+            "inference_size": mode_parameters["inference_size"],
+            "detections": sum(len(frame_detections) for frame_detections in detections),
+            **latency_summary(latencies, len(frame_buffer)),
+        }
+
+    reference = sum(len(frame_detections) for frame_detections in mode_detections["native"])
+    full_seconds = report["modes"]["full"]["total_s"]
+    for mode, detections in mode_detections.items():
+        matched = sum(matched_detections(*pair) for pair in zip(mode_detections["native"], detections))
+        report["modes"][mode]["recall_vs_native"] = matched / reference if reference else None
+        report["modes"][mode]["relative_cost"] = report["modes"][mode]["total_s"] / full_seconds if full_seconds else None
+    return report
+
+
+class SyntheticBlurrer(VideoBlurrer):
+    """
+    VideoBlurrer with synthetic detections instead of a detector, so blur_video can be benchmarked as a whole without weights
+    """
+
+    def __init__(self: "SyntheticBlurrer", parameters: Dict, boxes: int) -> None:
+        """
+        Constructor
+        :param parameters: blurring parameters
+        :param boxes: amount of synthetic detections per frame
+        """
+        self.boxes = boxes
+        self.detected_frames = 0
+        super().__init__(None, parameters)
+
+    def load_detector(self: "SyntheticBlurrer", weights_name: str) -> Tuple[object, threading.Lock]:
+        return None, threading.Lock()
+
+    def detect_identifiable_information(self: "SyntheticBlurrer", images: list, threshold: float = None) -> List[List[Detection]]:
+        height, width = images[0].shape[:2]
+        detections = [synthetic_detections(width, height, self.boxes, self.detected_frames + index) for index in range(len(images))]
+        self.detected_frames += len(images)
+        return detections
+
+
+def time_blur_video(parameters: Dict, boxes: int, weights: str = None) -> Dict:
+    """
+    Blur a video with VideoBlurrer.blur_video and time it, meant to run in a fresh process so thread settings start out as
+    the libraries' defaults
+    :param parameters: blurring parameters
+    :param boxes: amount of synthetic detections per frame without weights
+    :param weights: weights for real inference, synthetic detections if None
+    :return: elapsed time, frames per second and the thread allocation in effect
+    """
+    if weights:
+        blurrer = VideoBlurrer(weights, parameters)
+    else:
+        blurrer = SyntheticBlurrer(parameters, boxes)
+    start = timer()
+    try:
+        frames = blurrer.blur_video()
+    finally:
+        blurrer.close()
+    elapsed = timer() - start
+    return {"seconds": elapsed, "fps": frames / elapsed, "threads": blurrer.metrics.threads}
+
+
+def thread_benchmark(resolution: str, frames: int, boxes: int, budgets: List[int], parameters: Dict, weights: str = None) -> Dict:
+    """
+    Compare blur_video with the libraries' default threads to thread budgets, each run in a fresh process
+    :param resolution: resolution of the synthetic video, e.g. "1080p"
+    :param frames: amount of frames of the synthetic video
+    :param boxes: amount of synthetic detections per frame, unused with weights
+    :param budgets: thread budgets to compare
+    :param parameters: blurring parameters
+    :param weights: weights for real inference, synthetic detections if None
+    :return: report with seconds, frames per second, the thread allocation and the speedup over the defaults per run
+    """
+    width, height = parse_resolution(resolution)
+    report = {
+        "resolution": f"{width}x{height}",
+        "frames": frames,
+        "boxes": None if weights else boxes,
+        "batch_size": parameters["batch_size"],
+        "blur_workers": parameters["blur_workers"],
+        "cpu_count": os.cpu_count(),
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as temp_folder:
+        input_path = Path(temp_folder) / f"synthetic_{width}x{height}.mp4"
+        generate_synthetic_video(input_path, width, height, frames)
+        for threads in [0, *budgets]:
+            run_parameters = {
+                **parameters,
+                "input_path": str(input_path),
+                "output_path": str(Path(temp_folder) / f"blurred_{threads}.mp4"),
+                "threads": threads,
+            }
+            with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as executor:
+                result = executor.submit(time_blur_video, run_parameters, boxes, weights).result()
+            report["results"].append({"budget": threads or "default", **result})
+    default_seconds = report["results"][0]["seconds"]
+    for result in report["results"]:
+        result["speedup"] = default_seconds / result["seconds"]
+    return report
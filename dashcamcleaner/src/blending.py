@@ -0,0 +1,209 @@
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+import cv2
+import numpy as np
+from src.bounds import Bounds
+from src.detection import Detection
+
+
+def draw_shape(mask: np.ndarray, kind: str, bounds: Bounds, color: int = 255) -> None:
+    """
+    Draw the filled shape of a detection into a single channel mask, rectangles for plates and ellipses for faces
+    :param mask: uint8 mask to draw into
+    :param kind: detection kind
+    :param bounds: bounds in mask coordinates
+    :param color: value of the drawn pixels
+    """
+    if kind == "plate":
+        cv2.rectangle(mask, bounds.pt1(), bounds.pt2(), color=color, thickness=-1)
+    elif kind == "face":
+        center, axes = bounds.ellipse_coordinates()
+        cv2.ellipse(mask, center, axes, 0, 0, 360, color=color, thickness=-1)
+    else:
+        raise ValueError(f"Detection kind not supported: {kind}")
+
+
+def render_mask(shape: Tuple[int, ...], detections: List[Detection], feather: int, colored: bool) -> np.ndarray:
+    """
+    Render detections into a mask without touching the frame's pixels
+    :param shape: frame shape
+    :param detections: detections with bounds already expanded by feather
+    :param feather: feathering kernel size, only applied to colored masks
+    :param colored: whether to render a confidence-weighted mask per kind instead of a black and white one
+    :return: single channel uint8 mask, or a two channel uint8 mask (faces, plates) with the score as value if colored
+    """
+    if not colored:
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        for detection in detections:
+            draw_shape(mask, detection.kind, detection.bounds)
+        return mask
+
+    channels = {"face": np.zeros(shape[:2], dtype=np.uint8), "plate": np.zeros(shape[:2], dtype=np.uint8)}
+    # draw in ascending order of confidence, so overlapping detections keep the highest score
+    for detection in sorted(detections, key=lambda detection: detection.score):
+        draw_shape(channels[detection.kind], detection.kind, detection.bounds, round(detection.score * 255))
+    mask = np.dstack([channels["face"], channels["plate"]])
+    if feather > 0 and detections:
+        mask = cv2.blur(mask, (feather, feather))
+    return mask
+
+
+def mask_to_rgb(mask: np.ndarray) -> np.ndarray:
+    """
+    Convert a rendered mask to a frame for the video writer, black and white masks stay single channel
+    :param mask: mask from render_mask
+    :return: single channel mask or RGB frame with faces in red and plates in green
+    """
+    if mask.ndim == 2:
+        return mask
+    rgb = np.zeros((*mask.shape[:2], 3), dtype=np.uint8)
+    rgb[:, :, :2] = mask
+    return rgb
+
+
+@lru_cache(maxsize=512)
+def feathered_shape(kind: str, width: int, height: int, feather: int) -> np.ndarray:
+    """
+    Alpha mask of a single, unclipped shape including its feathered border.
+    Shapes only depend on their size, so masks are cached and reused for every box of the same size.
+    :param kind: detection kind
+    :param width: width of the (already expanded) bounds
+    :param height: height of the (already expanded) bounds
+    :param feather: feathering kernel size, also the padding around the shape
+    :return: read-only uint8 mask of shape (height + 2 * feather + 1, width + 2 * feather + 1)
+    """
+    mask = np.zeros((height + 2 * feather + 1, width + 2 * feather + 1), dtype=np.uint8)
+    draw_shape(mask, kind, Bounds(feather, feather, feather + width, feather + height))
+    if feather > 0:
+        mask = cv2.blur(mask, (feather, feather))
+    mask.flags.writeable = False
+    return mask
+
+
+def mask_regions(shape: Tuple[int, ...], detections: List[Detection], feather: int) -> List[Tuple[Bounds, List[Detection]]]:
+    """
+    Group detections into disjoint regions that contain their shapes plus the feathered border.
+    Detections whose regions overlap are merged, so every region can be feathered and blended independently.
+    :param shape: frame shape
+    :param detections: detections with bounds already expanded by feather
+    :param feather: feathering kernel size
+    :return: list of region bounds (exclusive max) and the detections inside them
+    """
+    frame_height, frame_width = shape[:2]
+    regions = []
+    for detection in detections:
+        bounds = detection.bounds
+        region = Bounds(
+            max(bounds.x_min - feather, 0),
+            max(bounds.y_min - feather, 0),
+            min(bounds.x_max + feather + 1, frame_width),
+            min(bounds.y_max + feather + 1, frame_height),
+        )
+        members = [detection]
+        # merge with all existing regions that overlap, until none overlaps anymore
+        merged = True
+        while merged:
+            merged = False
+            for other in regions:
+                other_region, other_members = other
+                if overlaps(region, other_region):
+                    region = Bounds(
+                        min(region.x_min, other_region.x_min),
+                        min(region.y_min, other_region.y_min),
+                        max(region.x_max, other_region.x_max),
+                        max(region.y_max, other_region.y_max),
+                    )
+                    members += other_members
+                    regions.remove(other)
+                    merged = True
+                    break
+        regions.append((region, members))
+    return regions
+
+
+def overlaps(a: Bounds, b: Bounds) -> bool:
+    """
+    Check whether two boxes with exclusive max coordinates overlap
+    """
+    return a.x_min < b.x_max and b.x_min < a.x_max and a.y_min < b.y_max and b.y_min < a.y_max
+
+
+def region_alpha(shape: Tuple[int, ...], region: Bounds, detections: List[Detection], feather: int) -> np.ndarray:
+    """
+    Feathered uint8 alpha mask for a region, identical to feathering a mask of the whole frame and cropping it
+    :param shape: frame shape
+    :param region: region bounds (exclusive max)
+    :param detections: detections inside the region, bounds already expanded by feather
+    :param feather: feathering kernel size
+    :return: uint8 alpha mask of the region's size
+    """
+    frame_height, frame_width = shape[:2]
+    if len(detections) == 1:
+        bounds = detections[0].bounds
+        inside_frame = bounds.x_min - feather >= 0 and bounds.y_min - feather >= 0
+        inside_frame &= bounds.x_max + feather + 1 <= frame_width and bounds.y_max + feather + 1 <= frame_height
+        if inside_frame:
+            return feathered_shape(detections[0].kind, bounds.x_max - bounds.x_min, bounds.y_max - bounds.y_min, feather)
+
+    mask = np.zeros((region.y_max - region.y_min, region.x_max - region.x_min), dtype=np.uint8)
+    for detection in detections:
+        bounds = detection.bounds
+        local_bounds = Bounds(
+            bounds.x_min - region.x_min, bounds.y_min - region.y_min, bounds.x_max - region.x_min, bounds.y_max - region.y_min
+        )
+        draw_shape(mask, detection.kind, local_bounds)
+    if feather > 0:
+        mask = cv2.blur(mask, (feather, feather))
+    return mask
+
+
+def blend(roi: np.ndarray, obfuscated: np.ndarray, alpha: np.ndarray) -> None:
+    """
+    Fixed-point alpha blending in place: roi = (roi * (255 - alpha) + obfuscated * alpha) / 255
+    :param roi: uint8 image region, modified in place
+    :param obfuscated: uint8 obfuscated image region of the same size
+    :param alpha: single channel uint8 alpha mask of the same size
+    """
+    weight = alpha.astype(np.uint16)[:, :, np.newaxis]
+    mixed = roi * (255 - weight) + obfuscated * weight
+    # exact integer division by 255 with rounding, see Blinn, "Three Wrongs Make a Right"
+    mixed += 128
+    mixed += mixed >> 8
+    roi[:] = mixed >> 8
+
+
+def obfuscate_regions(
+    frame: np.ndarray,
+    detections: List[Detection],
+    feather: int,
+    obfuscate: Callable[[np.ndarray], np.ndarray],
+    margin: int,
+) -> np.ndarray:
+    """
+    Obfuscate and blend only the regions around detections instead of the whole frame
+    :param frame: input image, not modified
+    :param detections: detections with bounds already expanded by feather
+    :param feather: feathering kernel size
+    :param obfuscate: filter applied to an image crop, e.g. a box blur
+    :param margin: amount of context pixels the filter needs around a region to match filtering the whole frame
+    :return: processed image
+    """
+    frame_height, frame_width = frame.shape[:2]
+    result = frame.copy()
+    for region, members in mask_regions(frame.shape, detections, feather):
+        alpha = region_alpha(frame.shape, region, members, feather)
+        # filter a crop with enough context so the region's pixels match filtering the whole frame
+        crop = Bounds(
+            max(region.x_min - margin, 0),
+            max(region.y_min - margin, 0),
+            min(region.x_max + margin, frame_width),
+            min(region.y_max + margin, frame_height),
+        )
+        obfuscated = obfuscate(frame[crop.coords_as_slices()])
+        inner = (
+            slice(region.y_min - crop.y_min, region.y_max - crop.y_min),
+            slice(region.x_min - crop.x_min, region.x_max - crop.x_min),
+        )
+        blend(result[region.coords_as_slices()], obfuscated[inner], alpha)
+    return result
@@ -1,21 +1,31 @@
+import json
 import multiprocessing as mp
 import os
 import subprocess
+import threading
 from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from pathlib import Path
 from shutil import which
-from typing import Dict, List, Tuple, Union
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
 
 import cv2
 import imageio
-import json
-import numpy as np
-import torch
-from more_itertools import chunked
+from src.blending import mask_to_rgb, obfuscate_regions, render_mask
 from src.bounds import Bounds
 from src.detection import Detection
+from src.filters import get_filter
+from src.gating import DEFAULT_REFRESH_INTERVAL, MotionGate
+from src.merging import merge_detections
+from src.metrics import RunMetrics, json_lines_writer
+from src.model_registry import registry
+from src.profiles import load_profile
+from src.prometheus import exporter
+from src.threads import allocate_threads, apply_thread_budget, effective_threads, set_opencv_threads
+from src.tiling import detect_tiles
 from tqdm import tqdm
-from ultralytics import YOLO
 
 
 class VideoBlurrer:
@@ -29,19 +39,102 @@ class VideoBlurrer:
         :param parameters: all relevant paremeters for the blurring process
         """
         self.parameters = parameters
-        weights_path = Path(__file__).resolve().parents[1] / "weights" / f"{weights_name}.pt".replace(".pt.pt", ".pt")
-        self.detector = setup_detector(weights_path)
+        self.detector, self.detector_lock = self.load_detector(weights_name)
+        self.blur_executor = None
+        self.blur_executor_workers = 0
+        self.blur_executor_threads = None
+        self.metrics = None
+        # optional InferenceService shared with other blurrers, which batches frames of all their videos together
+        self.inference_service = None
         print("Worker created")
 
-    def detect_identifiable_information(self: "VideoBlurrer", images: list) -> List[List[Detection]]:
+    def load_detector(self: "VideoBlurrer", weights_name: str) -> Tuple[object, threading.Lock]:
+        """
+        Get the detector, shared with other blurrers using the same weights through the model registry
+        :param weights_name: file name of the weights to be used
+        :return: detector and the lock that has to be held while running inference with it
+        """
+        return registry.get_detector(weights_name, self.parameters["inference_size"])
+
+    def get_blur_executor(self: "VideoBlurrer", blur_workers: int, threads: int = None) -> ProcessPoolExecutor:
+        """
+        Get a process pool for blurring, reusing the pool of previous videos if possible
+        :param blur_workers: amount of processes in the pool
+        :param threads: optional limit of OpenCV's threads in every process, None keeps OpenCV's default of one per core
+        :return: process pool
+        """
+        if self.blur_executor is None or self.blur_executor_workers != blur_workers or self.blur_executor_threads != threads:
+            self.close()
+            if threads is None:
+                self.blur_executor = ProcessPoolExecutor(blur_workers)
+            else:
+                self.blur_executor = ProcessPoolExecutor(blur_workers, initializer=set_opencv_threads, initargs=(threads,))
+            self.blur_executor_workers = blur_workers
+            self.blur_executor_threads = threads
+        return self.blur_executor
+
+    def close(self: "VideoBlurrer") -> None:
+        """
+        Shut down the blurring process pool, waiting for its processes to exit
+        """
+        if self.blur_executor is not None:
+            self.blur_executor.shutdown()
+            self.blur_executor = None
+            self.blur_executor_workers = 0
+            self.blur_executor_threads = None
+
+    def get_detect_function(self: "VideoBlurrer") -> Callable[[list], List[List[Detection]]]:
+        """
+        Detection function for the frames of a video, through the shared inference service if there is one
+        :return: function running detection on a list of frames
+        """
+        if self.inference_service is None:
+            return self.detect_identifiable_information
+        return partial(self.inference_service.detect, self)
+
+    def detect_identifiable_information(self: "VideoBlurrer", images: list, threshold: float = None) -> List[List[Detection]]:
         """
         Run plate and face detection on an input image
         :param images: input images
+        :param threshold: optional detection threshold overriding the one of self.parameters
         :return: detected faces and plates
         """
         scale = self.parameters["inference_size"]
-        threshold = self.parameters["threshold"]
-        results_list = self.detector(images, imgsz=[scale], conf=threshold)
+        threshold = self.parameters["threshold"] if threshold is None else threshold
+        if not images:
+            return []
+        profile = load_profile(self.parameters["profile"]) if self.parameters.get("profile") else None
+        frame_shape = images[0].shape
+        offset = Bounds(0, 0, 0, 0)
+        if profile:
+            # run detection on the camera's region of interest only and move the boxes back into frame coordinates
+            scale = profile.inference_size(frame_shape, scale)
+            images, offset = profile.crop_images(images)
+        frame_detections = self.run_detector(images, scale, threshold)
+        if self.parameters.get("tile_bands"):
+            frame_detections = detect_tiles(self.run_detector, images, frame_detections, self.parameters, threshold)
+        if profile:
+            frame_detections = [
+                profile.filter_detections([detection.get_shifted(offset.x_min, offset.y_min) for detection in detections], frame_shape)
+                for detections in frame_detections
+            ]
+        return frame_detections
+
+    def run_detector(self: "VideoBlurrer", images: list, inference_size: int, threshold: float) -> List[List[Detection]]:
+        """
+        Run the detector on images of the same size
+        :param images: input images
+        :param inference_size: inference size of the detector
+        :param threshold: detection threshold
+        :return: detected faces and plates in image coordinates
+        """
+        with self.detector_lock:
+            start = timer()
+            results_list = self.detector(images, imgsz=[inference_size], conf=threshold)
+            detector_seconds = timer() - start
+        if self.metrics is not None:
+            # the inference stage also covers frames the motion gate skipped and waiting for a shared inference service
+            self.metrics.add_stage_time("detector", detector_seconds)
         return [
             [
                 Detection(
@@ -54,114 +147,230 @@ class VideoBlurrer:
             for result in results_list
         ]
 
-    def blur_video(self):
+    def blur_video(
+        self,
+        progress_callback: Callable[[int, int], None] = None,
+        status_callback: Callable[[str], None] = None,
+        abort_callback: Callable[[], bool] = None,
+        alert_callback: Callable[[str], None] = print,
+    ) -> int:
         """
-        Write a copy of the input video stripped of identifiable information, i.e. faces and license plates
+        Write a copy of the input video stripped of identifiable information, i.e. faces and license plates.
+        This is the single processing loop shared by the CLI, the GUI and the servers, front ends only differ in their callbacks.
+        :param progress_callback: optional function called with the amount of processed frames and the total frame count, once before the first batch and after every batch
+        :param status_callback: optional function called with a short description of the current step
+        :param abort_callback: optional function checked after every decoded frame, after inference and after every blurred frame.
+                               Processing stops without writing the output if it returns True, at the latest after one inference call and
+                               the frames the blur workers are busy with. The temporary output is removed.
+        :param alert_callback: function called with problems the user should know about
+        :return: amount of processed frames, detailed metrics of the run are stored in self.metrics
         """
+
+        def set_status(message: str) -> None:
+            if status_callback:
+                status_callback(message)
+
+        def abort_requested() -> bool:
+            return abort_callback is not None and abort_callback()
+
         # gather inputs from self.parameters
         input_path = self.parameters["input_path"]
         output_file = Path(self.parameters["output_path"])
         temp_output = output_file.parent / f"{output_file.stem}_copy{output_file.suffix}"
         output_path = self.parameters["output_path"]
-        quality = self.parameters["quality"]
+        mask_export = self.parameters["export_mask"] or self.parameters["export_colored_mask"]
         batch_size = self.parameters["batch_size"]
+        blur_memory = self.parameters["blur_memory"]
         blur_workers = min(self.parameters["blur_workers"], mp.cpu_count(), batch_size)
 
         # prepare detection cache
         frame_detections = {}
+        detect = self.get_detect_function()
+
+        # optionally skip inference on frames without motion
+        motion_threshold = self.parameters.get("motion_threshold", 0)
+        gate = MotionGate(motion_threshold, self.parameters.get("refresh_interval", DEFAULT_REFRESH_INTERVAL)) if motion_threshold else None
+
+        # optionally merge detections into fewer blur regions
+        merge_distance = self.parameters.get("merge_distance")
+        max_regions = self.parameters.get("max_regions", 0)
 
-        # customize detector
-        self.detector.conf = self.parameters["threshold"]
+        # prepare metrics, optionally streamed as JSON lines while processing
+        metrics_interval = self.parameters.get("metrics_interval", 0)
+        event_callback = json_lines_writer(Path(output_path).with_suffix(".metrics.jsonl")) if metrics_interval else None
+        metrics = RunMetrics(blur_workers, event_callback, metrics_interval, observers=[exporter])
+        self.metrics = metrics
+
+        # optionally split a thread budget across detector, blur workers, encoder and decoder instead of one thread per core each
+        threads = self.parameters.get("threads", 0)
+        allocation = allocate_threads(threads, blur_workers, self.parameters.get("concurrent_files", 1)) if threads else None
+        if allocation:
+            apply_thread_budget(allocation)
 
         # open video file
-        with imageio.get_reader(input_path) as reader:
-
-            # get the height and width of each frame for future debug outputs on frame
-            meta = reader.get_meta_data()
-            fps = meta["fps"]
-            duration = meta["duration"]
-            length = int(duration * fps)
-            audio_present = "audio_codec" in meta
-            blur_executor = ProcessPoolExecutor(blur_workers)
-
-            # save the video to a file
-            with imageio.get_writer(
-                temp_output, codec="libx264", fps=fps, quality=quality, macro_block_size=None
-            ) as writer:
-
-                with tqdm(total=length, desc="Processing video", unit="frames", dynamic_ncols=True) as progress_bar:
-                    for batch_index, frame_batch in enumerate(chunked(reader, batch_size)):
-                        frame_buffer = [cv2.cvtColor(frame_read, cv2.COLOR_BGR2RGB) for frame_read in frame_batch]
-                        for index, detection in enumerate(self.detect_identifiable_information(frame_buffer)):
-                            frame_detections[batch_size * batch_index + index] = detection
-                        args = [
-                            [frame, global_index, frame_detections, self.parameters]
-                            for frame, global_index in zip(frame_buffer, [batch_size * batch_index + x for x in range(batch_size)])
-                        ]
-                        for frame_blurred in blur_executor.map(blur_helper, args):
-                            frame_blurred_rgb = cv2.cvtColor(frame_blurred, cv2.COLOR_BGR2RGB)
-                            writer.append_data(frame_blurred_rgb)
-                        progress_bar.update(len(frame_batch))
+        aborted = False
+        blur_futures = []
+        try:
+            inference_client = self.inference_service.client() if self.inference_service else nullcontext()
+            reader_options = {"input_params": ["-threads", str(allocation["decoder"])]} if allocation else {}
+            with imageio.get_reader(input_path, **reader_options) as reader, inference_client:
+
+                # get the height and width of each frame for future debug outputs on frame
+                meta = reader.get_meta_data()
+                fps = meta["fps"]
+                duration = meta["duration"]
+                length = int(duration * fps)
+                audio_present = "audio_codec" in meta
+                blur_executor = self.get_blur_executor(blur_workers, allocation["blur_threads_per_worker"] if allocation else None)
+                metrics.threads = {"allocation": allocation, "effective": effective_threads(blur_executor)}
+                processed_frames = 0
+                if progress_callback:
+                    progress_callback(processed_frames, length)
+
+                # save the video to a file
+                with imageio.get_writer(
+                    temp_output, fps=fps, **get_writer_options(self.parameters, allocation["encoder"] if allocation else None)
+                ) as writer:
+
+                    with tqdm(total=length, desc="Processing video", unit="frames", dynamic_ncols=True) as progress_bar:
+                        set_status("Getting frames...")
+                        for frame_batch in metrics.timed_iterator("decode", abortable_chunks(reader, batch_size, abort_requested)):
+                            if abort_requested():
+                                aborted = True
+                                break
+
+                            metrics.record_queue("frame_batch", len(frame_batch))
+                            with metrics.stage("color_conversion"):
+                                frame_buffer = [cv2.cvtColor(frame_read, cv2.COLOR_BGR2RGB) for frame_read in frame_batch]
+                            set_status("Getting detections...")
+                            with metrics.stage("inference"):
+                                if gate:
+                                    skipped = gate.skipped_frames
+                                    previous = frame_detections.get(processed_frames - 1, [])
+                                    batch_detections = gate.detect(detect, frame_buffer, previous)
+                                    skipped = gate.skipped_frames - skipped
+                                else:
+                                    batch_detections = detect(frame_buffer)
+                                    skipped = 0
+                            metrics.record_inferences(len(frame_buffer) - skipped, skipped)
+                            detection_counts = [len(detections) for detections in batch_detections]
+                            if merge_distance is not None or max_regions:
+                                with metrics.stage("merge"):
+                                    batch_detections = [
+                                        merge_detections(detections, frame_buffer[0].shape, merge_distance, max_regions)
+                                        for detections in batch_detections
+                                    ]
+                            if abort_requested():
+                                aborted = True
+                                break
+                            for index, detection in enumerate(batch_detections):
+                                frame_detections[processed_frames + index] = detection
+                            set_status("Blurring and writing frames...")
+                            # only send the detections a frame is blurred with to the worker processes, not the whole cache
+                            args = [
+                                [frame, global_index, recent_detections(frame_detections, global_index, blur_memory), self.parameters]
+                                for global_index, frame in enumerate(frame_buffer, processed_frames)
+                            ]
+                            if mask_export:
+                                # masks are cheaper to render than to send to the blur workers and back
+                                blur_futures = []
+                                blurred_frames = map(timed_blur_helper, args)
+                            else:
+                                blur_futures = [blur_executor.submit(timed_blur_helper, arg) for arg in args]
+                                blurred_frames = (future.result() for future in blur_futures)
+                            for written, (frame_blurred, busy_seconds) in enumerate(metrics.timed_iterator("blur", blurred_frames)):
+                                if abort_requested():
+                                    # frames that are already being blurred finish, all others are dropped
+                                    for future in blur_futures:
+                                        future.cancel()
+                                    aborted = True
+                                    break
+                                metrics.record_blur(busy_seconds)
+                                # frames are written in order, blurred frames after this one wait for the encoder
+                                metrics.record_queue("encoder_backlog", sum(future.done() for future in blur_futures[written + 1:]))
+                                with metrics.stage("color_conversion"):
+                                    frame_blurred_rgb = mask_to_rgb(frame_blurred) if mask_export else cv2.cvtColor(frame_blurred, cv2.COLOR_BGR2RGB)
+                                with metrics.stage("encode"):
+                                    writer.append_data(frame_blurred_rgb)
+                            if aborted:
+                                break
+                            metrics.record_frames(detection_counts, [len(detections) for detections in batch_detections])
+                            progress_bar.update(len(frame_batch))
+                            processed_frames += len(frame_batch)
+                            if progress_callback:
+                                progress_callback(processed_frames, length)
+                            set_status("Getting frames...")
+                    if aborted:
+                        kill_ffmpeg(writer)
+                if aborted:
+                    kill_ffmpeg(reader)
+        except BaseException:
+            # e.g. a decoding error or Ctrl+C, the pool may still be busy with frames of this video
+            for future in blur_futures:
+                future.cancel()
+            self.close()
+            remove_file(temp_output, alert_callback)
+            raise
+
+        if aborted:
+            set_status("Aborted")
+            remove_file(temp_output, alert_callback)
+            return processed_frames
 
         # write out detections in yolo format
-        if self.parameters["export_json"]:
-            with open(Path(output_path).with_suffix(".json"), "w") as f:
+        if self.parameters.get("export_json", False):
+            set_status("Writing detections...")
+            with metrics.stage("export_json"), open(Path(output_path).with_suffix(".json"), "w") as f:
                 json.dump(frame_detections, f, default=vars, indent=2)
 
         # copy over audio stream from original video to edited video
-        if is_installed("ffmpeg"):
-            ffmpeg_exe = "ffmpeg"
-        else:
-            ffmpeg_exe = os.getenv("FFMPEG_BINARY")
-            if not ffmpeg_exe:
-                print(
-                    "FFMPEG could not be found! Please make sure the ffmpeg.exe is available under the environment variable 'FFMPEG_BINARY'."
-                )
-                return
-
-        if audio_present:
-            subprocess.run(
-                [
-                    ffmpeg_exe,
-                    "-y",
-                    "-i",
-                    temp_output,
-                    "-i",
-                    input_path,
-                    "-c",
-                    "copy",
-                    "-map",
-                    "0:0",
-                    "-map",
-                    "1:1",
-                    "-shortest",
-                    output_path,
-                ],
-                stdout=subprocess.DEVNULL,
+        ffmpeg_exe = get_ffmpeg_exe() if audio_present else None
+        if audio_present and not ffmpeg_exe:
+            alert_callback(
+                "FFMPEG could not be found! Please make sure the ffmpeg.exe is available under the environment variable 'FFMPEG_BINARY'. The video was written without audio."
             )
+        if ffmpeg_exe:
+            set_status("Copying audio...")
+            with metrics.stage("audio_mux"):
+                copy_audio(ffmpeg_exe, temp_output, input_path, output_path)
             # delete temporary output that had no audio track
-            try:
-                os.remove(temp_output)
-            except Exception as e:
-                self.alert.emit(
-                    f"Could not delete temporary, muted video. Maybe another process (like a cloud storage service or antivirus) is using it already.\n{str(e)}"
-                )
+            remove_file(temp_output, alert_callback)
         else:
-            os.rename(temp_output, output_path)
+            os.replace(temp_output, output_path)
+        self.write_metrics(metrics, output_path)
+        return processed_frames
+
+    def write_metrics(self: "VideoBlurrer", metrics: RunMetrics, output_path: Union[str, Path]) -> None:
+        """
+        Write the metrics of a run next to the output video if requested
+        :param metrics: metrics of the run
+        :param output_path: path of the output video
+        """
+        if self.parameters.get("export_metrics", False):
+            metrics.write(Path(output_path).with_suffix(".metrics.json"))
 
 
-def setup_detector(weights_path: str):
+def get_writer_options(parameters: Dict, threads: int = None) -> Dict:
     """
-    Load YOLOv8 detector and update the detector with this repo's weights
-    :param weights_path: path to .pt file with this repo's weights
-    :return: initialized yolov8 detector
+    Encoder options for imageio's writer. Mask exports skip most of x264's analysis and keep their channels unsubsampled,
+    with a quality of 10 they are encoded losslessly.
+    :param parameters: blurring parameters
+    :param threads: optional limit of the encoder's threads, None lets x264 choose
+    :return: keyword arguments for imageio.get_writer
     """
-    model = YOLO(weights_path)
-    if torch.cuda.is_available():
-        print(f"Using {torch.cuda.get_device_name(torch.cuda.current_device())}.")
-    else:
-        print("Using CPU.")
-    return model
+    options = {"codec": "libx264", "quality": parameters["quality"], "macro_block_size": None}
+    if parameters["export_mask"] or parameters["export_colored_mask"]:
+        # same crf imageio derives from the quality for libx264, which it does not do for libx264rgb
+        crf = int((1 - parameters["quality"] / 10) * 51)
+        options.update(quality=None, ffmpeg_params=["-preset", "ultrafast", "-crf", str(crf)])
+        if parameters["export_mask"]:
+            options.update(pixelformat="gray")
+        else:
+            # encode RGB directly, a conversion to YUV would not be lossless
+            options.update(codec="libx264rgb", pixelformat="rgb24")
+    if threads:
+        options["ffmpeg_params"] = [*options.get("ffmpeg_params", []), "-threads", str(threads)]
+    return options
 
 
 def is_installed(name):
@@ -171,6 +380,113 @@ def is_installed(name):
     return which(name) is not None
 
 
+def get_ffmpeg_exe() -> Union[str, None]:
+    """
+    Find the ffmpeg executable, either on the PATH or via the environment variable FFMPEG_BINARY
+    :return: ffmpeg executable or None if it is not available
+    """
+    if is_installed("ffmpeg"):
+        return "ffmpeg"
+    return os.getenv("FFMPEG_BINARY")
+
+
+def copy_audio(ffmpeg_exe: str, video_path: Union[str, Path], audio_source: Union[str, Path], output_path: Union[str, Path]) -> None:
+    """
+    Combine the video stream of one file with the audio stream of another one without re-encoding
+    :param ffmpeg_exe: ffmpeg executable
+    :param video_path: file with the edited, muted video stream
+    :param audio_source: original file with the audio stream
+    :param output_path: combined output file
+    """
+    subprocess.run(
+        [
+            ffmpeg_exe,
+            "-y",
+            "-i",
+            video_path,
+            "-i",
+            audio_source,
+            "-c",
+            "copy",
+            "-map",
+            "0:0",
+            "-map",
+            "1:1",
+            "-shortest",
+            output_path,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def abortable_chunks(frames: Iterable, size: int, abort_requested: Callable[[], bool]) -> Iterator[list]:
+    """
+    Like more_itertools.chunked, but stops decoding as soon as an abort is requested instead of filling the batch first
+    :param frames: frame iterator, e.g. an imageio reader
+    :param size: batch size
+    :param abort_requested: function returning True once processing should stop
+    :return: iterator of frame batches, the last one possibly shorter
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == size or abort_requested():
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class FfmpegAborted(BaseException):
+    """
+    Thrown into imageio's ffmpeg generators, which kill ffmpeg on a BaseException instead of waiting for it to finish
+    """
+
+
+def kill_ffmpeg(plugin) -> None:
+    """
+    Stop the ffmpeg process of an imageio reader or writer right away, for outputs that are deleted anyway.
+    Closing a writer normally encodes the dozens of frames x264 holds back for its lookahead, which can take several seconds,
+    closing a reader waits up to 1.5 seconds for ffmpeg to notice.
+    :param plugin: reader or writer of imageio's ffmpeg plugin
+    """
+    for name in ["_read_gen", "_write_gen"]:
+        generator = getattr(plugin, name, None)
+        if generator is None:
+            continue
+        try:
+            generator.throw(FfmpegAborted())
+        except (FfmpegAborted, StopIteration):
+            pass
+        setattr(plugin, name, None)
+
+
+def remove_file(path: Path, alert_callback: Callable[[str], None] = print) -> None:
+    """
+    Delete a temporary file if it exists
+    :param path: file to delete
+    :param alert_callback: function called with the reason if it cannot be deleted
+    """
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception as e:
+        alert_callback(
+            f"Could not delete temporary video {path}. Maybe another process (like a cloud storage service or antivirus) is using it already.\n{str(e)}"
+        )
+
+
+def recent_detections(frame_detections: Dict[int, List[Detection]], index: int, blur_memory: int) -> Dict[int, List[Detection]]:
+    """
+    Select the detections apply_blur uses for a frame, i.e. those of the frame itself and of the blur_memory frames before it
+    :param frame_detections: detections of all processed frames
+    :param index: global frame index
+    :param blur_memory: amount of previous frames whose detections are blurred as well
+    :return: detections per frame index
+    """
+    return {i: frame_detections[i] for i in range(index - blur_memory, index + 1) if i in frame_detections}
+
+
 def blur_helper(args: Tuple[cv2.Mat, List[Detection], Dict]):
     """
     Free helper function with a single parameter that can be called in a ProcessPoolExecutor
@@ -182,16 +498,28 @@ def blur_helper(args: Tuple[cv2.Mat, List[Detection], Dict]):
     return apply_blur(frame, index, detections_dict, parameters)
 
 
+def timed_blur_helper(args: Tuple[cv2.Mat, List[Detection], Dict]) -> Tuple[cv2.Mat, float]:
+    """
+    Like blur_helper, but also measures the time the worker process spent on the frame
+    :param args: List of apply_blur parameters
+    :return: Blurred frame and elapsed seconds
+    """
+    start = timer()
+    frame = blur_helper(args)
+    return frame, timer() - start
+
+
 def apply_blur(frame: cv2.Mat, index: int, detection_dict: Dict, parameters: Dict):
     """
     Apply blur to regions of interests
     :param frame: input image
     :param index: global frame index for this frame
     :param detection_dict: dictionary with all processed (up to the current batch) detections
-    :return: processed image
+    :return: processed image, or the rendered mask if a mask export is requested
     """
     # gather inputs from self.parameters
-    blur_size = parameters["blur_size"] * 2 + 1  # must be odd
+    strength = parameters["blur_size"]
+    obfuscation_filter = get_filter(parameters.get("filter", "box"))
     roi_multi = parameters["roi_multi"]
     no_faces = parameters["no_faces"]
     feather_dilate_size = parameters["feather_edges"]
@@ -208,42 +536,30 @@ def apply_blur(frame: cv2.Mat, index: int, detection_dict: Dict, parameters: Dic
             continue
         filtered_detections.append(detection.get_scaled(frame.shape, roi_multi))
 
-    # early exit if there are no detections
-    if len(filtered_detections) < 1:
-        # there are no detections for this frame, leave early
-        if export_mask or export_colored_mask:
-            # if mask export, return empty mask
-            return np.full((frame.shape[0], frame.shape[1], 3), 0, dtype=np.uint8)
-        else:
-            # if not mask export, return the input-frame
-            return frame
-
-    # mark all pixels that should be blurred
-    blur_area = np.full((frame.shape[0], frame.shape[1], 3), 0, dtype=np.float64)
-    mask_color = [1, 1, 1]
-    for detection in filtered_detections:
-        bounds = detection.bounds.expand(frame.shape, feather_dilate_size)
-        if detection.kind == "plate":
-            cv2.rectangle(blur_area, bounds.pt1(), bounds.pt2(), color=mask_color, thickness=-1)
-        elif detection.kind == "face":
-            center, axes = bounds.ellipse_coordinates()
-            cv2.ellipse(blur_area, center, axes, 0, 0, 360, color=mask_color, thickness=-1)
-        else:
-            raise ValueError(f"Detection kind not supported: {detection.kind}")
-
-    # blur out mask edges if desired
-    if feather_dilate_size > 0:
-        blurred_area = cv2.blur(blur_area, (feather_dilate_size, feather_dilate_size), 0)
-    else:
-        blurred_area = blur_area
+    # early exit if there are no detections and no mask to render, return the input-frame
+    if len(filtered_detections) < 1 and not (export_mask or export_colored_mask):
+        return frame
 
-    # another early exit: return mask
-    if export_mask:
-        return (blur_area * 255).astype(np.uint8)
+    # expand all detections by the feathering size, shapes are drawn into single channel uint8 masks
+    expanded_detections = [
+        Detection(detection.bounds.expand(frame.shape, feather_dilate_size), detection.score, detection.kind)
+        for detection in filtered_detections
+    ]
 
-    # blend blurred and unedited frame
-    clear_area = np.full((frame.shape[0], frame.shape[1], 3), 1, dtype=np.float64) - blurred_area
-    blurred_image = cv2.blur(frame, (blur_size, blur_size), 0)
-    frame = clear_area * frame + blurred_area * blurred_image
+    # another early exit: render the mask only, skipping obfuscation and blending
+    if export_mask or export_colored_mask:
+        processed = render_mask(frame.shape, expanded_detections, feather_dilate_size, colored=not export_mask)
+    else:
+        # obfuscate and blend only the feathered regions around detections, using fixed-point alpha blending
+        processed = obfuscate_regions(
+            frame,
+            expanded_detections,
+            feather_dilate_size,
+            lambda crop: obfuscation_filter.apply(crop, strength),
+            obfuscation_filter.margin(strength),
+        )
 
-    return frame.astype(np.uint8)
+    # detections reaching into exclusion regions of the camera profile are only blurred outside of them
+    if parameters.get("profile"):
+        load_profile(parameters["profile"]).restore_exclusions(processed, None if export_mask or export_colored_mask else frame, expanded_detections)
+    return processed
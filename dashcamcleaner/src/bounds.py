@@ -72,6 +72,15 @@ class Bounds:
         )
         return scaled_detection
 
+    def shift(self: "Bounds", x: int, y: int) -> "Bounds":
+        """
+        Move a bounding box, e.g. from the coordinates of a crop into those of the whole frame
+        :param x: horizontal offset
+        :param y: vertical offset
+        :return: moved box
+        """
+        return Bounds(self.x_min + x, self.y_min + y, self.x_max + x, self.y_max + y)
+
     def __repr__(self):
         return f"Box({self.x_min}, {self.y_min}, {self.x_max}, {self.y_max})"
 
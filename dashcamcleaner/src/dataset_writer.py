@@ -0,0 +1,194 @@
+import io
+import json
+import os
+import queue
+import tarfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+from src.watcher import write_json_atomically
+
+MANIFEST_FILE = "manifest.json"
+
+
+class ShardWriter:
+    """
+    Write samples of image and labels into tar shards in the WebDataset layout, i.e. {key}.jpg and {key}.json next to each other.
+    JPEG encoding and writing happens in a background thread, so the caller can keep detecting.
+    Shards are written to a .partial file and renamed once complete, so a crash never leaves a truncated shard behind.
+    """
+
+    def __init__(self, folder: Path, prefix: str, max_samples: int = 1000, queue_size: int = 32):
+        """
+        Constructor
+        :param folder: folder for the shards
+        :param prefix: shard file name prefix, shards are named {prefix}-{index:05d}.tar
+        :param max_samples: amount of samples per shard
+        :param queue_size: amount of samples buffered for the background thread
+        """
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.samples: "queue.Queue[Tuple[str, np.ndarray, List[Dict]]]" = queue.Queue(queue_size)
+        self.shards: List[str] = []
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=f"shard-writer-{prefix}", daemon=True)
+        self.thread.start()
+
+    def write(self, key: str, image: np.ndarray, labels: List[Dict]) -> None:
+        """
+        Queue a sample, blocks if the background thread falls behind
+        :param key: unique sample name without extension
+        :param image: BGR image
+        :param labels: label rows of the image
+        """
+        if self.error:
+            raise self.error
+        self.samples.put((key, image, labels))
+
+    def close(self) -> List[str]:
+        """
+        Write all queued samples and finish the last shard
+        :return: file names of all written shards
+        """
+        self.samples.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+        return self.shards
+
+    def run(self) -> None:
+        """
+        Background thread, encodes queued samples and writes them to shards
+        """
+        archive, partial_path, count, done = None, None, 0, False
+        try:
+            while True:
+                sample = self.samples.get()
+                if sample is None:
+                    done = True
+                    break
+                if archive is None:
+                    name = f"{self.prefix}-{len(self.shards):05d}.tar"
+                    partial_path = self.folder / f"{name}.partial"
+                    archive = tarfile.open(partial_path, "w")
+                key, image, labels = sample
+                add_member(archive, f"{key}.jpg", cv2.imencode(".jpg", image)[1].tobytes())
+                add_member(archive, f"{key}.json", json.dumps(labels).encode())
+                count += 1
+                if count == self.max_samples:
+                    self.finish_shard(archive, partial_path)
+                    archive, count = None, 0
+            if archive is not None:
+                self.finish_shard(archive, partial_path)
+        except Exception as e:
+            self.error = e
+            # keep consuming so writers blocked on a full queue are released
+            while not done and self.samples.get() is not None:
+                pass
+
+    def finish_shard(self, archive: tarfile.TarFile, partial_path: Path) -> None:
+        """
+        Close a shard and move it to its final name
+        :param archive: open shard
+        :param partial_path: path of the shard while it is written
+        """
+        archive.close()
+        os.replace(partial_path, partial_path.with_suffix(""))
+        self.shards.append(partial_path.with_suffix("").name)
+
+
+def add_member(archive: tarfile.TarFile, name: str, content: bytes) -> None:
+    """
+    Add an in-memory file to a tar archive
+    :param archive: open archive
+    :param name: member name
+    :param content: file content
+    """
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    archive.addfile(info, io.BytesIO(content))
+
+
+def remove_shards(folder: Path, prefix: str) -> None:
+    """
+    Remove all complete and partial shards of a prefix, e.g. of a video that has to be processed again
+    :param folder: folder of the shards
+    :param prefix: shard file name prefix
+    """
+    for path in Path(folder).glob(f"{prefix}-*.tar*"):
+        path.unlink()
+
+
+def read_shards(folder: Path) -> Iterator[Tuple[str, str, bytes, List[Dict]]]:
+    """
+    Read all samples of a sharded dataset
+    :param folder: dataset folder with one subfolder of shards per set, e.g. train and val
+    :return: iterator of set, key, JPEG bytes and label rows
+    """
+    for shard_path in sorted(Path(folder).glob("*/*.tar")):
+        images = {}
+        with tarfile.open(shard_path, "r") as archive:
+            for member in archive:
+                key, extension = os.path.splitext(member.name)
+                content = archive.extractfile(member).read()
+                if extension == ".jpg":
+                    images[key] = content
+                elif extension == ".json":
+                    # members of a sample are written next to each other, the image always first
+                    yield shard_path.parent.name, key, images.pop(key), json.loads(content)
+
+
+class DatasetManifest:
+    """
+    Record of a dataset's split and of all completed jobs, so an interrupted run can be resumed
+    """
+
+    def __init__(self, folder: Path):
+        """
+        Constructor, loads an existing manifest
+        :param folder: dataset folder
+        """
+        self.path = Path(folder) / MANIFEST_FILE
+        self.content = {"label_format": None, "plan": None, "completed": {}}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.content = json.load(f)
+
+    @property
+    def plan(self) -> Dict[str, Dict[str, List[str]]]:
+        return self.content["plan"]
+
+    def start(self, label_format: str, plan: Dict[str, Dict[str, List[str]]]) -> bool:
+        """
+        Start a new run or resume the previous one
+        :param label_format: format for class labels
+        :param plan: videos and pictures per set, e.g. {"train": {"videos": [...], "pictures": [...]}, "val": ...}
+        :return: whether a previous run is resumed, in which case its plan is kept
+        """
+        if self.content["plan"] is not None:
+            if self.content["label_format"] != label_format:
+                raise AttributeError(
+                    f"{self.path} belongs to a {self.content['label_format']} dataset, remove it to start over in {label_format} format"
+                )
+            return True
+        self.content.update(label_format=label_format, plan=plan)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomically(self.path, self.content)
+        return False
+
+    def is_completed(self, job: str) -> bool:
+        return job in self.content["completed"]
+
+    def complete(self, job: str, details: Dict) -> None:
+        """
+        Mark a job as completed
+        :param job: job name, e.g. train/vid3
+        :param details: statistics of the job, e.g. the amount of samples
+        """
+        self.content["completed"][job] = details
+        write_json_atomically(self.path, self.content)
@@ -11,10 +11,22 @@ class Detection:
         self.score = float(score)
         self.kind = kind
 
+    @staticmethod
+    def from_dict(content: dict) -> "Detection":
+        """
+        Create a detection from its JSON representation, as written by --export_json
+        :param content: dictionary with bounds, score and kind
+        :return: detection
+        """
+        return Detection(Bounds(**content["bounds"]), content["score"], content["kind"])
+
     def get_scaled(self: "Detection", shape, multiplier) -> "Detection":
         result = Detection(self.bounds.scale(shape, multiplier), self.score, self.kind)
         return result
 
+    def get_shifted(self: "Detection", x: int, y: int) -> "Detection":
+        return Detection(self.bounds.shift(x, y), self.score, self.kind)
+
     def __eq__(self: "Detection", other) -> bool:
         if isinstance(other, Detection):
             return self.bounds == other.bounds and self.score == other.score and self.kind == other.kind
@@ -0,0 +1,2 @@
+# names of the obfuscation filters in src.filters, listed without importing OpenCV so the CLI can offer them at startup
+FILTER_NAMES = ["box", "gaussian", "pixelate", "solid"]
@@ -0,0 +1,110 @@
+from typing import Dict
+
+import cv2
+import numpy as np
+from src.filter_names import FILTER_NAMES
+
+
+class ObfuscationFilter:
+    """
+    Base class for filters that hide identifiable information in an image crop.
+    Filters are only applied to crops around detections, margin tells how much context around a region they need.
+    """
+
+    name: str = ""
+    cost: str = ""
+
+    def margin(self: "ObfuscationFilter", strength: int) -> int:
+        """
+        Context pixels needed around a region so filtering a crop matches filtering the whole frame
+        :param strength: filter strength, i.e. the blur_size parameter
+        :return: margin in pixels
+        """
+        return 0
+
+    def apply(self: "ObfuscationFilter", crop: np.ndarray, strength: int) -> np.ndarray:
+        """
+        Obfuscate an image crop
+        :param crop: uint8 image crop
+        :param strength: filter strength, i.e. the blur_size parameter
+        :return: obfuscated uint8 crop of the same size
+        """
+        raise NotImplementedError
+
+
+class BoxBlur(ObfuscationFilter):
+    """
+    Box blur with a kernel of 2 * strength + 1 pixels, the original DashcamCleaner filter
+    """
+
+    name = "box"
+    cost = "Constant per pixel (running sums), independent of strength, but needs a margin of strength pixels"
+
+    def margin(self: "BoxBlur", strength: int) -> int:
+        return strength + 1
+
+    def apply(self: "BoxBlur", crop: np.ndarray, strength: int) -> np.ndarray:
+        kernel_size = strength * 2 + 1
+        return cv2.blur(crop, (kernel_size, kernel_size))
+
+
+class GaussianBlur(ObfuscationFilter):
+    """
+    Gaussian blur with a kernel of 2 * strength + 1 pixels, smoother than the box blur
+    """
+
+    name = "gaussian"
+    cost = "Linear in strength per pixel (separable kernel), the most expensive filter for large strengths"
+
+    def margin(self: "GaussianBlur", strength: int) -> int:
+        return strength + 1
+
+    def apply(self: "GaussianBlur", crop: np.ndarray, strength: int) -> np.ndarray:
+        kernel_size = strength * 2 + 1
+        return cv2.GaussianBlur(crop, (kernel_size, kernel_size), 0)
+
+
+class Pixelate(ObfuscationFilter):
+    """
+    Mosaic of blocks with an edge length of strength + 1 pixels, by downscaling and upscaling the crop
+    """
+
+    name = "pixelate"
+    cost = "One area downscale and one nearest neighbour upscale, cheaper than any blur and no margin needed"
+
+    def apply(self: "Pixelate", crop: np.ndarray, strength: int) -> np.ndarray:
+        height, width = crop.shape[:2]
+        block_size = strength + 1
+        small = cv2.resize(
+            crop, (max(width // block_size, 1), max(height // block_size, 1)), interpolation=cv2.INTER_AREA
+        )
+        return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+class SolidFill(ObfuscationFilter):
+    """
+    Fill regions with black, independent of strength
+    """
+
+    name = "solid"
+    cost = "A single memset per region, the cheapest filter"
+
+    def apply(self: "SolidFill", crop: np.ndarray, strength: int) -> np.ndarray:
+        return np.zeros_like(crop)
+
+
+FILTERS: Dict[str, ObfuscationFilter] = {
+    obfuscation_filter.name: obfuscation_filter for obfuscation_filter in [BoxBlur(), GaussianBlur(), Pixelate(), SolidFill()]
+}
+assert list(FILTERS) == FILTER_NAMES, "src.filter_names.FILTER_NAMES has to list the names of FILTERS"
+
+
+def get_filter(name: str) -> ObfuscationFilter:
+    """
+    Look up an obfuscation filter by name
+    :param name: name of the filter
+    :return: filter
+    """
+    if name not in FILTERS:
+        raise ValueError(f"Obfuscation filter not supported: {name}, choose one of {', '.join(FILTERS)}")
+    return FILTERS[name]
@@ -0,0 +1,103 @@
+from typing import Callable, List
+
+import cv2
+import numpy as np
+from src.detection import Detection
+
+# frames are compared as grayscale thumbnails of this width, which hides compression noise
+THUMBNAIL_WIDTH = 256
+# thumbnails are compared block by block, so motion of a small object is not averaged away by a static background
+BLOCK_SIZE = 8
+# frames in a row that at most reuse detections, unless configured otherwise
+DEFAULT_REFRESH_INTERVAL = 30
+
+
+def get_thumbnail(frame: np.ndarray) -> np.ndarray:
+    """
+    Downscale a frame for motion detection
+    :param frame: BGR frame
+    :return: grayscale thumbnail as float32
+    """
+    height, width = frame.shape[:2]
+    size = (THUMBNAIL_WIDTH, max(round(height * THUMBNAIL_WIDTH / width), BLOCK_SIZE))
+    # area interpolation of a whole 4K frame takes >10 ms, bilinear sampling to twice the size first keeps it below one
+    thumbnail = cv2.resize(frame, (size[0] * 2, size[1] * 2), interpolation=cv2.INTER_LINEAR)
+    thumbnail = cv2.resize(thumbnail, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+def block_difference(reference: np.ndarray, thumbnail: np.ndarray) -> float:
+    """
+    Mean absolute difference of the most changed block of two thumbnails
+    :param reference: thumbnail of the last frame detection ran on
+    :param thumbnail: thumbnail of the current frame
+    :return: difference in gray levels (0 to 255)
+    """
+    difference = cv2.absdiff(reference, thumbnail)
+    height, width = difference.shape
+    blocks = cv2.resize(difference, (max(width // BLOCK_SIZE, 1), max(height // BLOCK_SIZE, 1)), interpolation=cv2.INTER_AREA)
+    return float(blocks.max())
+
+
+class MotionGate:
+    """
+    Decides which frames of a video need inference. While nothing moves, e.g. at a red light, frames reuse the detections
+    of the last frame detection ran on, until a block of the frame differs from that frame by more than the threshold
+    (motion or a scene change) or the refresh interval forces a new inference.
+    """
+
+    def __init__(self: "MotionGate", threshold: float, refresh_interval: int = DEFAULT_REFRESH_INTERVAL) -> None:
+        """
+        Constructor
+        :param threshold: mean gray level difference of a block that counts as motion
+        :param refresh_interval: detection runs at least once every refresh_interval frames
+        """
+        self.threshold = threshold
+        self.refresh_interval = max(refresh_interval, 1)
+        self.reference = None
+        self.reused_in_a_row = 0
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+
+    def needs_inference(self: "MotionGate", frame: np.ndarray) -> bool:
+        """
+        Check whether detection has to run on a frame, frames have to be passed in order
+        :param frame: BGR frame
+        :return: False if the detections of the last inferred frame can be reused
+        """
+        thumbnail = get_thumbnail(frame)
+        if (
+            self.reference is None
+            or self.reference.shape != thumbnail.shape
+            or self.reused_in_a_row + 1 >= self.refresh_interval
+            or block_difference(self.reference, thumbnail) > self.threshold
+        ):
+            self.reference = thumbnail
+            self.reused_in_a_row = 0
+            self.inferred_frames += 1
+            return True
+        self.reused_in_a_row += 1
+        self.skipped_frames += 1
+        return False
+
+    def detect(
+        self: "MotionGate",
+        detect: Callable[[list], List[List[Detection]]],
+        frames: list,
+        previous: List[Detection],
+    ) -> List[List[Detection]]:
+        """
+        Run detection on the frames of a batch that need it, the others reuse the detections of the last inferred frame
+        :param detect: detection function for a list of frames, e.g. VideoBlurrer.detect_identifiable_information
+        :param frames: consecutive BGR frames
+        :param previous: detections of the frame before the batch
+        :return: detections per frame
+        """
+        needed = [self.needs_inference(frame) for frame in frames]
+        detected = iter(detect([frame for frame, need in zip(frames, needed) if need]))
+        frame_detections = []
+        for need in needed:
+            if need:
+                previous = next(detected)
+            frame_detections.append(list(previous))
+        return frame_detections
@@ -1,21 +1,39 @@
+import json
 import os
 import random
 import sys
 from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
 from math import floor, sqrt
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
 
 import cv2
-import pandas as pd
-from anonymizer.anonymization.anonymizer import Anonymizer
-from anonymizer.detection.detector import Detector
-from anonymizer.detection.weights import download_weights, get_weights_path
-from anonymizer.obfuscation.obfuscator import Obfuscator
-from pascal_voc_writer import Writer
+import numpy as np
+from more_itertools import chunked
 from tqdm import tqdm
 
 # hack to add Anonymizer submodule to PYTHONPATH
 sys.path.append(os.path.join(os.path.dirname(__file__), "anonymizer"))
+# hack to make this repo's src package importable when running this file as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.dataset_writer import DatasetManifest, ShardWriter, read_shards, remove_shards  # noqa: E402
+from src.watcher import write_json_atomically  # noqa: E402
+
+DETECTION_THRESHOLDS = {"face": 0.3, "plate": 0.2}
+YOLO_CLASSES = {"plate": 0, "face": 1}
+LABEL_FORMATS = ["yolo", "voc", "torch", "shards"]
+BACKENDS = ["yolo", "anonymizer"]
+
+# amount of pictures handed to a worker at once
+PICTURES_PER_JOB = 64
+
+# every worker process sets up its own detector, neither TensorFlow sessions nor CUDA contexts can be shared between processes
+worker_backend = None
+worker_detector = None
 
 
 def setup_anonymizer(weights_path: str, obfuscation_parameters: str):
@@ -25,6 +43,12 @@ def setup_anonymizer(weights_path: str, obfuscation_parameters: str):
     :param obfuscation_parameters: parameters for Gaussian blur
     :return: Anonymizer object
     """
+    # the legacy backend needs TensorFlow, only import it if it is actually used
+    from anonymizer.anonymization.anonymizer import Anonymizer
+    from anonymizer.detection.detector import Detector
+    from anonymizer.detection.weights import download_weights, get_weights_path
+    from anonymizer.obfuscation.obfuscator import Obfuscator
+
     download_weights(download_directory=weights_path)
     kernel_size, sigma, box_kernel_size = [int(x) for x in obfuscation_parameters.split(",")]
     # Anonymizer requires uneven kernel size
@@ -44,30 +68,361 @@ def setup_anonymizer(weights_path: str, obfuscation_parameters: str):
     return Anonymizer(obfuscator=obfuscator, detectors=detectors)
 
 
+def setup_yolo(weights_name: str):
+    """
+    Sets up this repo's own detector
+    :param weights_name: file name of the weights in the weights folder, e.g. 720p_medium_mosaic
+    :return: VideoBlurrer used for its batched detection
+    """
+    from src.blurrer import VideoBlurrer
+    from src.weights import get_inference_size
+
+    # detect with the lowest threshold of all kinds, the detections are filtered per kind afterwards
+    parameters = {"inference_size": get_inference_size(weights_name), "threshold": min(DETECTION_THRESHOLDS.values())}
+    return VideoBlurrer(weights_name, parameters)
+
+
+def init_worker(backend: str, weights: str) -> None:
+    """
+    Initializer of the worker processes, loads the detectors once per process
+    :param backend: yolo or anonymizer
+    :param weights: weights file name for yolo, directory to Anonymizer's weights for anonymizer
+    :return:
+    """
+    global worker_backend, worker_detector
+    worker_backend = backend
+    worker_detector = setup_yolo(weights) if backend == "yolo" else setup_anonymizer(weights, "1,0,1")
+
+
+def detect_batch(frames: List[np.ndarray]) -> List[List[Tuple[str, float, float, float, float]]]:
+    """
+    Detect faces and plates on a batch of frames with the worker's detector.
+    The yolo backend runs the whole batch at once, like blurring does.
+    Anonymizer's detectors are called directly, Anonymizer.anonymize_image would also obfuscate every frame just to throw it away.
+    They only take single images, so the batch is processed frame by frame.
+    :param frames: BGR frames
+    :return: kind, x_min, y_min, x_max and y_max of all boxes per frame
+    """
+    if worker_backend == "yolo":
+        return [
+            [
+                (detection.kind, detection.bounds.x_min, detection.bounds.y_min, detection.bounds.x_max, detection.bounds.y_max)
+                for detection in detections
+                if detection.score >= DETECTION_THRESHOLDS[detection.kind]
+            ]
+            for detections in worker_detector.detect_identifiable_information(frames)
+        ]
+    return [
+        [
+            (box.kind, box.x_min, box.y_min, box.x_max, box.y_max)
+            for kind, detector in worker_detector.detectors.items()
+            for box in detector.detect(frame, detection_threshold=DETECTION_THRESHOLDS[kind])
+        ]
+        for frame in frames
+    ]
+
+
+def label_rows(file_name: str, boxes: List[Tuple[str, float, float, float, float]], frame_shape: Tuple[int, ...], roi_multi: float) -> List[Dict]:
+    """
+    Convert detections of a frame to label rows
+    :param file_name: file name of the frame's image
+    :param boxes: kind, x_min, y_min, x_max and y_max of every box
+    :param frame_shape: shape of the frame
+    :param roi_multi: multiplier for region of interest size
+    :return: one row per box, with x and y swapped in the column names like the torch CSV always had them
+    """
+    frame_height, frame_width = frame_shape[:2]
+    rows = []
+    for kind, x_min, y_min, x_max, y_max in boxes:
+        width = x_max - x_min
+        height = y_max - y_min
+
+        # scale detection by ROI multiplier - 2x means a twofold increase in AREA, not circumference
+        rows.append(
+            {
+                "name": file_name,
+                "type": kind,
+                "xmin": max(y_min - ((sqrt(roi_multi) - 1) * height) / 2, 0),
+                "xmax": min(y_max + ((sqrt(roi_multi) - 1) * height) / 2, frame_height),
+                "ymin": max(x_min - ((sqrt(roi_multi) - 1) * width) / 2, 0),
+                "ymax": min(x_max + ((sqrt(roi_multi) - 1) * width) / 2, frame_width),
+                "width": frame_width,
+                "height": frame_height,
+            }
+        )
+    return rows
+
+
+def write_labels(rows: List[Dict], folder_path: str, label_format: str, folder_suffix: str) -> None:
+    """
+    Write YOLO or VOC labels, one file per image. Torch labels are collected and written once for the whole dataset,
+    shards contain their labels.
+    :param rows: label rows of one or more images
+    :param folder_path: path to dataset folder
+    :param label_format: format for class labels
+    :param folder_suffix: folder name for current set, e.g. train or val
+    :return:
+    """
+    label_path = os.path.join(folder_path, "labels", folder_suffix)
+    images: Dict[str, List[Dict]] = {}
+    for row in rows:
+        images.setdefault(row["name"], []).append(row)
+
+    for name, image_rows in images.items():
+        if label_format == "yolo":
+            with open(os.path.join(label_path, os.path.splitext(name)[0] + ".txt"), "w") as f:
+                f.writelines(yolo_line(row) for row in image_rows)
+        elif label_format == "voc":
+            from pascal_voc_writer import Writer
+
+            image_path = os.path.join(folder_path, "images", folder_suffix, name)
+            writer = Writer(image_path, image_rows[0]["width"], image_rows[0]["height"])
+            for row in image_rows:
+                writer.addObject(row["type"], row["ymin"], row["xmin"], row["ymax"], row["xmax"])
+            writer.save(os.path.join(label_path, os.path.splitext(name)[0] + ".xml"))
+
+
+def yolo_line(row: Dict) -> str:
+    """
+    Convert a label row to a line of a YOLO label file
+    :param row: label data
+    :return: class, center and size relative to the image size
+    """
+    y_center = (row["xmin"] + row["xmax"]) / 2 / row["height"]
+    x_center = (row["ymax"] + row["ymin"]) / 2 / row["width"]
+    box_width = (row["ymax"] - row["ymin"]) / row["width"]
+    box_height = (row["xmax"] - row["xmin"]) / row["height"]
+    return f"""{YOLO_CLASSES[row["type"]]} {x_center} {y_center} {box_width} {box_height} \n"""
+
+
+def dhash(frame: np.ndarray) -> int:
+    """
+    64 bit difference hash of a frame, robust against noise, compression and small changes in brightness
+    :param frame: BGR frame
+    :return: hash
+    """
+    # subsample before averaging, area interpolation over the full frame would cost more than the rest of the sampling
+    gray = cv2.cvtColor(cv2.resize(frame[::8, ::8], (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class FrameDeduplicator:
+    """
+    Streaming filter for near-duplicate frames, e.g. while parked or stuck in traffic.
+    A frame is novel if its hash differs from all recently kept frames by more than a threshold.
+    """
+
+    def __init__(self, threshold: int = 6, memory: int = 64):
+        """
+        Initializer
+        :param threshold: minimum amount of differing hash bits (of 64) for a frame to count as novel, 0 keeps every frame
+        :param memory: amount of recently kept hashes a frame is compared against
+        """
+        self.threshold = threshold
+        self.recent_hashes = deque(maxlen=memory)
+        self.inspected = 0
+        self.kept = 0
+
+    def is_novel(self, frame: np.ndarray) -> bool:
+        """
+        Check a frame against the recently kept ones and remember it if it is novel
+        :param frame: BGR frame
+        :return: whether the frame should be kept
+        """
+        self.inspected += 1
+        if self.threshold > 0:
+            frame_hash = dhash(frame)
+            if any(bin(frame_hash ^ recent_hash).count("1") < self.threshold for recent_hash in self.recent_hashes):
+                return False
+            self.recent_hashes.append(frame_hash)
+        self.kept += 1
+        return True
+
+
+def sampled_frames(video_path: str, skip_frames: int, deduplicator: FrameDeduplicator = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Read every skip_frames-th frame of a video. Skipped frames are only grabbed, not converted to BGR or copied.
+    :param video_path: path to video
+    :param skip_frames: distance between two inspected frames
+    :param deduplicator: optional filter dropping inspected frames that are too similar to recently kept ones
+    :return: iterator of frame index and frame
+    """
+    cap = cv2.VideoCapture(video_path)
+    if cap.isOpened() is False:
+        print("error file not found")
+        return
+
+    counter = 0
+    try:
+        while cap.grab():
+            # skip frames to avoid too similar frames
+            if counter % skip_frames == 0:
+                ret, frame = cap.retrieve()
+                if ret is False:
+                    break
+                if deduplicator is None or deduplicator.is_novel(frame):
+                    yield counter, frame
+            counter += 1
+    finally:
+        cap.release()
+
+
+def labeled_data_from_video(
+    video_path: str,
+    vid_num: int,
+    folder_path: str,
+    label_format: str,
+    folder_suffix: str,
+    skip_frames: int,
+    batch_size: int,
+    dedup_threshold: int = 0,
+    dedup_memory: int = 64,
+    roi_multi=1.2,
+) -> Tuple[List[Dict], int, int]:
+    """
+    Extract frames and labels from a video, runs in a worker process
+    :param video_path: path to video
+    :param vid_num: number of video, used to create unique file names
+    :param folder_path: path to dataset folder
+    :param label_format: format for class labels
+    :param folder_suffix: last level folder name, e.g. train or val
+    :param skip_frames: for each analyzed frame, skip n frames
+    :param batch_size: amount of frames passed to the detectors at once
+    :param dedup_threshold: minimum amount of differing hash bits for a frame to be kept, 0 keeps every inspected frame
+    :param dedup_memory: amount of recently kept frames new frames are compared against
+    :param roi_multi: multiplier for region of interest size
+    :return: label rows of the video, amount of inspected and of kept frames
+    """
+    deduplicator = FrameDeduplicator(dedup_threshold, dedup_memory)
+    shard_writer = ShardWriter(Path(folder_path) / folder_suffix, f"vid{vid_num}") if label_format == "shards" else None
+    rows = []
+    for batch in chunked(sampled_frames(video_path, skip_frames, deduplicator), batch_size):
+        for (counter, frame), boxes in zip(batch, detect_batch([frame for _, frame in batch])):
+            file_name = f"vid{vid_num}frame{counter}.jpg"
+            frame_rows = label_rows(file_name, boxes, frame.shape, roi_multi)
+            rows.extend(frame_rows)
+            save_image(folder_path, folder_suffix, file_name, frame, frame_rows, shard_writer)
+
+    if shard_writer:
+        shard_writer.close()
+    if rows:
+        write_labels(rows, folder_path, label_format, folder_suffix)
+    else:
+        print(f"{video_path} seems to contain no faces or plates whatsoever!")
+    return rows, deduplicator.inspected, deduplicator.kept
+
+
+def labeled_data_from_pictures(
+    picture_paths: List[str], first_index: int, folder_path: str, label_format: str, folder_suffix: str, batch_size: int, roi_multi=1.2
+) -> List[Dict]:
+    """
+    Extract labels from pictures, runs in a worker process
+    :param picture_paths: paths to image files
+    :param first_index: number of the first picture, used to create unique file names
+    :param folder_path: path to dataset folder
+    :param label_format: format for class labels
+    :param folder_suffix: last level folder name, e.g. train or val
+    :param batch_size: amount of pictures passed to the detectors at once
+    :param roi_multi: multiplier for region of interest size
+    :return: label rows of the pictures
+    """
+    shard_writer = ShardWriter(Path(folder_path) / folder_suffix, f"img{first_index}") if label_format == "shards" else None
+    rows = []
+    for batch in chunked(enumerate(picture_paths, first_index), batch_size):
+        frames = [cv2.imread(pic_path) for _, pic_path in batch]
+        for (counter, _), frame, boxes in zip(batch, frames, detect_batch(frames)):
+            if not boxes:
+                continue
+            file_name = f"image{counter}.jpg"
+            frame_rows = label_rows(file_name, boxes, frame.shape, roi_multi)
+            rows.extend(frame_rows)
+            save_image(folder_path, folder_suffix, file_name, frame, frame_rows, shard_writer)
+
+    if shard_writer:
+        shard_writer.close()
+    write_labels(rows, folder_path, label_format, folder_suffix)
+    return rows
+
+
+def save_image(folder_path: str, folder_suffix: str, file_name: str, frame: np.ndarray, rows: List[Dict], shard_writer: ShardWriter = None) -> None:
+    """
+    Save a labeled image, either as a JPEG file or as a sample of a shard
+    :param folder_path: path to dataset folder
+    :param folder_suffix: folder name for current set, e.g. train or val
+    :param file_name: file name of the image
+    :param frame: BGR image
+    :param rows: label rows of the image, only stored in shards
+    :param shard_writer: shard writer of the current job if writing shards
+    :return:
+    """
+    if shard_writer:
+        shard_writer.write(os.path.splitext(file_name)[0], frame, rows)
+    else:
+        cv2.imwrite(os.path.join(folder_path, "images", folder_suffix, file_name), frame)
+
+
 class TrainingDataGenerator:
     """
     Generate training data for license plate and face detectors from raw video footage
     """
 
-    def __init__(self, folder_path: str, skip_frames: int = 10):
+    def __init__(
+        self,
+        folder_path: str,
+        skip_frames: int = 10,
+        workers: int = 2,
+        batch_size: int = 8,
+        backend: str = "yolo",
+        weights: str = "720p_medium_mosaic",
+        dedup_threshold: int = 0,
+        dedup_memory: int = 64,
+    ):
         """
         Initializer
-        :param folder_path:
-        :param skip_frames:
+        :param folder_path: output folder for the dataset
+        :param skip_frames: for each analyzed frame, skip n frames
+        :param workers: amount of processes, each one loads its own detectors and processes whole videos
+        :param batch_size: amount of frames passed to the detectors at once
+        :param backend: yolo for this repo's detector, anonymizer for the legacy understand.ai Anonymizer
+        :param weights: weights file name for yolo, ignored for anonymizer
+        :param dedup_threshold: minimum amount of differing hash bits (of 64) for a video frame to be kept, 0 disables deduplication
+        :param dedup_memory: amount of recently kept frames per video new frames are compared against
         """
-        self.anonymizer = setup_anonymizer("weights", "1,0,1")
+        if backend not in BACKENDS:
+            raise AttributeError(f"Backend {backend} is not supported!")
+        if backend == "yolo":
+            from src.weights import get_weights_path
+
+            if not get_weights_path(weights).exists():
+                raise FileNotFoundError(f"Weights file {get_weights_path(weights)} does not exist!")
+            self.weights = weights
+        else:
+            # download once, before the workers look for the weights
+            from anonymizer.detection.weights import download_weights
+
+            download_weights(download_directory="weights")
+            self.weights = "weights"
+        self.backend = backend
         self.folder = folder_path
         self.skip_frames = skip_frames
+        self.workers = workers
+        self.batch_size = batch_size
+        self.dedup_threshold = dedup_threshold
+        self.dedup_memory = dedup_memory
 
     def batch_processing(self, input_folder, image_folder, label_folder, train_split, label_format):
         """
-        Batch process a folder of videos
+        Batch process a folder of videos and pictures in parallel
         :param image_folder: final image folder name
         :param label_folder: final label folder name
         :param train_split: train ratio (0,1)
         :param label_format: format for class labels
         :return:
         """
+        if label_format not in LABEL_FORMATS:
+            raise AttributeError(f"Label format {label_format} is not supported!")
+
         videos = glob(input_folder + "/*.m*") + glob(input_folder + "/*.M*")
         pictures = glob(input_folder + "/**/*.jpg", recursive=True)
         num_videos = len(videos)
@@ -77,260 +432,188 @@ class TrainingDataGenerator:
         train_videos = floor(train_split * num_videos)
         train_pictures = floor(train_split * num_pictures)
 
-        if label_format in ["yolo", "torch"]:
-            # create necessary output folders
+        # a previous, interrupted run is resumed with its original split
+        manifest = DatasetManifest(self.folder)
+        resumed = manifest.start(
+            label_format,
+            {
+                "train": {"videos": randomized_videos[:train_videos], "pictures": randomized_pictures[:train_pictures]},
+                "val": {"videos": randomized_videos[train_videos:], "pictures": randomized_pictures[train_pictures:]},
+            },
+        )
+        if resumed:
+            print(f"Resuming {manifest.path}, {len(manifest.content['completed'])} jobs are already completed.")
+
+        # create necessary output folders
+        if label_format == "torch":
+            os.makedirs(os.path.join(self.folder, "torch_labels"), exist_ok=True)
+        if label_format != "shards":
             for folder in [image_folder, label_folder]:
                 for training_set in ["train", "val"]:
-                    os.makedirs(os.path.join(pic_out, folder, training_set), exist_ok=True)
-
-        # train pictures
-        self.labeled_data_from_pictures(randomized_pictures[:train_pictures], label_format, "train")
-
-        # validate pictures
-        self.labeled_data_from_pictures(randomized_pictures[train_pictures:], label_format, "val")
-
-        # train videos
-        for index, vid in enumerate(
-            tqdm(randomized_videos[:train_videos], desc="Processing training video file")
-        ):
-            self.labeled_data_from_video(vid, index, label_format, "train")
-
-        # validate videos
-        for index, vid in enumerate(
-            tqdm(randomized_videos[train_videos:], desc="Processing validation video file")
-        ):
-            self.labeled_data_from_video(vid, index, label_format, "val")
-
-    def labeled_data_from_video(
-        self, video_path: str, vid_num: int, label_format, folder_suffix, roi_multi=1.2
-    ):
-        """
-        Extract frames and labels from a video
-        :param video_path: path to video
-        :param vid_num: number of video, used to create unique file names
-        :param label_format: format for class labels
-        :param folder_suffix: last level folder name, e.g. train or val
-        :param roi_multi: multiplier for region of interest size
-        :return:
-        """
-        cap = cv2.VideoCapture(video_path)
-
-        # gets the height and width of each frame
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        boxes = []
-        detection_thresholds = {"face": 0.3, "plate": 0.2}
-
-        if cap.isOpened() is False:
-            print("error file not found")
-            return
-
-        counter = 0
-        progress = tqdm(total=length)
-        while cap.isOpened():
-            # returns each frame
-            ret, frame = cap.read()
-            if ret is True:
-                # skip frames to avoid too similar frames
-                if counter % (self.skip_frames) == 0:
-                    _, new_detections = self.anonymizer.anonymize_image(frame, detection_thresholds)
-                    file_name = f"vid{vid_num}frame{counter}.jpg"
-                    path_name = f"{self.folder}/images/{folder_suffix}/{file_name}"
-                    for detection in new_detections:
-                        width = detection.x_max - detection.x_min
-                        height = detection.y_max - detection.y_min
-
-                        # scale detection by ROI multiplier - 2x means a twofold increase in AREA, not circumference
-                        detection.x_min -= ((sqrt(roi_multi) - 1) * width) / 2
-                        detection.x_max += ((sqrt(roi_multi) - 1) * width) / 2
-                        detection.y_min -= ((sqrt(roi_multi) - 1) * height) / 2
-                        detection.y_max += ((sqrt(roi_multi) - 1) * height) / 2
-
-                        x_min = max(detection.y_min, 0)
-                        x_max = min(detection.y_max, frame_height)
-                        y_min = max(detection.x_min, 0)
-                        y_max = min(detection.x_max, frame_width)
-
-                        # save frame to folder
-                        boxes.append(
-                            {
-                                "name": file_name,
-                                "type": detection.kind,
-                                "xmin": x_min,
-                                "xmax": x_max,
-                                "ymin": y_min,
-                                "ymax": y_max,
-                                "width": frame_width,
-                                "height": frame_height,
-                            }
-                        )
-                    cv2.imwrite(path_name, frame)
-            else:
-                break
-            counter += 1
-            progress.update(1)
-        progress.close()
-        cap.release()
-        df = pd.DataFrame(boxes)
-
-        if not df.empty:
-            if label_format == "yolo":
-                # convert to YOLO label format
-                df["y_center"] = (df["xmin"] + df["xmax"]) / 2 / df["height"]
-                df["x_center"] = (df["ymax"] + df["ymin"]) / 2 / df["width"]
-                df["box_width"] = (df["ymax"] - df["ymin"]) / df["width"]
-                df["box_height"] = (df["xmax"] - df["xmin"]) / df["height"]
-                df.loc[df["type"] == "face", "yolo_class"] = 1
-                df.loc[df["type"] == "plate", "yolo_class"] = 0
-                df["yolo_class"] = df["yolo_class"].astype("int8")
-                # df.to_csv(f"{self.folder}/labels.csv", index=False)
-                df.apply(lambda x: write_yolo(x, self.folder, folder_suffix), axis=1)
-            elif label_format == "voc":
-                label_path = os.path.join(self.folder, "labels", folder_suffix)
-                for name, group in df.groupby("name"):
-                    image_path = os.path.join(self.folder, "images", folder_suffix, name)
-                    width = group.iloc[0]["width"]
-                    height = group.iloc[0]["height"]
-                    writer = Writer(image_path, width, height)
-                    for _, row in group.iterrows():
-                        writer.addObject(
-                            row["type"], row["ymin"], row["xmin"], row["ymax"], row["xmax"]
-                        )
-                    writer.save(os.path.join(label_path, os.path.splitext(name)[0] + ".xml"))
-            elif label_format == "torch":
-                class_dict = {"plate": 0, "face": 1}
-                df["class"] = df["type"].apply(lambda x: class_dict[x])
-                df.to_csv(os.path.join(self.folder, "labels.csv"))
-            else:
-                raise AttributeError(f"Label format {label_format} is not supported!")
-        else:
-            print("This video seems to contain no faces or plates whatsoever!")
+                    os.makedirs(os.path.join(self.folder, folder, training_set), exist_ok=True)
+
+        with ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.backend, self.weights)) as executor:
+            jobs = {}
+            for folder_suffix, inputs in manifest.plan.items():
+                for first_index in range(0, len(inputs["pictures"]), PICTURES_PER_JOB):
+                    prefix = f"img{first_index}"
+                    if manifest.is_completed(f"{folder_suffix}/{prefix}"):
+                        continue
+                    # shards of an interrupted job are incomplete
+                    remove_shards(Path(self.folder) / folder_suffix, prefix)
+                    job = executor.submit(
+                        labeled_data_from_pictures,
+                        inputs["pictures"][first_index:first_index + PICTURES_PER_JOB],
+                        first_index,
+                        self.folder,
+                        label_format,
+                        folder_suffix,
+                        self.batch_size,
+                    )
+                    jobs[job] = f"{folder_suffix}/{prefix}"
+                for index, vid in enumerate(inputs["videos"]):
+                    prefix = f"vid{index}"
+                    if manifest.is_completed(f"{folder_suffix}/{prefix}"):
+                        continue
+                    remove_shards(Path(self.folder) / folder_suffix, prefix)
+                    job = executor.submit(
+                        labeled_data_from_video,
+                        vid,
+                        index,
+                        self.folder,
+                        label_format,
+                        folder_suffix,
+                        self.skip_frames,
+                        self.batch_size,
+                        self.dedup_threshold,
+                        self.dedup_memory,
+                    )
+                    jobs[job] = f"{folder_suffix}/{prefix}"
+
+            for job in tqdm(as_completed(jobs), total=len(jobs), desc="Processing video and picture files"):
+                name = jobs[job]
+                if "/vid" in name:
+                    rows, inspected, kept = job.result()
+                else:
+                    rows, inspected, kept = job.result(), 0, 0
+                if label_format == "torch":
+                    # torch labels are written once at the end, keep them of every job in case the run is interrupted
+                    write_json_atomically(Path(self.folder) / "torch_labels" / f"{name.replace('/', '_')}.json", rows)
+                manifest.complete(name, {"labels": len(rows), "inspected": inspected, "kept": kept})
+
+        completed = manifest.content["completed"].values()
+        inspected_frames = sum(details["inspected"] for details in completed)
+        kept_frames = sum(details["kept"] for details in completed)
+        if self.dedup_threshold > 0 and inspected_frames:
+            print(
+                f"Kept {kept_frames} of {inspected_frames} inspected video frames, "
+                f"dropped {1 - kept_frames / inspected_frames:.1%} as near-duplicates."
+            )
+
+        if not any(details["labels"] for details in completed):
+            print("This folder seems to contain no videos or images with faces or plates whatsoever!")
+        elif label_format == "torch":
+            rows = []
+            for path in sorted((Path(self.folder) / "torch_labels").glob("*.json")):
+                with open(path, "r") as f:
+                    rows.extend(json.load(f))
+            write_torch_labels(rows, self.folder)
+
+
+def write_torch_labels(rows: List[Dict], folder_path: str) -> None:
+    """
+    Write all labels of a dataset into a single CSV file
+    :param rows: label rows of all images
+    :param folder_path: path to dataset folder
+    :return:
+    """
+    import pandas as pd
 
-    def labeled_data_from_pictures(
-        self, picture_paths: str, label_format: str, folder_suffix: str, roi_multi=1.2
-    ):
-        """
-        Extract frames and labels from a video
-        :param picture_paths: paths to image files
-        :param label_format: format for class labels
-        :param folder_suffix: last level folder name, e.g. train or val
-        :param roi_multi: multiplier for region of interest size
-        :return:
-        """
-        boxes = []
-        detection_thresholds = {"face": 0.3, "plate": 0.2}
-
-        counter = 0
-        for pic_path in tqdm(picture_paths, desc=f"Processing {folder_suffix} image files"):
-            frame = cv2.imread(pic_path)
-            frame_height, frame_width = frame.shape[:2]
-            _, new_detections = self.anonymizer.anonymize_image(frame, detection_thresholds)
-            file_name = f"image{counter}.jpg"
-            path_name = f"{self.folder}/images/{folder_suffix}/{file_name}"
-            for detection in new_detections:
-                width = detection.x_max - detection.x_min
-                height = detection.y_max - detection.y_min
-
-                # scale detection by ROI multiplier - 2x means a twofold increase in AREA, not circumference
-                detection.x_min -= ((sqrt(roi_multi) - 1) * width) / 2
-                detection.x_max += ((sqrt(roi_multi) - 1) * width) / 2
-                detection.y_min -= ((sqrt(roi_multi) - 1) * height) / 2
-                detection.y_max += ((sqrt(roi_multi) - 1) * height) / 2
-
-                x_min = max(detection.y_min, 0)
-                x_max = min(detection.y_max, frame_height)
-                y_min = max(detection.x_min, 0)
-                y_max = min(detection.x_max, frame_width)
-
-                # save frame to folder
-                boxes.append(
-                    {
-                        "name": file_name,
-                        "type": detection.kind,
-                        "xmin": x_min,
-                        "xmax": x_max,
-                        "ymin": y_min,
-                        "ymax": y_max,
-                        "width": frame_width,
-                        "height": frame_height,
-                    }
-                )
-            if len(new_detections) > 0:
-                cv2.imwrite(path_name, frame)
-            counter += 1
-        df = pd.DataFrame(boxes)
-
-        if not df.empty:
-            if label_format == "yolo":
-                # convert to YOLO label format
-                df["y_center"] = (df["xmin"] + df["xmax"]) / 2 / df["height"]
-                df["x_center"] = (df["ymax"] + df["ymin"]) / 2 / df["width"]
-                df["box_width"] = (df["ymax"] - df["ymin"]) / df["width"]
-                df["box_height"] = (df["xmax"] - df["xmin"]) / df["height"]
-                df.loc[df["type"] == "face", "yolo_class"] = 1
-                df.loc[df["type"] == "plate", "yolo_class"] = 0
-                df["yolo_class"] = df["yolo_class"].astype("int8")
-                # df.to_csv(f"{self.folder}/labels.csv", index=False)
-                df.apply(lambda x: write_yolo(x, self.folder, folder_suffix), axis=1)
-            elif label_format == "voc":
-                label_path = os.path.join(self.folder, "labels", folder_suffix)
-                for name, group in df.groupby("name"):
-                    image_path = os.path.join(self.folder, "images", folder_suffix, name)
-                    width = group.iloc[0]["width"]
-                    height = group.iloc[0]["height"]
-                    writer = Writer(image_path, width, height)
-                    for _, row in group.iterrows():
-                        writer.addObject(
-                            row["type"], row["ymin"], row["xmin"], row["ymax"], row["xmax"]
-                        )
-                    writer.save(os.path.join(label_path, os.path.splitext(name)[0] + ".xml"))
-            elif label_format == "torch":
-                class_dict = {"plate": 0, "face": 1}
-                df["class"] = df["type"].apply(lambda x: class_dict[x])
-                df.to_csv(os.path.join(self.folder, "labels.csv"))
-            else:
-                raise AttributeError(f"Label format {label_format} is not supported!")
-        else:
-            print("This folder seems to contain no images with faces or plates whatsoever!")
+    df = pd.DataFrame(rows)
+    df["class"] = df["type"].apply(lambda x: YOLO_CLASSES[x])
+    df.to_csv(os.path.join(folder_path, "labels.csv"))
 
 
-def write_yolo(row: pd.Series, folder_path: str, folder_suffix: str):
+def export_shards(dataset_folder: str, output_folder: str, label_format: str) -> None:
     """
-    Appends a row of YOLO labels to a text file
-    :param row: label data
-    :param folder_path: path to dataset folder
-    :param folder_suffix: folder name for current set, e.g. train or val
+    Convert a sharded dataset to images and labels in the yolo, voc or torch format
+    :param dataset_folder: folder of a dataset written in the shards format
+    :param output_folder: folder for the converted dataset
+    :param label_format: format for class labels
     :return:
     """
-    file_name = os.path.splitext(row["name"])[0] + ".txt"
-    with open(os.path.join(folder_path, "labels", folder_suffix, file_name), "a") as f:
-        f.write(
-            f"""{row["yolo_class"]} {row["x_center"]} {row["y_center"]} {row["box_width"]} {row["box_height"]} \n"""
-        )
+    if label_format not in LABEL_FORMATS[:-1]:
+        raise AttributeError(f"Label format {label_format} is not supported for exports!")
+    for folder in ["images", "labels"]:
+        for training_set in ["train", "val"]:
+            os.makedirs(os.path.join(output_folder, folder, training_set), exist_ok=True)
+
+    all_rows = []
+    for folder_suffix, key, image, rows in tqdm(read_shards(Path(dataset_folder)), desc="Exporting samples"):
+        with open(os.path.join(output_folder, "images", folder_suffix, f"{key}.jpg"), "wb") as f:
+            f.write(image)
+        write_labels(rows, output_folder, label_format, folder_suffix)
+        all_rows.extend(rows)
+    if label_format == "torch" and all_rows:
+        write_torch_labels(all_rows, output_folder)
 
 
 def parse_args():
     """
     Parse CLI arguments for this script
-    :return:
+    :return: set of parsed arguments
     """
     parser = ArgumentParser()
     parser.add_argument("input", type=str, help="input folder containing video and jpg files")
     parser.add_argument("output", type=str, help="output folder for labeled training images")
-    parser.add_argument("labelformat", type=str, help="label format - yolo, voc or torch")
+    parser.add_argument(
+        "labelformat", type=str, help="label format - yolo, voc, torch or shards (resumable tar shards of images and labels)"
+    )
     parser.add_argument(
         "skipframes",
         type=int,
+        nargs="?",
+        default=10,
         help="for each analyzed image, skip n frames - to avoid too similar frames",
     )
-    parser.add_argument("trainsplit", type=float, help="training split of all data")
-    args = parser.parse_args()
-    return args.input, args.output, args.labelformat, args.skipframes, args.trainsplit
+    parser.add_argument("trainsplit", type=float, nargs="?", default=0.8, help="training split of all data")
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="convert a dataset written in the shards format (input) to the given label format (output) instead of labeling footage",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=2, help="processes working on separate videos, each one loads its own detectors"
+    )
+    parser.add_argument("-s", "--batch_size", type=int, default=8, help="frames passed to the detectors at once")
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="yolo",
+        help="yolo labels with this repo's detector and local weights, anonymizer with the legacy understand.ai Anonymizer",
+    )
+    parser.add_argument("--weights", type=str, default="720p_medium_mosaic", help="weights file for the yolo backend")
+    parser.add_argument(
+        "-d",
+        "--dedup_threshold",
+        type=int,
+        default=0,
+        help="only keep inspected video frames whose perceptual hash differs from recently kept frames in at least n of 64 bits, e.g. 6. 0 keeps all",
+    )
+    parser.add_argument(
+        "--dedup_memory", type=int, default=64, help="amount of recently kept frames per video that new frames are compared against"
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    input_folder, pic_out, label_format, skip_frames, train_split = parse_args()
-    gen = TrainingDataGenerator(pic_out, skip_frames)
-    gen.batch_processing(input_folder, "images", "labels", train_split, label_format)
+    args = parse_args()
+    if args.export:
+        export_shards(args.input, args.output, args.labelformat)
+        sys.exit()
+    gen = TrainingDataGenerator(
+        args.output, args.skipframes, args.workers, args.batch_size, args.backend, args.weights, args.dedup_threshold, args.dedup_memory
+    )
+    gen.batch_processing(args.input, "images", "labels", args.trainsplit, args.labelformat)
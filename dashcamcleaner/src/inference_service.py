@@ -0,0 +1,167 @@
+import threading
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from typing import Dict, Hashable, List, Tuple
+
+from src.detection import Detection
+
+# seconds a partial batch waits for frames of other videos before it runs anyway
+DEFAULT_MAX_WAIT = 0.05
+# parameters detect_identifiable_information depends on, only frames that agree on them can share a batch
+DETECTION_PARAMETERS = ("weights", "inference_size", "threshold", "profile", "tile_bands", "tile_size", "tile_overlap")
+
+
+class InferenceRequest:
+    """
+    Frames of one video waiting for detection, possibly spread over several batches
+    """
+
+    def __init__(self: "InferenceRequest", blurrer, images: list) -> None:
+        """
+        Constructor
+        :param blurrer: VideoBlurrer whose detection parameters apply to the frames
+        :param images: frames of the same size
+        """
+        self.blurrer = blurrer
+        self.images = images
+        self.results: List[List[Detection]] = [None] * len(images)
+        self.remaining = len(images)
+        self.error = None
+        self.submitted = timer()
+        self.done = threading.Event()
+
+
+class InferenceService:
+    """
+    Shared detector front end for videos that are processed at the same time. Instead of every video running its own,
+    often partial, batches, frames of all videos are collected into full batches of batch_size frames. A partial batch
+    runs once max_wait has passed or once every video is waiting for detections, so a single video is never delayed.
+    """
+
+    def __init__(self: "InferenceService", batch_size: int, max_wait: float = DEFAULT_MAX_WAIT) -> None:
+        """
+        Constructor, starts the thread running the batches
+        :param batch_size: amount of frames per detector call
+        :param max_wait: seconds a partial batch waits for more frames
+        """
+        self.batch_size = max(batch_size, 1)
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        # frames waiting for detection as (request, frame index), grouped by frame shape and detection parameters
+        self.pending: Dict[Hashable, List[Tuple[InferenceRequest, int]]] = {}
+        self.clients = 0
+        self.waiting_clients = 0
+        self.batches = 0
+        self.batched_frames = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="inference-service", daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def client(self: "InferenceService"):
+        """
+        Context manager around the processing of a video, partial batches only wait while other videos are processed
+        """
+        with self.condition:
+            self.clients += 1
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.clients -= 1
+                self.condition.notify_all()
+
+    def detect(self: "InferenceService", blurrer, images: list) -> List[List[Detection]]:
+        """
+        Run detection on frames as part of shared batches, blocks until all frames are done.
+        Drop-in replacement for VideoBlurrer.detect_identifiable_information.
+        :param blurrer: VideoBlurrer whose parameters and detector are used
+        :param images: frames of the same size
+        :return: detected faces and plates per frame
+        """
+        if not images:
+            return []
+        request = InferenceRequest(blurrer, images)
+        key = (images[0].shape, *(blurrer.parameters.get(name) for name in DETECTION_PARAMETERS))
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The inference service is closed.")
+            self.pending.setdefault(key, []).extend((request, index) for index in range(len(images)))
+            self.waiting_clients += 1
+            self.condition.notify_all()
+        try:
+            request.done.wait()
+        finally:
+            with self.condition:
+                self.waiting_clients -= 1
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def next_batch(self: "InferenceService") -> List[Tuple[InferenceRequest, int]]:
+        """
+        Wait for a batch that is full, whose oldest frame waited max_wait or that no other video can add frames to anymore
+        :return: frames of the batch, empty once the service is closed
+        """
+        with self.condition:
+            while not self.closed:
+                now = timer()
+                timeout = None
+                for key, frames in self.pending.items():
+                    deadline = frames[0][0].submitted + self.max_wait
+                    if len(frames) >= self.batch_size or now >= deadline or self.waiting_clients >= self.clients:
+                        batch, self.pending[key] = frames[:self.batch_size], frames[self.batch_size:]
+                        if not self.pending[key]:
+                            del self.pending[key]
+                        return batch
+                    timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+                self.condition.wait(timeout)
+            return []
+
+    def run(self: "InferenceService") -> None:
+        """
+        Run batches until the service is closed
+        """
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                return
+            try:
+                # all frames of a batch share the detection parameters, any of their blurrers can run it
+                results = batch[0][0].blurrer.detect_identifiable_information([request.images[index] for request, index in batch])
+            except Exception as e:
+                results = None
+                for request, _ in batch:
+                    request.error = e
+            self.batches += 1
+            self.batched_frames += len(batch)
+            for position, (request, index) in enumerate(batch):
+                if results is not None:
+                    request.results[index] = results[position]
+                request.remaining -= 1
+                if request.remaining == 0 or request.error is not None:
+                    request.done.set()
+
+    def statistics(self: "InferenceService") -> Dict[str, float]:
+        """
+        Batching statistics
+        :return: amount of detector calls and their mean fill level
+        """
+        return {
+            "batches": self.batches,
+            "mean_batch_fill": self.batched_frames / (self.batches * self.batch_size) if self.batches else 0.0,
+        }
+
+    def close(self: "InferenceService") -> None:
+        """
+        Stop the batching thread, frames that are still pending fail
+        """
+        with self.condition:
+            self.closed = True
+            for frames in self.pending.values():
+                for request, _ in frames:
+                    request.error = RuntimeError("The inference service was closed.")
+                    request.done.set()
+            self.pending.clear()
+            self.condition.notify_all()
+        self.thread.join()
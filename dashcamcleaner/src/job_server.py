@@ -0,0 +1,253 @@
+import json
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+
+from src.blurrer import VideoBlurrer
+from src.inference_service import InferenceService
+from src.prometheus import exporter
+
+# parameters that are fixed per server, because they are tied to the resident models or the server mode
+SERVER_PARAMETERS = {
+    "input_path",
+    "output_path",
+    "weights",
+    "inference_size",
+    "watch",
+    "poll_interval",
+    "check",
+    "metrics_port",
+    "threads",
+    "concurrent_files",
+}
+
+
+class Job:
+    """
+    A single blurring request and its progress
+    """
+
+    def __init__(self: "Job", parameters: Dict[str, Union[bool, int, float, str]]) -> None:
+        """
+        Constructor
+        :param parameters: complete blurring parameters for this job
+        """
+        self.id = uuid.uuid4().hex
+        self.parameters = parameters
+        self.state = "queued"
+        self.progress = 0
+        self.maximum = 0
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def set_progress(self: "Job", progress: int, maximum: int) -> None:
+        """
+        Progress callback for VideoBlurrer.blur_video, same values as the GUI's progress bar
+        :param progress: amount of processed frames
+        :param maximum: total amount of frames
+        """
+        self.progress = progress
+        self.maximum = maximum
+
+    def to_dict(self: "Job") -> Dict:
+        """
+        Serializable representation of the job
+        :return: job state
+        """
+        return {
+            "id": self.id,
+            "state": self.state,
+            "progress": self.progress,
+            "maximum": self.maximum,
+            "input_path": str(self.parameters["input_path"]),
+            "output_path": str(self.parameters["output_path"]),
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    Queue of blurring jobs processed by a pool of workers that keep their models loaded
+    """
+
+    def __init__(
+        self: "JobManager",
+        weights_name: str,
+        default_parameters: Dict[str, Union[bool, int, float, str]],
+        output_folder: Path,
+        workers: int = 1,
+        blurrer_factory: Callable = VideoBlurrer,
+    ) -> None:
+        """
+        Constructor, starts the workers, which share the detector loaded by the model registry.
+        Several workers send their frames through a shared inference service, which batches frames of all running jobs together.
+        :param weights_name: file name of the weights to be used by all workers
+        :param default_parameters: parameters used for every parameter a job does not specify
+        :param output_folder: folder for results of jobs that do not specify an output_path
+        :param workers: amount of videos that are processed at the same time
+        :param blurrer_factory: callable creating a VideoBlurrer from weights name and parameters
+        """
+        self.default_parameters = default_parameters
+        self.output_folder = Path(output_folder)
+        self.jobs: Dict[str, Job] = {}
+        self.queue: "queue.Queue[Job]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers: List[threading.Thread] = []
+        self.inference_service = InferenceService(default_parameters["batch_size"]) if workers > 1 else None
+        for index in range(workers):
+            blurrer = blurrer_factory(weights_name, dict(default_parameters))
+            blurrer.inference_service = self.inference_service
+            worker = threading.Thread(target=self.work, args=(blurrer,), name=f"blur-worker-{index}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self: "JobManager", request: Dict) -> Job:
+        """
+        Validate and enqueue a job request
+        :param request: dictionary with input_path, optional output_path and optional parameters
+        :return: created job
+        """
+        input_path = Path(request.get("input_path", ""))
+        if not input_path.is_file():
+            raise ValueError(f"input_path {input_path} is not a file")
+        overrides = request.get("parameters", {})
+        unknown = set(overrides) - (set(self.default_parameters) - SERVER_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unsupported parameters: {', '.join(sorted(unknown))}")
+
+        job = Job({**self.default_parameters, **overrides, "input_path": str(input_path.absolute())})
+        output_path = Path(request.get("output_path") or self.output_folder / f"{job.id}_{input_path.name}")
+        if output_path.exists():
+            raise ValueError(f"output_path {output_path} already exists")
+        job.parameters["output_path"] = str(output_path.absolute())
+
+        with self.lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def get(self: "JobManager", job_id: str) -> Job:
+        """
+        Look up a job
+        :param job_id: id of the job
+        :return: job or None
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self: "JobManager") -> List[Job]:
+        """
+        List all known jobs
+        :return: jobs, oldest first
+        """
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created)
+
+    def work(self: "JobManager", blurrer) -> None:
+        """
+        Worker loop, processes jobs with a resident VideoBlurrer
+        :param blurrer: VideoBlurrer owned by this worker
+        """
+        while True:
+            job = self.queue.get()
+            job.state = "running"
+            job.started = time.time()
+            blurrer.parameters = job.parameters
+            try:
+                blurrer.blur_video(progress_callback=job.set_progress)
+                job.state = "done"
+                exporter.file_finished(True)
+            except Exception as e:
+                job.error = str(e)
+                job.state = "failed"
+                exporter.file_finished(False)
+            job.finished = time.time()
+            self.queue.task_done()
+
+
+def make_handler(manager: JobManager):
+    """
+    Create a request handler class bound to a job manager
+    :param manager: job manager serving the requests
+    :return: request handler class
+    """
+
+    class JobRequestHandler(BaseHTTPRequestHandler):
+        """
+        JSON API:
+        POST /jobs                submit a job, body: {"input_path": ..., "output_path": ..., "parameters": {...}}
+        GET  /jobs                list all jobs
+        GET  /jobs/<id>           state and progress of a job
+        GET  /jobs/<id>/result    download the blurred video of a finished job
+        """
+
+        def send_json(self: "JobRequestHandler", status: HTTPStatus, content) -> None:
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self: "JobRequestHandler") -> None:
+            if self.path.rstrip("/") != "/jobs":
+                self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = manager.submit(json.loads(self.rfile.read(length) or b"{}"))
+            except (ValueError, AttributeError) as e:
+                self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+                return
+            self.send_json(HTTPStatus.CREATED, job.to_dict())
+
+        def do_GET(self: "JobRequestHandler") -> None:
+            if self.path.rstrip("/") == "/jobs":
+                self.send_json(HTTPStatus.OK, [job.to_dict() for job in manager.list()])
+                return
+            match = re.fullmatch(r"/jobs/(?P<id>[0-9a-f]+)(?P<result>/result)?/?", self.path)
+            job = manager.get(match.group("id")) if match else None
+            if job is None:
+                self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            elif not match.group("result"):
+                self.send_json(HTTPStatus.OK, job.to_dict())
+            elif job.state != "done":
+                self.send_json(HTTPStatus.CONFLICT, {"error": f"job is {job.state}"})
+            else:
+                output_path = Path(job.parameters["output_path"])
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(output_path.stat().st_size))
+                self.send_header("Content-Disposition", f'attachment; filename="{output_path.name}"')
+                self.end_headers()
+                with open(output_path, "rb") as f:
+                    shutil.copyfileobj(f, self.wfile)
+
+    return JobRequestHandler
+
+
+def serve(manager: JobManager, host: str = "127.0.0.1", port: int = 8080) -> None:
+    """
+    Serve the job API until interrupted
+    :param manager: job manager serving the requests
+    :param host: interface to bind to, only local by default
+    :param port: port to listen on
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(manager))
+    print(f"Serving blurring jobs on http://{host}:{port}/jobs")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,193 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+from src.blending import draw_shape
+from src.bounds import Bounds
+from src.detection import Detection
+
+# close boxes are only merged if the merged box is at most this much larger than the area the two boxes cover,
+# e.g. two plates next to each other, but not two diagonally adjacent faces
+MAX_MERGE_GROWTH = 1.5
+# points sampled on the ellipse of every merged face to fit the ellipse covering all of them
+ELLIPSE_SAMPLES = 64
+
+
+def pair_statistics(
+    coordinates: np.ndarray, others: np.ndarray, shape, merge_distance: int = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cost and eligibility of merging boxes with each other
+    :param coordinates: array with the rows x_min, y_min, x_max and y_max, one column per box
+    :param others: boxes to pair with every box, same layout
+    :param shape: shape of the frame
+    :param merge_distance: maximum gap in pixels between boxes that are merged, None disables merging close boxes
+    :return: matrices with a row per box of others and a column per box: area the merged box adds to the area both boxes
+             cover, whether the pair is close enough to be merged, and whether an ellipse covering the merged box fits into the frame
+    """
+    x_min, y_min, x_max, y_max = coordinates[:, np.newaxis, :]
+    other_x_min, other_y_min, other_x_max, other_y_max = others[:, :, np.newaxis]
+    union_x_min, union_y_min = np.minimum(x_min, other_x_min), np.minimum(y_min, other_y_min)
+    union_x_max, union_y_max = np.maximum(x_max, other_x_max), np.maximum(y_max, other_y_max)
+    union_area = (union_x_max - union_x_min) * (union_y_max - union_y_min)
+    gap_x = np.maximum(x_min - other_x_max, other_x_min - x_max)
+    gap_y = np.maximum(y_min - other_y_max, other_y_min - y_max)
+    intersection = np.maximum(-gap_x, 0) * np.maximum(-gap_y, 0)
+    covered = (x_max - x_min) * (y_max - y_min) + (other_x_max - other_x_min) * (other_y_max - other_y_min) - intersection
+    extra = union_area - covered
+    if merge_distance is None:
+        close = np.zeros(extra.shape, dtype=bool)
+    else:
+        close = (np.maximum(gap_x, gap_y) <= merge_distance) & (union_area <= MAX_MERGE_GROWTH * covered)
+    # an ellipse through the corners of the merged box, the largest one merged faces need, is sqrt(2) times its size
+    frame_height, frame_width = shape[:2]
+    margin = np.sqrt(2) - 1
+    fits = (union_x_min - margin * (union_x_max - union_x_min) / 2 >= 0) & (union_y_min - margin * (union_y_max - union_y_min) / 2 >= 0)
+    fits &= (union_x_max + margin * (union_x_max - union_x_min) / 2 <= frame_width)
+    fits &= union_y_max + margin * (union_y_max - union_y_min) / 2 <= frame_height
+    return extra, close, fits
+
+
+def merge_detections(detections: List[Detection], shape, merge_distance: int = None, max_regions: int = 0) -> List[Detection]:
+    """
+    Merge detections of a frame into fewer blur regions without uncovering anything. Overlapping and adjacent detections of
+    the same kind are merged first; if more than max_regions remain, the pairs whose merged box adds the least area are
+    merged until the cap is met. A merged box covers the boxes of its members. Faces are blurred as the ellipse inscribed
+    in their box, so merged faces are enlarged until that ellipse covers all of their ellipses.
+    :param detections: detections of a frame
+    :param shape: shape of the frame
+    :param merge_distance: maximum gap in pixels between merged boxes, 0 merges overlapping and touching boxes, None disables it
+    :param max_regions: maximum amount of regions per frame, 0 for no limit
+    :return: merged detections, scored with the best score of their members
+    """
+    if len(detections) < 2 or (merge_distance is None and (not max_regions or len(detections) <= max_regions)):
+        return detections
+    coordinates = np.array([[d.bounds.x_min, d.bounds.y_min, d.bounds.x_max, d.bounds.y_max] for d in detections], dtype=np.float64).T
+    kinds = np.array([d.kind for d in detections])
+    scores = np.array([d.score for d in detections])
+    members = [[index] for index in range(len(detections))]
+
+    # pairwise merge costs, updated for merged boxes only. Only boxes of the same kind are merged, faces only if the
+    # enlarged ellipse fits into the frame, clipping it would uncover parts of them.
+    extra, close, fits = pair_statistics(coordinates, coordinates, shape, merge_distance)
+    allowed = merge_allowed(kinds, kinds, fits)
+    np.fill_diagonal(allowed, False)
+
+    # overlapping and adjacent boxes first, then the cheapest pairs until the cap is met
+    for capping in [False, True]:
+        if capping and not max_regions or not capping and merge_distance is None:
+            continue
+        while len(members) > 1 and not (capping and len(members) <= max_regions):
+            cost = np.where(allowed if capping else allowed & close, extra, np.inf)
+            # merge all pairs that are each other's cheapest partner at once, which always includes the overall cheapest pair
+            partner = np.argmin(cost, axis=1)
+            indices = np.arange(len(members))
+            pairs = np.flatnonzero((partner[partner] == indices) & (indices < partner) & np.isfinite(cost[indices, partner]))
+            if not len(pairs):
+                break
+            if capping:
+                pairs = pairs[np.argsort(cost[pairs, partner[pairs]])][: len(members) - max_regions]
+            first, second = pairs, partner[pairs]
+            coordinates[:2, first] = np.minimum(coordinates[:2, first], coordinates[:2, second])
+            coordinates[2:, first] = np.maximum(coordinates[2:, first], coordinates[2:, second])
+            scores[first] = np.maximum(scores[first], scores[second])
+            for i, j in zip(first, second):
+                members[i] = members[i] + members[j]
+
+            row_extra, row_close, row_fits = pair_statistics(coordinates, coordinates[:, first], shape, merge_distance)
+            row_allowed = merge_allowed(kinds, kinds[first], row_fits)
+            row_allowed[np.arange(len(first)), first] = False
+            for matrix, rows in [(extra, row_extra), (close, row_close), (allowed, row_allowed)]:
+                matrix[first, :] = rows
+                matrix[:, first] = rows.T
+            keep = np.ones(len(members), dtype=bool)
+            keep[second] = False
+            extra, close, allowed = extra[keep][:, keep], close[keep][:, keep], allowed[keep][:, keep]
+            coordinates, kinds, scores = coordinates[:, keep], kinds[keep], scores[keep]
+            members = [group for group, kept in zip(members, keep) if kept]
+
+    merged = []
+    for index, group in enumerate(members):
+        bounds = Bounds(*coordinates[:, index])
+        if kinds[index] == "face" and len(group) > 1:
+            # the ellipse inscribed in the merged box misses parts of its members' ellipses, grow it until it covers them
+            bounds = covering_bounds([detections[member].bounds for member in group], coordinates[:, index], shape)
+            if bounds is None:
+                # no ellipse within the frame covers them, coverage matters more than the cap
+                merged.extend(detections[member] for member in group)
+                continue
+        merged.append(Detection(bounds, float(scores[index]), str(kinds[index])))
+    return merged
+
+
+def merge_allowed(kinds: np.ndarray, other_kinds: np.ndarray, fits: np.ndarray) -> np.ndarray:
+    """
+    Pairs of boxes that may be merged: boxes of the same kind, faces only if an ellipse covering the merged box fits into the frame
+    :param kinds: kind of every box
+    :param other_kinds: kind of every box paired with them, one row each
+    :param fits: whether an ellipse covering the merged box fits into the frame, see pair_statistics
+    :return: matrix with a row per box of other_kinds and a column per box
+    """
+    return (other_kinds[:, np.newaxis] == kinds[np.newaxis, :]) & (fits | (other_kinds != "face")[:, np.newaxis])
+
+
+def covering_scale(members: List[Bounds], box: np.ndarray) -> float:
+    """
+    Factor the ellipse inscribed in a box has to be scaled by to cover the ellipses drawn for the boxes of its members
+    :param members: bounds of the merged faces
+    :param box: x_min, y_min, x_max, y_max of the merged box
+    :return: scale factor of the ellipse's axes, at least 1 and at most sqrt(2), which reaches the corners of the box
+    """
+    angles = np.linspace(0, 2 * np.pi, ELLIPSE_SAMPLES, endpoint=False)
+    center_x, center_y = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+    radius_x, radius_y = max((box[2] - box[0]) / 2, 0.5), max((box[3] - box[1]) / 2, 0.5)
+    scale = 1.0
+    for bounds in members:
+        # the ellipse as draw_shape rasterizes it, with integer center and axes, reaches half a pixel beyond its axes
+        (x, y), (axis_x, axis_y) = bounds.ellipse_coordinates()
+        points_x = x + (axis_x + 0.5) * np.cos(angles)
+        points_y = y + (axis_y + 0.5) * np.sin(angles)
+        distances = np.sqrt(((points_x - center_x) / radius_x) ** 2 + ((points_y - center_y) / radius_y) ** 2)
+        scale = max(scale, float(distances.max()))
+    return min(scale, np.sqrt(2))
+
+
+def covering_bounds(members: List[Bounds], box: np.ndarray, shape) -> Optional[Bounds]:
+    """
+    Bounds of a merged face whose ellipse covers the ellipses of all of its members. The box is scaled by covering_scale,
+    or by sqrt(2) if that is not enough, and grown by a pixel per side to make up for the rounding of the drawn ellipses.
+    Coverage is checked on the ellipses as they are drawn into the frame.
+    :param members: bounds of the merged faces
+    :param box: x_min, y_min, x_max, y_max of the merged box
+    :param shape: shape of the frame
+    :return: bounds of the merged face, None if no candidate covers all members
+    """
+    bounds = Bounds(*box)
+    for scale in [covering_scale(members, box), np.sqrt(2)]:
+        candidate = bounds.scale(shape, scale**2).expand(shape, 1)
+        if covers(candidate, members, shape):
+            return candidate
+    return None
+
+
+def covers(bounds: Bounds, members: List[Bounds], shape) -> bool:
+    """
+    Check whether the ellipse of a box covers the ellipses of other boxes, as draw_shape renders them within the frame
+    :param bounds: box of the covering ellipse
+    :param members: boxes of the covered ellipses
+    :param shape: shape of the frame
+    :return: whether every pixel of the members' ellipses belongs to the covering ellipse
+    """
+    frame_height, frame_width = shape[:2]
+    boxes = [bounds, *members]
+    window = Bounds(
+        max(min(b.x_min for b in boxes), 0),
+        max(min(b.y_min for b in boxes), 0),
+        min(max(b.x_max for b in boxes) + 1, frame_width),
+        min(max(b.y_max for b in boxes) + 1, frame_height),
+    )
+    covered = np.zeros((window.y_max - window.y_min, window.x_max - window.x_min), dtype=np.uint8)
+    draw_shape(covered, "face", bounds.shift(-window.x_min, -window.y_min))
+    needed = np.zeros_like(covered)
+    for member in members:
+        draw_shape(needed, "face", member.shift(-window.x_min, -window.y_min))
+    return not np.any(needed > covered)
@@ -0,0 +1,255 @@
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import psutil
+
+
+class RunMetrics:
+    """
+    Collects per-stage timings and resource usage of a single blurring run
+    """
+
+    def __init__(
+        self: "RunMetrics",
+        blur_workers: int = 1,
+        event_callback: Callable[[Dict], None] = None,
+        event_interval: float = 0.0,
+        observers: List = None,
+    ) -> None:
+        """
+        Constructor
+        :param blur_workers: size of the blurring process pool, used to compute worker utilization
+        :param event_callback: optional function that periodically receives a snapshot of the metrics
+        :param event_interval: seconds between two events, 0 disables events
+        :param observers: objects like the Prometheus exporter that are notified about every measurement
+        """
+        self.blur_workers = blur_workers
+        self.event_callback = event_callback
+        self.event_interval = event_interval
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_calls: Dict[str, int] = {}
+        self.queue_samples: Dict[str, List[int]] = {}
+        self.detections_per_frame: List[int] = []
+        self.regions_per_frame: List[int] = []
+        self.worker_busy_seconds = 0.0
+        self.frames = 0
+        self.inferred_frames = 0
+        self.skipped_inferences = 0
+        self.peak_memory = 0
+        # thread allocation and the thread counts the libraries actually use, set by blur_video
+        self.threads = None
+        self.started = timer()
+        self.last_event = self.started
+        self.process = psutil.Process()
+        self.observers = observers or []
+
+    @contextmanager
+    def stage(self: "RunMetrics", name: str):
+        """
+        Context manager that adds the time spent inside it to a stage
+        :param name: name of the stage
+        """
+        start = timer()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, timer() - start)
+
+    def add_stage_time(self: "RunMetrics", name: str, seconds: float) -> None:
+        """
+        Add time to a stage
+        :param name: name of the stage
+        :param seconds: elapsed time
+        """
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+        self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+        for observer in self.observers:
+            observer.observe_stage(name, seconds)
+
+    def timed_iterator(self: "RunMetrics", name: str, iterable: Iterable) -> Iterator:
+        """
+        Wrap an iterable and add the time spent waiting for each item to a stage
+        :param name: name of the stage
+        :param iterable: iterable to wrap, e.g. a video reader or executor results
+        :return: iterator over the same items
+        """
+        iterator = iter(iterable)
+        while True:
+            start = timer()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_stage_time(name, timer() - start)
+            yield item
+
+    def record_queue(self: "RunMetrics", name: str, depth: int) -> None:
+        """
+        Record a sample of a queue's occupancy
+        :param name: name of the queue
+        :param depth: current amount of items in the queue
+        """
+        self.queue_samples.setdefault(name, []).append(depth)
+        for observer in self.observers:
+            observer.observe_queue(name, depth)
+
+    def record_blur(self: "RunMetrics", seconds: float) -> None:
+        """
+        Record the time a blurring process spent on a frame
+        :param seconds: elapsed time in the worker
+        """
+        self.worker_busy_seconds += seconds
+        for observer in self.observers:
+            observer.observe_blur(seconds)
+
+    def record_inferences(self: "RunMetrics", inferred: int, skipped: int) -> None:
+        """
+        Record how many frames of a batch ran through the detector and how many reused detections, see MotionGate
+        :param inferred: frames detection ran on
+        :param skipped: frames that reused the detections of a previous frame
+        """
+        self.inferred_frames += inferred
+        self.skipped_inferences += skipped
+        for observer in self.observers:
+            observer.observe_inferences(inferred, skipped)
+
+    def record_frames(self: "RunMetrics", detections: List[int], regions: List[int] = None) -> None:
+        """
+        Record a finished batch of frames
+        :param detections: amount of detections for each frame of the batch
+        :param regions: amount of blur regions for each frame after merging detections, defaults to the detections
+        """
+        self.frames += len(detections)
+        self.detections_per_frame.extend(detections)
+        self.regions_per_frame.extend(detections if regions is None else regions)
+        self.sample_memory()
+        for observer in self.observers:
+            observer.observe_frames(detections)
+        if self.event_callback and self.event_interval and timer() - self.last_event >= self.event_interval:
+            self.last_event = timer()
+            self.event_callback(self.summary())
+
+    def sample_memory(self: "RunMetrics") -> None:
+        """
+        Update the peak resident memory of this process and its blurring processes
+        """
+        memory = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                memory += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        self.peak_memory = max(self.peak_memory, memory)
+
+    def summary(self: "RunMetrics") -> Dict[str, Union[int, float, Dict]]:
+        """
+        Machine-readable summary of the run so far
+        :return: metrics dictionary
+        """
+        elapsed = timer() - self.started
+        stages = {
+            name: {
+                "seconds": seconds,
+                "calls": self.stage_calls[name],
+                "share": seconds / elapsed if elapsed else 0.0,
+                "ms_per_frame": seconds / self.frames * 1000 if self.frames else 0.0,
+            }
+            for name, seconds in self.stage_seconds.items()
+        }
+        queues = {
+            name: {"mean": sum(samples) / len(samples), "max": max(samples)}
+            for name, samples in self.queue_samples.items()
+        }
+        detections = self.detections_per_frame
+        regions = self.regions_per_frame
+        return {
+            "timestamp": time.time(),
+            "elapsed_seconds": elapsed,
+            "frames": self.frames,
+            "frames_per_second": self.frames / elapsed if elapsed else 0.0,
+            "limiting_stage": max(self.stage_seconds, key=self.stage_seconds.get) if self.stage_seconds else None,
+            "stages": stages,
+            "queues": queues,
+            "blur_worker_utilization": self.worker_busy_seconds / (elapsed * self.blur_workers) if elapsed else 0.0,
+            "detections_per_frame": {
+                "mean": sum(detections) / len(detections) if detections else 0.0,
+                "p99": sorted(detections)[int(0.99 * (len(detections) - 1))] if detections else 0,
+                "max": max(detections) if detections else 0,
+                "total": sum(detections),
+            },
+            "regions_per_frame": {
+                "mean": sum(regions) / len(regions) if regions else 0.0,
+                "p99": sorted(regions)[int(0.99 * (len(regions) - 1))] if regions else 0,
+                "max": max(regions) if regions else 0,
+                "total": sum(regions),
+            },
+            "inference_gating": {
+                "inferred_frames": self.inferred_frames,
+                "skipped_frames": self.skipped_inferences,
+                "skipped_fraction": self.skipped_inferences / (self.inferred_frames + self.skipped_inferences)
+                if self.inferred_frames + self.skipped_inferences
+                else 0.0,
+            },
+            "peak_memory_bytes": self.peak_memory,
+            "threads": self.threads,
+        }
+
+    def write(self: "RunMetrics", path: Union[str, Path]) -> None:
+        """
+        Write the final summary as JSON
+        :param path: output file
+        """
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class ThroughputMeter:
+    """
+    Smoothed frames per second and estimated remaining time of a run, fed with the progress after every batch
+    """
+
+    def __init__(self: "ThroughputMeter", smoothing: float = 0.3) -> None:
+        """
+        Constructor
+        :param smoothing: weight of the latest batch in the exponential moving average of the frame rate
+        """
+        self.smoothing = smoothing
+        self.fps = 0.0
+        self.last_frames = 0
+        self.last_time = None
+
+    def update(self: "ThroughputMeter", processed_frames: int, total_frames: int, now: float = None) -> Tuple[float, float]:
+        """
+        Account for a finished batch
+        :param processed_frames: amount of frames processed so far
+        :param total_frames: total amount of frames of the run
+        :param now: timestamp of the update, defaults to the current time
+        :return: smoothed frames per second and estimated remaining seconds, NaN until the first batch is finished
+        """
+        now = timer() if now is None else now
+        if self.last_time is not None and processed_frames > self.last_frames and now > self.last_time:
+            batch_fps = (processed_frames - self.last_frames) / (now - self.last_time)
+            self.fps = batch_fps if not self.fps else self.smoothing * batch_fps + (1 - self.smoothing) * self.fps
+        self.last_frames, self.last_time = processed_frames, now
+        if not self.fps:
+            return self.fps, float("nan")
+        return self.fps, max(total_frames - processed_frames, 0) / self.fps
+
+
+def json_lines_writer(path: Union[str, Path]) -> Callable[[Dict], None]:
+    """
+    Create an event callback that appends every event as a line of JSON to a file
+    :param path: output file
+    :return: event callback
+    """
+
+    def write_event(event: Dict) -> None:
+        with open(path, "a") as f:
+            f.write(json.dumps(event) + "\n")
+
+    return write_event
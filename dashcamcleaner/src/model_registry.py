@@ -0,0 +1,92 @@
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+from src.prometheus import exporter
+from src.weights import get_weights_path
+
+
+class ModelRegistry:
+    """
+    Process wide cache of loaded and warmed up detectors, so every weights file is only loaded once per process
+    """
+
+    def __init__(self: "ModelRegistry") -> None:
+        self.models: Dict[Path, object] = {}
+        self.inference_locks: Dict[Path, threading.Lock] = {}
+        self.warmed_up: set = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_detector(self: "ModelRegistry", weights_name: str, inference_size: int) -> Tuple[object, threading.Lock]:
+        """
+        Get a shared detector for a weights file, loading and warming it up on first use
+        :param weights_name: file name of the weights to be used
+        :param inference_size: inference size the detector is warmed up for
+        :return: detector and the lock that has to be held while running inference with it
+        """
+        weights_path = get_weights_path(weights_name)
+        with self.lock:
+            if weights_path in self.models:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.models[weights_path] = setup_detector(weights_path)
+                self.inference_locks[weights_path] = threading.Lock()
+            model, inference_lock = self.models[weights_path], self.inference_locks[weights_path]
+
+        with inference_lock:
+            if (weights_path, inference_size) not in self.warmed_up:
+                warmup_detector(model, inference_size)
+                self.warmed_up.add((weights_path, inference_size))
+        return model, inference_lock
+
+    def cache_statistics(self: "ModelRegistry") -> Tuple[int, int]:
+        """
+        Cache statistics for the Prometheus exporter
+        :return: hits and misses
+        """
+        return self.hits, self.misses
+
+    def clear(self: "ModelRegistry") -> None:
+        """
+        Drop all cached detectors
+        """
+        with self.lock:
+            self.models.clear()
+            self.inference_locks.clear()
+            self.warmed_up.clear()
+
+
+def setup_detector(weights_path: str):
+    """
+    Load YOLOv8 detector and update the detector with this repo's weights
+    :param weights_path: path to .pt file with this repo's weights
+    :return: initialized yolov8 detector
+    """
+    # torch and ultralytics take seconds to import, only pay for them once a detector is actually needed
+    import torch
+    from ultralytics import YOLO
+
+    model = YOLO(weights_path)
+    if torch.cuda.is_available():
+        print(f"Using {torch.cuda.get_device_name(torch.cuda.current_device())}.")
+    else:
+        print("Using CPU.")
+    return model
+
+
+def warmup_detector(model, inference_size: int) -> None:
+    """
+    Run a single inference on a blank frame so layer fusing and memory allocation do not slow down the first real batch
+    :param model: detector to warm up
+    :param inference_size: inference size to warm up for
+    """
+    blank_frame = np.zeros((int(inference_size * 9 / 16), inference_size, 3), dtype=np.uint8)
+    model([blank_frame], imgsz=[inference_size], verbose=False)
+
+
+registry = ModelRegistry()
+exporter.register_cache("model", registry.cache_statistics)
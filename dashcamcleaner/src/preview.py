@@ -0,0 +1,145 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import cv2
+import imageio_ffmpeg
+import numpy as np
+from src.blurrer import apply_blur
+from src.detection import Detection
+
+# detections are cached down to this score, so changing the threshold above it needs no inference
+PREVIEW_THRESHOLD = 0.05
+# decoded frames kept around, enough to step through a few seconds of video without decoding again
+MAX_CACHED_FRAMES = 64
+
+
+class PreviewSession:
+    """
+    Decoded frames and raw detections around a frame of a video, so blurring parameters can be previewed without rendering
+    the whole video. Frames are only decoded and detections only run once, changing any parameter except for the weights,
+    the inference size or a larger blur memory only re-renders the blur.
+    """
+
+    def __init__(self: "PreviewSession") -> None:
+        self.input_path = None
+        self.fps = None
+        self.detector_key = None
+        self.frames: Dict[int, np.ndarray] = {}
+        self.detections: Dict[int, List[Detection]] = {}
+
+    def needed_frames(self: "PreviewSession", index: int, blur_memory: int) -> range:
+        """
+        Frames whose detections are blurred in a frame
+        :param index: frame index
+        :param blur_memory: amount of previous frames whose detections are blurred as well
+        :return: frame indices
+        """
+        return range(max(index - blur_memory, 0), index + 1)
+
+    def is_loaded(self: "PreviewSession", input_path: str, index: int, blur_memory: int, detector_key: Tuple) -> bool:
+        """
+        Check whether a frame can be rendered without decoding or inference
+        :param input_path: input video
+        :param index: frame index
+        :param blur_memory: amount of previous frames whose detections are blurred as well
+        :param detector_key: detector and inference size, see detector_key
+        :return: whether render can be called right away
+        """
+        return (
+            input_path == self.input_path
+            and detector_key == self.detector_key
+            and index in self.frames
+            and all(i in self.detections for i in self.needed_frames(index, blur_memory))
+        )
+
+    def load(self: "PreviewSession", blurrer, input_path: str, index: int, blur_memory: int) -> None:
+        """
+        Decode and run detection on all frames a preview of a frame needs, skipping those that are cached already
+        :param blurrer: VideoBlurrer providing the detector
+        :param input_path: input video
+        :param index: frame index
+        :param blur_memory: amount of previous frames whose detections are blurred as well
+        """
+        if input_path != self.input_path:
+            self.fps = get_fps(Path(input_path))
+            self.input_path = input_path
+            self.frames, self.detections = {}, {}
+        if detector_key(blurrer) != self.detector_key:
+            self.detector_key = detector_key(blurrer)
+            self.detections = {}
+
+        needed = self.needed_frames(index, blur_memory)
+        missing_frames = [i for i in needed if i not in self.frames]
+        if missing_frames:
+            for i, frame in read_frame_range(Path(input_path), self.fps, missing_frames[0], missing_frames[-1] + 1):
+                self.frames[i] = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        if index not in self.frames:
+            raise ValueError(f"{input_path} has no frame {index}.")
+
+        missing_detections = [i for i in needed if i in self.frames and i not in self.detections]
+        if missing_detections:
+            images = [self.frames[i] for i in missing_detections]
+            for i, detections in zip(missing_detections, blurrer.detect_identifiable_information(images, PREVIEW_THRESHOLD)):
+                self.detections[i] = detections
+
+        # forget the frames farthest away from the current one, their detections are tiny and kept
+        for i in sorted(self.frames, key=lambda i: abs(i - index))[MAX_CACHED_FRAMES:]:
+            del self.frames[i]
+
+    def render(self: "PreviewSession", index: int, parameters: Dict) -> np.ndarray:
+        """
+        Blur a loaded frame with the given parameters
+        :param index: frame index
+        :param parameters: blurring parameters, the threshold filters the cached detections
+        :return: processed BGR frame, or the rendered mask if a mask export is requested
+        """
+        threshold = parameters["threshold"]
+        detections = {
+            i: [detection for detection in frame_detections if detection.score >= threshold]
+            for i, frame_detections in self.detections.items()
+        }
+        return apply_blur(self.frames[index], index, detections, parameters)
+
+
+def get_fps(input_path: Path) -> float:
+    """
+    Frames per second of a video, read from its header. Probing with OpenCV takes about a third of starting an ffmpeg reader.
+    :param input_path: input video
+    :return: frames per second
+    """
+    capture = cv2.VideoCapture(str(input_path))
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    if fps <= 0:
+        raise ValueError(f"Could not read the frame rate of {input_path}.")
+    return fps
+
+
+def read_frame_range(input_path: Path, fps: float, start: int, stop: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Decode consecutive frames. ffmpeg seeks to the keyframe before the first frame and decodes from there, so unlike
+    read_frames of the QA mode, which decodes everything up to the selected frames, the latency does not grow with the position.
+    :param input_path: input video
+    :param fps: frames per second of the video
+    :param start: index of the first frame
+    :param stop: index after the last frame
+    :return: iterator of frame index and RGB frame, ends early at the end of the video
+    """
+    # seeking half a frame early makes ffmpeg drop every frame before start, independent of rounding of the timestamps
+    position = max(start - 0.5, 0) / fps
+    reader = imageio_ffmpeg.read_frames(str(input_path), input_params=["-ss", f"{position:.6f}"], output_params=["-frames:v", str(stop - start)])
+    try:
+        width, height = next(reader)["size"]
+        for index, frame in zip(range(start, stop), reader):
+            yield index, np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3)
+    finally:
+        reader.close()
+
+
+def detector_key(blurrer) -> Tuple:
+    """
+    Identify the detector and inference size detections were made with
+    :param blurrer: VideoBlurrer providing the detector
+    :return: hashable key
+    """
+    return id(blurrer.detector), blurrer.parameters["inference_size"]
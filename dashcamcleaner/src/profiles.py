@@ -0,0 +1,160 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from src.bounds import Bounds
+from src.detection import Detection
+
+PROFILES_FOLDER = Path(__file__).resolve().parents[1] / "profiles"
+
+
+class CameraProfile:
+    """
+    Static layout of a camera's frames: the region detection runs on and regions that never need blurring,
+    like the hood or a burned-in timestamp. Coordinates are relative to the frame size (0 to 1), so a profile
+    works for every resolution of a camera.
+    """
+
+    def __init__(
+        self: "CameraProfile",
+        name: str,
+        crop: Sequence[float] = (0.0, 0.0, 1.0, 1.0),
+        exclusions: Sequence[Sequence[float]] = (),
+    ) -> None:
+        """
+        Constructor
+        :param name: name of the profile
+        :param crop: relative x_min, y_min, x_max and y_max of the region detection runs on
+        :param exclusions: relative x_min, y_min, x_max and y_max of every region in which detections are ignored
+        """
+        for region in [crop, *exclusions]:
+            if len(region) != 4 or not 0 <= region[0] < region[2] <= 1 or not 0 <= region[1] < region[3] <= 1:
+                raise ValueError(f"Invalid region {list(region)} in profile {name}, expected relative x_min, y_min, x_max, y_max.")
+        self.name = name
+        self.crop = tuple(crop)
+        self.exclusions = [tuple(region) for region in exclusions]
+
+    @staticmethod
+    def from_dict(name: str, content: dict) -> "CameraProfile":
+        """
+        Create a profile from its JSON representation
+        :param name: name of the profile
+        :param content: dictionary with optional crop and exclusions
+        :return: profile
+        """
+        return CameraProfile(name, content.get("crop", (0.0, 0.0, 1.0, 1.0)), content.get("exclusions", []))
+
+    def crop_bounds(self: "CameraProfile", shape) -> Bounds:
+        """
+        Pixel coordinates of the inference crop
+        :param shape: shape of the frame
+        :return: crop bounds
+        """
+        return to_bounds(self.crop, shape)
+
+    def inference_size(self: "CameraProfile", shape, inference_size: int) -> int:
+        """
+        Inference size for the crop that keeps the detector's scale of the full frame, so the crop saves work instead of
+        upscaling the cropped region
+        :param shape: shape of the frame
+        :param inference_size: inference size for full frames
+        :return: inference size for crops, a multiple of 32 like YOLO's strides require
+        """
+        crop = self.crop_bounds(shape)
+        ratio = max(crop.x_max - crop.x_min, crop.y_max - crop.y_min) / max(shape[:2])
+        return max(32, round(inference_size * ratio / 32) * 32)
+
+    def crop_images(self: "CameraProfile", images: list) -> Tuple[list, Bounds]:
+        """
+        Cut the inference crop out of frames of the same size
+        :param images: frames
+        :return: crops and their bounds within the frames
+        """
+        crop = self.crop_bounds(images[0].shape)
+        return [image[crop.coords_as_slices()] for image in images], crop
+
+    def exclusion_bounds(self: "CameraProfile", shape) -> List[Bounds]:
+        """
+        Pixel coordinates of the exclusion regions
+        :param shape: shape of the frame
+        :return: bounds of every exclusion region
+        """
+        return [to_bounds(exclusion, shape) for exclusion in self.exclusions]
+
+    def is_excluded(self: "CameraProfile", detection: Detection, shape) -> bool:
+        """
+        Check whether a detection lies completely within an exclusion region. Detections reaching out of a region are kept,
+        apply_blur only blurs their part outside of it, see restore_exclusions.
+        :param detection: detection in frame coordinates
+        :param shape: shape of the frame
+        :return: whether the detection should be dropped
+        """
+        bounds = detection.bounds
+        return any(
+            region.x_min <= bounds.x_min and region.y_min <= bounds.y_min and bounds.x_max <= region.x_max and bounds.y_max <= region.y_max
+            for region in self.exclusion_bounds(shape)
+        )
+
+    def restore_exclusions(self: "CameraProfile", processed: np.ndarray, frame: np.ndarray, detections: List[Detection]) -> None:
+        """
+        Undo blurring within the exclusion regions, e.g. of a plate reaching into the hood region or of a face next to a
+        timestamp overlay, whose part outside of the region stays blurred
+        :param processed: blurred frame or rendered mask, modified in place
+        :param frame: frame before blurring, or None to clear a mask
+        :param detections: blurred detections, expanded by the feathering
+        """
+        for region in self.exclusion_bounds(processed.shape):
+            if not any(
+                d.bounds.x_min < region.x_max and region.x_min < d.bounds.x_max and d.bounds.y_min < region.y_max and region.y_min < d.bounds.y_max
+                for d in detections
+            ):
+                continue
+            if frame is None:
+                processed[region.coords_as_slices()] = 0
+            else:
+                processed[region.coords_as_slices()] = frame[region.coords_as_slices()]
+
+    def filter_detections(self: "CameraProfile", detections: List[Detection], shape) -> List[Detection]:
+        """
+        Drop detections within exclusion regions
+        :param detections: detections of a frame
+        :param shape: shape of the frame
+        :return: remaining detections
+        """
+        return [detection for detection in detections if not self.is_excluded(detection, shape)]
+
+
+def to_bounds(region: Sequence[float], shape) -> Bounds:
+    """
+    Convert a relative region to pixel coordinates
+    :param region: relative x_min, y_min, x_max and y_max
+    :param shape: shape of the frame
+    :return: bounds in pixels
+    """
+    height, width = shape[:2]
+    return Bounds(round(region[0] * width), round(region[1] * height), round(region[2] * width), round(region[3] * height))
+
+
+def get_profile_path(profile: str) -> Path:
+    """
+    Resolve a profile name to its JSON file in the profiles folder, paths to JSON files are used as they are
+    :param profile: name or path of the profile
+    :return: path to the JSON file
+    """
+    if profile.endswith(".json"):
+        return Path(profile)
+    return PROFILES_FOLDER / f"{profile}.json"
+
+
+@lru_cache(maxsize=None)
+def load_profile(profile: str) -> CameraProfile:
+    """
+    Load a camera profile, cached since it is looked up for every batch
+    :param profile: name or path of the profile
+    :return: profile
+    """
+    path = get_profile_path(profile)
+    with open(path, "r") as f:
+        return CameraProfile.from_dict(path.stem, json.load(f))
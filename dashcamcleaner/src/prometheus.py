@@ -0,0 +1,229 @@
+import bisect
+import threading
+import time
+from collections import deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense
+    """
+
+    def __init__(self: "Histogram", buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self: "Histogram", value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self: "Histogram", name: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class MetricsExporter:
+    """
+    Process wide collection of blurring metrics, rendered in the Prometheus text exposition format.
+    Fed by RunMetrics as an observer, so every blurring loop reports to it.
+    """
+
+    def __init__(self: "MetricsExporter", fps_window: float = 10.0) -> None:
+        """
+        Constructor
+        :param fps_window: seconds over which frames per second are averaged
+        """
+        self.lock = threading.Lock()
+        self.fps_window = fps_window
+        self.frames_processed = 0
+        self.detections = 0
+        self.inferred_frames = 0
+        self.skipped_inferences = 0
+        self.files_processed = 0
+        self.files_failed = 0
+        self.inference_latency = Histogram()
+        self.blur_latency = Histogram()
+        self.queue_depths: Dict[str, int] = {}
+        self.recent_frames: deque = deque()
+        self.caches: Dict[str, Callable[[], Tuple[int, int]]] = {}
+        self.server = None
+
+    def observe_stage(self: "MetricsExporter", name: str, seconds: float) -> None:
+        """
+        RunMetrics observer: a stage took some time
+        :param name: name of the stage
+        :param seconds: elapsed time
+        """
+        if name == "detector":
+            with self.lock:
+                self.inference_latency.observe(seconds)
+
+    def observe_blur(self: "MetricsExporter", seconds: float) -> None:
+        """
+        RunMetrics observer: a blur worker finished a frame
+        :param seconds: time the worker spent on the frame
+        """
+        with self.lock:
+            self.blur_latency.observe(seconds)
+
+    def observe_queue(self: "MetricsExporter", name: str, depth: int) -> None:
+        """
+        RunMetrics observer: a queue's occupancy was sampled
+        :param name: name of the queue
+        :param depth: current amount of items in the queue
+        """
+        with self.lock:
+            self.queue_depths[name] = depth
+
+    def observe_frames(self: "MetricsExporter", detections: List[int]) -> None:
+        """
+        RunMetrics observer: a batch of frames was written
+        :param detections: amount of detections for each frame of the batch
+        """
+        now = time.time()
+        with self.lock:
+            self.frames_processed += len(detections)
+            self.detections += sum(detections)
+            self.recent_frames.append((now, len(detections)))
+            while self.recent_frames and self.recent_frames[0][0] < now - self.fps_window:
+                self.recent_frames.popleft()
+
+    def observe_inferences(self: "MetricsExporter", inferred: int, skipped: int) -> None:
+        """
+        RunMetrics observer: frames of a batch ran through the detector or reused detections
+        :param inferred: frames detection ran on
+        :param skipped: frames that reused the detections of a previous frame
+        """
+        with self.lock:
+            self.inferred_frames += inferred
+            self.skipped_inferences += skipped
+
+    def file_finished(self: "MetricsExporter", success: bool) -> None:
+        """
+        Count a processed or failed file
+        :param success: whether the file was blurred successfully
+        """
+        with self.lock:
+            if success:
+                self.files_processed += 1
+            else:
+                self.files_failed += 1
+
+    def register_cache(self: "MetricsExporter", name: str, statistics: Callable[[], Tuple[int, int]]) -> None:
+        """
+        Register a cache whose hit rate should be exported
+        :param name: name of the cache
+        :param statistics: function returning the cache's hits and misses
+        """
+        self.caches[name] = statistics
+
+    def frames_per_second(self: "MetricsExporter") -> float:
+        """
+        Frames per second over the last fps_window seconds
+        :return: frames per second
+        """
+        now = time.time()
+        frames = sum(count for timestamp, count in self.recent_frames if timestamp >= now - self.fps_window)
+        return frames / self.fps_window
+
+    def render(self: "MetricsExporter") -> str:
+        """
+        Render all metrics in the text exposition format
+        :return: exposition text
+        """
+        with self.lock:
+            lines = [
+                "# HELP dashcamcleaner_frames_processed_total Frames blurred and written.",
+                "# TYPE dashcamcleaner_frames_processed_total counter",
+                f"dashcamcleaner_frames_processed_total {self.frames_processed}",
+                "# HELP dashcamcleaner_frames_per_second Frames written per second, averaged over a sliding window.",
+                "# TYPE dashcamcleaner_frames_per_second gauge",
+                f"dashcamcleaner_frames_per_second {self.frames_per_second()}",
+                "# HELP dashcamcleaner_detections_total Detections of faces and plates.",
+                "# TYPE dashcamcleaner_detections_total counter",
+                f"dashcamcleaner_detections_total {self.detections}",
+                "# HELP dashcamcleaner_inferred_frames_total Frames the detector ran on.",
+                "# TYPE dashcamcleaner_inferred_frames_total counter",
+                f"dashcamcleaner_inferred_frames_total {self.inferred_frames}",
+                "# HELP dashcamcleaner_skipped_inferences_total Frames that reused detections because nothing moved.",
+                "# TYPE dashcamcleaner_skipped_inferences_total counter",
+                f"dashcamcleaner_skipped_inferences_total {self.skipped_inferences}",
+                "# HELP dashcamcleaner_files_processed_total Videos blurred successfully.",
+                "# TYPE dashcamcleaner_files_processed_total counter",
+                f"dashcamcleaner_files_processed_total {self.files_processed}",
+                "# HELP dashcamcleaner_files_failed_total Videos that could not be blurred.",
+                "# TYPE dashcamcleaner_files_failed_total counter",
+                f"dashcamcleaner_files_failed_total {self.files_failed}",
+                "# HELP dashcamcleaner_inference_latency_seconds Detector latency per call, i.e. per batch of frames or tiles.",
+                "# TYPE dashcamcleaner_inference_latency_seconds histogram",
+                *self.inference_latency.render("dashcamcleaner_inference_latency_seconds"),
+                "# HELP dashcamcleaner_blur_latency_seconds Blur worker latency per frame.",
+                "# TYPE dashcamcleaner_blur_latency_seconds histogram",
+                *self.blur_latency.render("dashcamcleaner_blur_latency_seconds"),
+                "# HELP dashcamcleaner_queue_depth Last sampled occupancy of the pipeline's queues, e.g. blurred frames waiting for the encoder.",
+                "# TYPE dashcamcleaner_queue_depth gauge",
+                *[f'dashcamcleaner_queue_depth{{queue="{name}"}} {depth}' for name, depth in sorted(self.queue_depths.items())],
+            ]
+        cache_statistics = {name: statistics() for name, statistics in sorted(self.caches.items())}
+        lines.extend(
+            [
+                "# HELP dashcamcleaner_cache_hits_total Lookups served from a cache.",
+                "# TYPE dashcamcleaner_cache_hits_total counter",
+                *[f'dashcamcleaner_cache_hits_total{{cache="{name}"}} {hits}' for name, (hits, _) in cache_statistics.items()],
+                "# HELP dashcamcleaner_cache_misses_total Lookups that missed a cache.",
+                "# TYPE dashcamcleaner_cache_misses_total counter",
+                *[f'dashcamcleaner_cache_misses_total{{cache="{name}"}} {misses}' for name, (_, misses) in cache_statistics.items()],
+                "# HELP dashcamcleaner_cache_hit_ratio Share of lookups served from a cache.",
+                "# TYPE dashcamcleaner_cache_hit_ratio gauge",
+                *[
+                    f'dashcamcleaner_cache_hit_ratio{{cache="{name}"}} {hits / (hits + misses) if hits + misses else 0.0}'
+                    for name, (hits, misses) in cache_statistics.items()
+                ],
+            ]
+        )
+        return "\n".join(lines) + "\n"
+
+    def start_server(self: "MetricsExporter", port: int, host: str = "127.0.0.1") -> None:
+        """
+        Serve the metrics on http://host:port/metrics from a background thread
+        :param port: port to listen on
+        :param host: interface to bind to, only local by default
+        """
+        exporter = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self: "MetricsRequestHandler") -> None:
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(HTTPStatus.NOT_FOUND)
+                    return
+                body = exporter.render().encode()
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self: "MetricsRequestHandler", format: str, *args) -> None:
+                # scrapes every few seconds would drown the progress output
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-exporter", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+exporter = MetricsExporter()
@@ -0,0 +1,286 @@
+import json
+import tempfile
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import cv2
+import imageio
+import imageio_ffmpeg
+import numpy as np
+from more_itertools import chunked
+from src.detection import Detection
+from tqdm import tqdm
+
+# BGR colors of the overlays, faces red and plates green like the colored mask export
+KIND_COLORS = {"face": (0, 0, 255), "plate": (0, 255, 0)}
+PREVIOUS_COLOR = (0, 255, 255)
+
+
+def load_detections(path: Path) -> Dict[int, List[Detection]]:
+    """
+    Load cached detections as written by --export_json
+    :param path: JSON file
+    :return: detections per frame index
+    """
+    with open(path, "r") as f:
+        content = json.load(f)
+    return {int(index): [Detection.from_dict(detection) for detection in detections] for index, detections in content.items()}
+
+
+def save_detections(path: Path, frame_detections: Dict[int, List[Detection]]) -> None:
+    """
+    Cache detections in the same format as --export_json
+    :param path: JSON file
+    :param frame_detections: detections per frame index
+    """
+    with open(path, "w") as f:
+        json.dump(frame_detections, f, default=vars, indent=2)
+
+
+def detect_video(blurrer, input_path: Path, batch_size: int) -> Dict[int, List[Detection]]:
+    """
+    Run detection on every frame of a video without blurring or encoding anything
+    :param blurrer: VideoBlurrer providing the detector
+    :param input_path: input video
+    :param batch_size: inference batch size
+    :return: detections per frame index
+    """
+    frame_detections = {}
+    with imageio.get_reader(input_path) as reader:
+        meta = reader.get_meta_data()
+        length = int(meta["duration"] * meta["fps"])
+        with tqdm(total=length, desc="Detecting", unit="frames", dynamic_ncols=True) as progress_bar:
+            for frame_batch in chunked(reader, batch_size):
+                frame_buffer = [cv2.cvtColor(frame_read, cv2.COLOR_BGR2RGB) for frame_read in frame_batch]
+                for detections in blurrer.detect_identifiable_information(frame_buffer):
+                    frame_detections[len(frame_detections)] = detections
+                progress_bar.update(len(frame_batch))
+    return frame_detections
+
+
+def select_frames(
+    frame_detections: Dict[int, List[Detection]], interval: int, low_confidence: float, max_gap: int
+) -> Dict[int, List[str]]:
+    """
+    Pick a sparse set of frames worth reviewing
+    :param frame_detections: detections per frame index
+    :param interval: minimum amount of frames between two samples taken for the same reason
+    :param low_confidence: detections with a lower score are sampled as "low_confidence"
+    :param max_gap: frames in which a kind of detection vanishes for at most this many frames are sampled as "dropout"
+    :return: reasons per sampled frame index
+    """
+    candidates: List[Tuple[int, str]] = []
+    for index, detections in frame_detections.items():
+        if detections:
+            candidates.append((index, "detections"))
+        if any(detection.score < low_confidence for detection in detections):
+            candidates.append((index, "low_confidence"))
+
+    # a detection that disappears for a few frames and comes back is most likely a missed detection
+    for kind in KIND_COLORS:
+        present = sorted(index for index, detections in frame_detections.items() if any(d.kind == kind for d in detections))
+        for previous, following in zip(present, present[1:]):
+            if 1 < following - previous <= max_gap + 1:
+                candidates.append((previous + 1, "dropout"))
+
+    samples = defaultdict(list)
+    last_sample: Dict[str, int] = {}
+    for index, reason in sorted(candidates):
+        if reason in samples[index]:
+            continue
+        if reason not in last_sample or index - last_sample[reason] >= interval:
+            samples[index].append(reason)
+            last_sample[reason] = index
+    return {index: reasons for index, reasons in sorted(samples.items()) if reasons}
+
+
+def select_expression(indices: List[int]) -> str:
+    """
+    Expression for ffmpeg's select filter matching the given frames, runs of consecutive frames become a single term
+    :param indices: ascending frame indices
+    :return: expression with escaped commas, for a filtergraph
+    """
+    runs: List[List[int]] = []
+    for index in indices:
+        if runs and index == runs[-1][1] + 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return "+".join(f"eq(n\\,{first})" if first == last else f"between(n\\,{first}\\,{last})" for first, last in runs)
+
+
+def read_frames(input_path: Path, indices: List[int]) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Decode only the given frames in a single pass. ffmpeg's select filter drops all other frames right after decoding,
+    so they are neither converted to RGB nor sent through the pipe, unlike when seeking with imageio's reader.
+    The filter is passed as a script, which is not limited in length like the command line, and ffmpeg stops after the last frame.
+    :param input_path: input video
+    :param indices: ascending frame indices
+    :return: iterator of frame index and RGB frame
+    """
+    if not indices:
+        return
+    with tempfile.TemporaryDirectory() as temp_folder:
+        filter_script = Path(temp_folder) / "select.txt"
+        filter_script.write_text(f"select={select_expression(indices)}")
+        reader = imageio_ffmpeg.read_frames(
+            str(input_path), output_params=["-filter_script:v", str(filter_script), "-vsync", "0", "-frames:v", str(len(indices))]
+        )
+        try:
+            width, height = next(reader)["size"]
+            for index, frame in zip(indices, reader):
+                yield index, np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3)
+        finally:
+            reader.close()
+
+
+def annotate(
+    frame: np.ndarray, index: int, fps: float, detections: List[Detection], previous: List[Detection], reasons: List[str], width: int
+) -> np.ndarray:
+    """
+    Draw detections onto a downscaled copy of a frame
+    :param frame: RGB frame as read by imageio
+    :param index: frame index
+    :param fps: frames per second of the video, for the timestamp
+    :param detections: detections of this frame
+    :param previous: detections of the previous frame, drawn for dropouts
+    :param reasons: why this frame was sampled
+    :param width: width of the thumbnail
+    :return: BGR thumbnail
+    """
+    scale = width / frame.shape[1]
+    thumbnail = cv2.resize(frame, (width, round(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_RGB2BGR)
+
+    def corners(detection: Detection) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        bounds = detection.bounds
+        return (round(bounds.x_min * scale), round(bounds.y_min * scale)), (round(bounds.x_max * scale), round(bounds.y_max * scale))
+
+    if "dropout" in reasons:
+        for detection in previous:
+            cv2.rectangle(thumbnail, *corners(detection), PREVIOUS_COLOR, 1)
+    for detection in detections:
+        top_left, bottom_right = corners(detection)
+        cv2.rectangle(thumbnail, top_left, bottom_right, KIND_COLORS[detection.kind], 2)
+        cv2.putText(
+            thumbnail, f"{detection.score:.2f}", (top_left[0], max(top_left[1] - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, KIND_COLORS[detection.kind], 1
+        )
+
+    seconds = index / fps
+    caption = f"#{index} {int(seconds // 60):02d}:{seconds % 60:05.2f} {', '.join(reasons)}"
+    cv2.putText(thumbnail, caption, (5, thumbnail.shape[0] - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3)
+    cv2.putText(thumbnail, caption, (5, thumbnail.shape[0] - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    return thumbnail
+
+
+def contact_sheet(thumbnails: List[np.ndarray], columns: int) -> np.ndarray:
+    """
+    Tile thumbnails of the same size into a single image
+    :param thumbnails: BGR thumbnails
+    :param columns: thumbnails per row
+    :return: BGR contact sheet
+    """
+    height, width = thumbnails[0].shape[:2]
+    rows = -(-len(thumbnails) // columns)
+    sheet = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for position, thumbnail in enumerate(thumbnails):
+        row, column = divmod(position, columns)
+        sheet[row * height:(row + 1) * height, column * width:(column + 1) * width] = thumbnail
+    return sheet
+
+
+def write_thumbnail(path: Path, arguments: tuple) -> None:
+    """
+    Annotate a frame and write it as JPEG
+    :param path: output image
+    :param arguments: arguments for annotate
+    """
+    cv2.imwrite(str(path), annotate(*arguments), [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+
+def write_sheet(path: Path, tiles: List[Future], columns: int) -> None:
+    """
+    Write a contact sheet as JPEG once all of its thumbnails are annotated
+    :param path: output image
+    :param tiles: futures of annotated thumbnails, submitted to the same pool before this function
+    :param columns: thumbnails per row
+    """
+    cv2.imwrite(str(path), contact_sheet([tile.result() for tile in tiles], columns), [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+
+def write_review(
+    input_path: Path,
+    output_folder: Path,
+    frame_detections: Dict[int, List[Detection]],
+    samples: Dict[int, List[str]],
+    thumbnail_width: int = 480,
+    sheet_size: Tuple[int, int] = None,
+    workers: int = 4,
+) -> List[Path]:
+    """
+    Write annotated thumbnails or contact sheets of the sampled frames. Only sampled frames are converted to RGB,
+    annotating and JPEG encoding happens in a thread pool while the next frames are decoded.
+    :param input_path: input video
+    :param output_folder: folder for the images
+    :param frame_detections: detections per frame index
+    :param samples: reasons per sampled frame index
+    :param thumbnail_width: width of every thumbnail
+    :param sheet_size: optional columns and rows of contact sheets, single thumbnails are written if not set
+    :param workers: amount of threads annotating and encoding images
+    :return: paths of the written images
+    """
+    output_folder.mkdir(parents=True, exist_ok=True)
+    written, writes = [], []
+    with imageio.get_reader(input_path) as reader:
+        fps = reader.get_meta_data()["fps"]
+    with ThreadPoolExecutor(workers) as executor:
+        pending = []
+        frames = read_frames(input_path, list(samples))
+        for index, frame in tqdm(frames, total=len(samples), desc="Writing review", unit="frames", dynamic_ncols=True):
+            reasons = samples[index]
+            arguments = (frame, index, fps, frame_detections.get(index, []), frame_detections.get(index - 1, []), reasons, thumbnail_width)
+            if sheet_size is None:
+                path = output_folder / f"{input_path.stem}_{index:06d}.jpg"
+                writes.append(executor.submit(write_thumbnail, path, arguments))
+                written.append(path)
+                continue
+
+            # tiles are annotated in parallel, the sheet is written once all of its tiles are done
+            columns, rows = sheet_size
+            pending.append(executor.submit(annotate, *arguments))
+            if len(pending) == columns * rows:
+                path = output_folder / f"{input_path.stem}_sheet_{len(written):04d}.jpg"
+                writes.append(executor.submit(write_sheet, path, pending, columns))
+                written.append(path)
+                pending = []
+
+        if pending:
+            path = output_folder / f"{input_path.stem}_sheet_{len(written):04d}.jpg"
+            writes.append(executor.submit(write_sheet, path, pending, sheet_size[0]))
+            written.append(path)
+    # raise errors of the writers
+    for write in writes:
+        write.result()
+    return written
+
+
+def summarize(frame_detections: Dict[int, List[Detection]], samples: Dict[int, List[str]]) -> Dict:
+    """
+    Summary of a review for the review's index file
+    :param frame_detections: detections per frame index
+    :param samples: reasons per sampled frame index
+    :return: counts of frames, detections and samples per reason
+    """
+    reasons = defaultdict(int)
+    for sample_reasons in samples.values():
+        for reason in sample_reasons:
+            reasons[reason] += 1
+    return {
+        "frames": len(frame_detections),
+        "frames_with_detections": sum(1 for detections in frame_detections.values() if detections),
+        "detections": sum(len(detections) for detections in frame_detections.values()),
+        "samples": {str(index): reasons for index, reasons in samples.items()},
+        "samples_per_reason": dict(reasons),
+    }
@@ -1,16 +1,10 @@
-import multiprocessing as mp
-import os
-import subprocess
-from concurrent.futures import ProcessPoolExecutor
-from pathlib import Path
-from shutil import which
+import threading
 from timeit import default_timer as timer
 
-import cv2
-import imageio
-from more_itertools import chunked
 from PySide6.QtCore import QThread, Signal
-from src.blurrer import VideoBlurrer, blur_helper
+from src.blurrer import VideoBlurrer
+from src.metrics import ThroughputMeter
+from src.model_registry import registry
 
 
 class qtVideoBlurWrapper(VideoBlurrer, QThread):
@@ -18,6 +12,7 @@ class qtVideoBlurWrapper(VideoBlurrer, QThread):
     updateProgress = Signal(int)
     alert = Signal(str)
     status = Signal(str)
+    throughput = Signal(float, float)
 
     def __init__(self, weights_name, parameters):
         """
@@ -27,14 +22,41 @@ class qtVideoBlurWrapper(VideoBlurrer, QThread):
         """
         QThread.__init__(self)
         VideoBlurrer.__init__(self, weights_name, parameters)
-        self.result = {"success": False, "elapsed_time": 0}
-        self._abort = False
+        self.result = {"success": False, "elapsed_time": 0, "metrics": None}
+        self.abort_event = threading.Event()
+        self.throughput_meter = ThroughputMeter()
 
     def abort(self):
         """
-        Tell the blurrer to (cleanly) exit by processing no further batches
+        Tell the blurrer to (cleanly) exit, it stops after the current frame, inference call or blurred frame
         """
-        self._abort = True
+        self.abort_event.set()
+
+    def start(self):
+        """
+        Start blurring in the thread, resetting an abort of the previous run
+        """
+        self.abort_event.clear()
+        QThread.start(self)
+
+    def is_aborted(self) -> bool:
+        """
+        Abort callback for VideoBlurrer.blur_video
+        """
+        return self.abort_event.is_set()
+
+    def report_progress(self, processed_frames: int, total_frames: int):
+        """
+        Progress callback for VideoBlurrer.blur_video, forwards the progress to the GUI's progress bar and frame rate readout
+        :param processed_frames: amount of frames written so far
+        :param total_frames: total amount of frames
+        """
+        if processed_frames == 0:
+            self.throughput_meter = ThroughputMeter()
+            self.setMaximum.emit(total_frames)
+        fps, remaining_seconds = self.throughput_meter.update(processed_frames, total_frames)
+        self.updateProgress.emit(processed_frames)
+        self.throughput.emit(fps, remaining_seconds)
 
     def run(self):
         """
@@ -45,117 +67,83 @@ class qtVideoBlurWrapper(VideoBlurrer, QThread):
         self.result["success"] = False
         start = timer()
 
-        # gather inputs from self.parameters
-        input_path = self.parameters["input_path"]
-        output_file = Path(self.parameters["output_path"])
-        temp_output = output_file.parent / f"{output_file.stem}_copy{output_file.suffix}"
-        output_path = self.parameters["output_path"]
-        quality = self.parameters["quality"]
-        batch_size = self.parameters["batch_size"]
-        blur_workers = min(self.parameters["blur_workers"], mp.cpu_count(), batch_size)
-
-        # prepare detection cache
-        frame_detections = {}
-
-        # customize detector
-        self.detector.conf = self.parameters["threshold"]
-
-        # open video file
-        with imageio.get_reader(input_path) as reader:
-
-            # get the height and width of each frame for future debug outputs on frame
-            meta = reader.get_meta_data()
-            fps = meta["fps"]
-            duration = meta["duration"]
-            length = int(duration * fps)
-            audio_present = "audio_codec" in meta
-            blur_executor = ProcessPoolExecutor(blur_workers)
-
-            # save the video to a file
-            with imageio.get_writer(
-                temp_output, codec="libx264", fps=fps, quality=quality, macro_block_size=None
-            ) as writer:
-
-                # update GUI's progress bar on its maximum frames
-                self.setMaximum.emit(length)
-                current_frame = 0
-
-                for batch_index, frame_batch in enumerate(chunked(reader, batch_size)):
-                    if self._abort:
-                        break
-
-                    frame_buffer = [cv2.cvtColor(frame_read, cv2.COLOR_BGR2RGB) for frame_read in frame_batch]
-                    self.status.emit("Getting detections...")
-                    for index, detection in enumerate(self.detect_identifiable_information(frame_buffer)):
-                        frame_detections[batch_size * batch_index + index] = detection
-                    self.status.emit("Blurring and writing frames...")
-                    args = [
-                        [frame, global_index, frame_detections, self.parameters]
-                        for frame, global_index in
-                        zip(frame_buffer, [batch_size * batch_index + x for x in range(batch_size)])
-                    ]
-                    for frame_blurred in blur_executor.map(blur_helper, args):
-                        frame_blurred_rgb = cv2.cvtColor(frame_blurred, cv2.COLOR_BGR2RGB)
-                        writer.append_data(frame_blurred_rgb)
-                    current_frame += batch_size
-                    self.updateProgress.emit(current_frame)
-                    self.status.emit("Getting frames...")
-
-            import json
-            pass
+        self.blur_video(
+            progress_callback=self.report_progress,
+            status_callback=self.status.emit,
+            abort_callback=self.is_aborted,
+            alert_callback=self.alert.emit,
+        )
 
         self.status.emit("idle")
-        if self._abort:
-            self._abort = False
+        if self.abort_event.is_set():
             return
 
-        # copy over audio stream from original video to edited video
-        if is_installed("ffmpeg"):
-            ffmpeg_exe = "ffmpeg"
-        else:
-            ffmpeg_exe = os.getenv("FFMPEG_BINARY")
-            if not ffmpeg_exe:
-                self.alert.emit(
-                    "FFMPEG could not be found! Please make sure the ffmpeg.exe is available under the envirnment variable 'FFMPEG_BINARY'."
-                )
-                return
-        if audio_present:
-            subprocess.run(
-                [
-                    ffmpeg_exe,
-                    "-y",
-                    "-i",
-                    temp_output,
-                    "-i",
-                    input_path,
-                    "-c",
-                    "copy",
-                    "-map",
-                    "0:0",
-                    "-map",
-                    "1:1",
-                    "-shortest",
-                    output_path,
-                ],
-                stdout=subprocess.DEVNULL,
-            )
-            # delete temporary output that had no audio track
-            try:
-                os.remove(temp_output)
-            except Exception as e:
-                self.alert.emit(
-                    f"Could not delete temporary, muted video. Maybe another process (like a cloud storage service or antivirus) is using it already.\n{str(e)}"
-                )
-        else:
-            os.rename(temp_output, output_path)
-
         # store success and elapsed time
         self.result["success"] = True
         self.result["elapsed_time"] = timer() - start
+        self.result["metrics"] = self.metrics.summary()
+
+
+class ModelLoader(QThread):
+    """
+    Load and warm up a detector in the background, so the GUI stays responsive. The detector ends up in the
+    model registry, creating a qtVideoBlurWrapper for it afterwards is instant.
+    """
+
+    failed = Signal(str)
+
+    def __init__(self, weights_name: str, inference_size: int):
+        """
+        Constructor
+        :param weights_name: file name of the weights to be loaded
+        :param inference_size: inference size the detector is warmed up for
+        """
+        QThread.__init__(self)
+        self.weights_name = weights_name
+        self.inference_size = inference_size
+        self.error = None
+
+    def run(self):
+        """
+        Load the detector into the model registry
+        """
+        try:
+            registry.get_detector(self.weights_name, self.inference_size)
+        except Exception as e:
+            self.error = str(e)
+            self.failed.emit(f"Could not load {self.weights_name}.pt:\n{self.error}")
 
 
-def is_installed(name):
+class PreviewLoader(QThread):
     """
-    Check whether an executable is available
+    Decode and run detection on the frames a preview needs in the background, see PreviewSession.load
     """
-    return which(name) is not None
+
+    failed = Signal(str)
+
+    def __init__(self, session, blurrer, input_path: str, index: int, blur_memory: int):
+        """
+        Constructor
+        :param session: PreviewSession to fill
+        :param blurrer: loaded blurrer providing the detector
+        :param input_path: input video
+        :param index: frame index
+        :param blur_memory: amount of previous frames whose detections are blurred as well
+        """
+        QThread.__init__(self)
+        self.session = session
+        self.blurrer = blurrer
+        self.input_path = input_path
+        self.index = index
+        self.blur_memory = blur_memory
+        self.error = None
+
+    def run(self):
+        """
+        Load the frames into the preview session
+        """
+        try:
+            self.session.load(self.blurrer, self.input_path, self.index, self.blur_memory)
+        except Exception as e:
+            self.error = str(e)
+            self.failed.emit(f"Could not load the preview:\n{self.error}")
@@ -0,0 +1,84 @@
+import os
+import sys
+from concurrent.futures import Executor
+from typing import Dict, Union
+
+import cv2
+
+
+def allocate_threads(total: int, blur_workers: int, videos: int = 1) -> Dict[str, int]:
+    """
+    Split a thread budget across the stages of blur_video. ffmpeg gets its share first, the detector and the blur workers
+    divide the rest, so the parts add up to the budget. Every part needs at least one thread: if the budget is smaller than
+    that, each part gets one and total reports the threads actually allocated.
+    torch, OpenCV and ffmpeg otherwise each start one thread per core, in every blur worker process and every video.
+    :param total: threads available for all videos processed at the same time
+    :param blur_workers: blur worker processes per video
+    :param videos: videos processed at the same time, which share the detector but have their own workers and ffmpeg processes
+    :return: requested budget, threads allocated in total, for the detector (and OpenCV in the main process), per blur worker, for the encoder and the decoder
+    """
+    workers = max(blur_workers, 1) * videos
+    decoder = max(1, total // (8 * videos))
+    encoder = max(1, total // (4 * videos))
+    # leave at least one thread for the detector and for every blur worker, taken from the encoder first
+    while total - videos * (decoder + encoder) < 1 + workers and decoder + encoder > 2:
+        if encoder > 1:
+            encoder -= 1
+        else:
+            decoder -= 1
+    remaining = max(total - videos * (decoder + encoder), 1 + workers)
+    blur_threads = max(1, remaining // 2 // workers)
+    detector = remaining - workers * blur_threads
+    return {
+        "budget": total,
+        "total": videos * (decoder + encoder) + detector + workers * blur_threads,
+        "detector": detector,
+        "blur_workers": blur_workers,
+        "blur_threads_per_worker": blur_threads,
+        "encoder": encoder,
+        "decoder": decoder,
+    }
+
+
+def set_opencv_threads(threads: int) -> None:
+    """
+    Limit OpenCV's thread pool of the current process, used as initializer of the blur worker processes
+    :param threads: amount of threads
+    """
+    cv2.setNumThreads(threads)
+
+
+def get_opencv_threads() -> int:
+    """
+    Threads of OpenCV's pool in the current process, can be submitted to a blur worker process
+    :return: amount of threads
+    """
+    return cv2.getNumThreads()
+
+
+def apply_thread_budget(allocation: Dict[str, int]) -> None:
+    """
+    Limit torch and OpenCV in this process to the detector's share of the budget. torch is only configured if a detector
+    loaded it already, it is not imported just for this.
+    :param allocation: thread allocation from allocate_threads
+    """
+    set_opencv_threads(allocation["detector"])
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        if torch.get_num_threads() != allocation["detector"]:
+            torch.set_num_threads(allocation["detector"])
+
+
+def effective_threads(blur_executor: Executor = None) -> Dict[str, Union[int, None]]:
+    """
+    Thread counts the libraries actually use, to verify an allocation or to report the defaults
+    :param blur_executor: optional blur process pool to query
+    :return: threads of torch (None if not loaded), of OpenCV in this process and in a blur worker, and the CPU count
+    """
+    torch = sys.modules.get("torch")
+    return {
+        "cpu_count": os.cpu_count(),
+        "torch": torch.get_num_threads() if torch else None,
+        "opencv": get_opencv_threads(),
+        "opencv_blur_worker": blur_executor.submit(get_opencv_threads).result() if blur_executor else None,
+    }
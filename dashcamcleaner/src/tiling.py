@@ -0,0 +1,133 @@
+from math import ceil
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from src.bounds import Bounds
+from src.detection import Detection
+
+# detections of the same kind overlapping more than this are merged, e.g. a plate found in the full frame and in a tile
+TILE_NMS_IOU = 0.5
+
+
+def parse_bands(bands: str) -> List[Tuple[float, float]]:
+    """
+    Parse horizontal bands given as relative y_min-y_max pairs, e.g. "0.35-0.6,0.6-0.7"
+    :param bands: comma separated bands
+    :return: relative y_min and y_max per band
+    """
+    parsed = []
+    for band in bands.split(","):
+        y_min, _, y_max = band.partition("-")
+        try:
+            parsed.append((float(y_min), float(y_max)))
+        except ValueError:
+            raise ValueError(f"Invalid tile band {band}, expected relative y_min-y_max like 0.35-0.6.")
+        if not 0 <= parsed[-1][0] < parsed[-1][1] <= 1:
+            raise ValueError(f"Invalid tile band {band}, expected 0 <= y_min < y_max <= 1.")
+    return parsed
+
+
+def tile_positions(start: int, end: int, size: int, overlap: float) -> List[int]:
+    """
+    Evenly spaced start positions of tiles covering a range, neighbouring tiles overlap by at least the given share
+    :param start: start of the range
+    :param end: end of the range
+    :param size: tile size
+    :param overlap: minimum overlap of neighbouring tiles, relative to the tile size
+    :return: tile start positions
+    """
+    if end - start <= size:
+        return [start]
+    count = ceil((end - start - size) / (size * (1 - overlap))) + 1
+    return [start + round(i * (end - start - size) / (count - 1)) for i in range(count)]
+
+
+def tile_windows(shape, bands: Sequence[Tuple[float, float]], tile_size: int, overlap: float) -> List[Bounds]:
+    """
+    Tiles of at most tile_size x tile_size pixels covering the given bands of a frame. All tiles of a band have the same size,
+    so they can be batched.
+    :param shape: shape of the frame
+    :param bands: relative y_min and y_max per band
+    :param tile_size: maximum tile width and height in pixels
+    :param overlap: minimum overlap of neighbouring tiles, relative to the tile size
+    :return: tile bounds
+    """
+    height, width = shape[:2]
+    windows = []
+    for band_min, band_max in bands:
+        y_start, y_end = round(band_min * height), round(band_max * height)
+        tile_width, tile_height = min(tile_size, width), min(tile_size, y_end - y_start)
+        for y in tile_positions(y_start, y_end, tile_height, overlap):
+            for x in tile_positions(0, width, tile_width, overlap):
+                windows.append(Bounds(x, y, x + tile_width, y + tile_height))
+    return windows
+
+
+def box_iou(boxes: np.ndarray, box: np.ndarray) -> np.ndarray:
+    """
+    Intersection over union of several boxes with a single box
+    :param boxes: array of x_min, y_min, x_max, y_max rows
+    :param box: x_min, y_min, x_max, y_max
+    :return: IoU per row
+    """
+    overlap_width = np.clip(np.minimum(boxes[:, 2], box[2]) - np.maximum(boxes[:, 0], box[0]), 0, None)
+    overlap_height = np.clip(np.minimum(boxes[:, 3], box[3]) - np.maximum(boxes[:, 1], box[1]), 0, None)
+    intersection = overlap_width * overlap_height
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    return intersection / np.maximum(areas + area - intersection, 1e-9)
+
+
+def non_max_suppression(detections: List[Detection], iou_threshold: float = TILE_NMS_IOU) -> List[Detection]:
+    """
+    Keep only the best scoring detection of each group of overlapping detections of the same kind
+    :param detections: detections of a frame
+    :param iou_threshold: detections overlapping a better one by more than this are dropped
+    :return: remaining detections
+    """
+    kept = []
+    for kind in sorted({detection.kind for detection in detections}):
+        candidates = sorted((d for d in detections if d.kind == kind), key=lambda d: d.score, reverse=True)
+        boxes = np.array([[d.bounds.x_min, d.bounds.y_min, d.bounds.x_max, d.bounds.y_max] for d in candidates], dtype=np.float64)
+        suppressed = np.zeros(len(candidates), dtype=bool)
+        for i, candidate in enumerate(candidates):
+            if suppressed[i]:
+                continue
+            kept.append(candidate)
+            suppressed[i + 1:] |= box_iou(boxes[i + 1:], boxes[i]) > iou_threshold
+    return kept
+
+
+def detect_tiles(
+    run_detector, images: list, frame_detections: List[List[Detection]], parameters: Dict, threshold: float
+) -> List[List[Detection]]:
+    """
+    Add detections from full resolution tiles of the configured bands, e.g. the horizon where distant plates are too small
+    for the downscaled full frame. Tiles of all frames are batched by shape, batch_size tiles per detector call.
+    :param run_detector: function running the detector on images with an inference size and threshold
+    :param images: frames of the same size
+    :param frame_detections: detections of the full frames
+    :param parameters: blurring parameters with tile_bands, tile_size and tile_overlap
+    :param threshold: detection threshold
+    :return: merged detections per frame
+    """
+    tile_size = parameters.get("tile_size") or parameters["inference_size"]
+    windows = tile_windows(images[0].shape, parse_bands(parameters["tile_bands"]), tile_size, parameters.get("tile_overlap", 0.2))
+    merged = [list(detections) for detections in frame_detections]
+
+    # tiles of the same shape across all frames of the batch, as (frame index, window)
+    tiles_by_shape: Dict[Tuple[int, int], List[Tuple[int, Bounds]]] = {}
+    for window in windows:
+        shape = (window.y_max - window.y_min, window.x_max - window.x_min)
+        tiles_by_shape.setdefault(shape, []).extend((index, window) for index in range(len(images)))
+
+    batch_size = max(parameters.get("batch_size", 1), 1)
+    for shape, tiles in tiles_by_shape.items():
+        for start in range(0, len(tiles), batch_size):
+            chunk = tiles[start:start + batch_size]
+            crops = [images[index][window.coords_as_slices()] for index, window in chunk]
+            # tiles are detected at their full resolution, rounded up to the detector's stride of 32
+            inference_size = ceil(max(shape) / 32) * 32
+            for (index, window), detections in zip(chunk, run_detector(crops, inference_size, threshold)):
+                merged[index].extend(detection.get_shifted(window.x_min, window.y_min) for detection in detections)
+    return [non_max_suppression(detections) for detections in merged]
@@ -15,16 +15,17 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QComboBox, QDoubleSpinBox, QFrame,
-    QHBoxLayout, QLabel, QLineEdit, QMainWindow,
-    QProgressBar, QPushButton, QSizePolicy, QSpacerItem,
-    QSpinBox, QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QAbstractItemView, QApplication, QComboBox, QDoubleSpinBox,
+    QFrame, QHBoxLayout, QLabel, QLineEdit,
+    QListWidget, QListWidgetItem, QMainWindow, QProgressBar,
+    QPushButton, QSizePolicy, QSpacerItem, QSpinBox,
+    QVBoxLayout, QWidget)
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
         if not MainWindow.objectName():
             MainWindow.setObjectName(u"MainWindow")
-        MainWindow.resize(822, 310)
+        MainWindow.resize(822, 420)
         self.centralwidget = QWidget(MainWindow)
         self.centralwidget.setObjectName(u"centralwidget")
         self.verticalLayout = QVBoxLayout(self.centralwidget)
@@ -63,6 +64,37 @@ class Ui_MainWindow(object):
 
         self.verticalLayout.addLayout(self.horizontalLayout_2)
 
+        self.horizontalLayout_6 = QHBoxLayout()
+        self.horizontalLayout_6.setObjectName(u"horizontalLayout_6")
+        self.list_queue = QListWidget(self.centralwidget)
+        self.list_queue.setObjectName(u"list_queue")
+        self.list_queue.setMaximumSize(QSize(16777215, 100))
+        self.list_queue.setSelectionMode(QAbstractItemView.ExtendedSelection)
+
+        self.horizontalLayout_6.addWidget(self.list_queue)
+
+        self.verticalLayout_2 = QVBoxLayout()
+        self.verticalLayout_2.setObjectName(u"verticalLayout_2")
+        self.button_queue_add = QPushButton(self.centralwidget)
+        self.button_queue_add.setObjectName(u"button_queue_add")
+
+        self.verticalLayout_2.addWidget(self.button_queue_add)
+
+        self.button_queue_remove = QPushButton(self.centralwidget)
+        self.button_queue_remove.setObjectName(u"button_queue_remove")
+
+        self.verticalLayout_2.addWidget(self.button_queue_remove)
+
+        self.verticalSpacer = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
+
+        self.verticalLayout_2.addItem(self.verticalSpacer)
+
+
+        self.horizontalLayout_6.addLayout(self.verticalLayout_2)
+
+
+        self.verticalLayout.addLayout(self.horizontalLayout_6)
+
         self.line = QFrame(self.centralwidget)
         self.line.setObjectName(u"line")
         self.line.setFrameShape(QFrame.HLine)
@@ -202,6 +234,37 @@ class Ui_MainWindow(object):
 
         self.verticalLayout.addLayout(self.horizontalLayout_4)
 
+        self.horizontalLayout_8 = QHBoxLayout()
+        self.horizontalLayout_8.setObjectName(u"horizontalLayout_8")
+        self.label_11 = QLabel(self.centralwidget)
+        self.label_11.setObjectName(u"label_11")
+
+        self.horizontalLayout_8.addWidget(self.label_11)
+
+        self.spin_preview_frame = QSpinBox(self.centralwidget)
+        self.spin_preview_frame.setObjectName(u"spin_preview_frame")
+        self.spin_preview_frame.setMaximum(9999999)
+
+        self.horizontalLayout_8.addWidget(self.spin_preview_frame)
+
+        self.button_preview = QPushButton(self.centralwidget)
+        self.button_preview.setObjectName(u"button_preview")
+
+        self.horizontalLayout_8.addWidget(self.button_preview)
+
+        self.horizontalSpacer_4 = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum)
+
+        self.horizontalLayout_8.addItem(self.horizontalSpacer_4)
+
+
+        self.verticalLayout.addLayout(self.horizontalLayout_8)
+
+        self.label_preview = QLabel(self.centralwidget)
+        self.label_preview.setObjectName(u"label_preview")
+        self.label_preview.setAlignment(Qt.AlignCenter)
+
+        self.verticalLayout.addWidget(self.label_preview)
+
         self.line_3 = QFrame(self.centralwidget)
         self.line_3.setObjectName(u"line_3")
         self.line_3.setFrameShape(QFrame.HLine)
@@ -255,6 +318,16 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout_7.addItem(self.horizontalSpacer_3)
 
+        self.label_fps = QLabel(self.centralwidget)
+        self.label_fps.setObjectName(u"label_fps")
+
+        self.horizontalLayout_7.addWidget(self.label_fps)
+
+        self.label_eta = QLabel(self.centralwidget)
+        self.label_eta.setObjectName(u"label_eta")
+
+        self.horizontalLayout_7.addWidget(self.label_eta)
+
 
         self.verticalLayout.addLayout(self.horizontalLayout_7)
 
@@ -269,6 +342,8 @@ class Ui_MainWindow(object):
         MainWindow.setWindowTitle(QCoreApplication.translate("MainWindow", u"DashcamCleaner", None))
         self.button_source.setText(QCoreApplication.translate("MainWindow", u"Select video", None))
         self.button_target.setText(QCoreApplication.translate("MainWindow", u"Select target", None))
+        self.button_queue_add.setText(QCoreApplication.translate("MainWindow", u"Add to queue", None))
+        self.button_queue_remove.setText(QCoreApplication.translate("MainWindow", u"Remove", None))
         self.label_3.setText(QCoreApplication.translate("MainWindow", u"Blur size", None))
         self.label_9.setText(QCoreApplication.translate("MainWindow", u"Feather edges", None))
         self.label_5.setText(QCoreApplication.translate("MainWindow", u"Detection threshold", None))
@@ -278,9 +353,14 @@ class Ui_MainWindow(object):
         self.label_8.setText(QCoreApplication.translate("MainWindow", u"Batch size", None))
         self.label_2.setText(QCoreApplication.translate("MainWindow", u"Blur workers", None))
         self.label_7.setText(QCoreApplication.translate("MainWindow", u"Output Quality", None))
+        self.label_11.setText(QCoreApplication.translate("MainWindow", u"Preview frame", None))
+        self.button_preview.setText(QCoreApplication.translate("MainWindow", u"Preview", None))
+        self.label_preview.setText("")
         self.button_start.setText(QCoreApplication.translate("MainWindow", u"Start", None))
         self.button_abort.setText(QCoreApplication.translate("MainWindow", u"Abort", None))
         self.label_4.setText(QCoreApplication.translate("MainWindow", u"Status", None))
         self.label_status.setText(QCoreApplication.translate("MainWindow", u"idle", None))
+        self.label_fps.setText(QCoreApplication.translate("MainWindow", u"- fps", None))
+        self.label_eta.setText(QCoreApplication.translate("MainWindow", u"ETA -", None))
     # retranslateUi
 
@@ -0,0 +1,202 @@
+import json
+import os
+import time
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Dict, List, Tuple, Union
+
+from src.prometheus import exporter
+
+VIDEO_SUFFIXES = {".mp4", ".mov", ".mkv", ".avi"}
+QUEUE_FILE = ".dashcamcleaner_queue.json"
+STATUS_FILE = ".dashcamcleaner_status.json"
+
+
+class FolderWatcher:
+    """
+    Watch an input folder and blur every new, completely written video into an output folder
+    """
+
+    def __init__(
+        self: "FolderWatcher",
+        blurrer,
+        parameters: Dict[str, Union[bool, int, float, str]],
+        input_folder: Path,
+        output_folder: Path,
+        poll_interval: float = 10.0,
+        settle_polls: int = 2,
+    ) -> None:
+        """
+        Constructor
+        :param blurrer: VideoBlurrer whose detector and process pool are reused for every file
+        :param parameters: blurring parameters, input_path and output_path are set per file
+        :param input_folder: folder to watch for new videos
+        :param output_folder: folder to write blurred videos to
+        :param poll_interval: seconds between two scans of the input folder
+        :param settle_polls: amount of consecutive scans a file's size has to stay unchanged before it is enqueued
+        """
+        self.blurrer = blurrer
+        self.parameters = parameters
+        self.input_folder = Path(input_folder)
+        self.output_folder = Path(output_folder)
+        self.poll_interval = poll_interval
+        self.settle_polls = settle_polls
+        self.queue_path = self.output_folder / QUEUE_FILE
+        self.status_path = self.output_folder / STATUS_FILE
+
+        # file name -> (size, mtime, amount of unchanged scans) for files that may still be written to
+        self.candidates: Dict[str, Tuple[int, float, int]] = {}
+        self.pending: List[str] = []
+        self.done: List[str] = []
+        self.failed: List[str] = []
+        self.frames_processed = 0
+        self.processing_time = 0.0
+        self.started = time.time()
+        self.load_queue()
+        self.remove_partial_outputs()
+
+    def load_queue(self: "FolderWatcher") -> None:
+        """
+        Restore the queue of a previous run, files that were being processed during a crash are enqueued again
+        """
+        if not self.queue_path.is_file():
+            return
+        with open(self.queue_path) as f:
+            state = json.load(f)
+        self.done = state.get("done", [])
+        self.failed = state.get("failed", [])
+        current = state.get("current")
+        self.pending = ([current] if current else []) + state.get("pending", [])
+        print(f"Recovered queue: {len(self.pending)} pending, {len(self.done)} done, {len(self.failed)} failed")
+
+    def save_queue(self: "FolderWatcher", current: str = None) -> None:
+        """
+        Atomically persist the queue so it survives restarts
+        :param current: file that is being processed right now
+        """
+        state = {"current": current, "pending": self.pending, "done": self.done, "failed": self.failed}
+        write_json_atomically(self.queue_path, state)
+
+    def remove_partial_outputs(self: "FolderWatcher") -> None:
+        """
+        Delete leftovers of files that were interrupted while being written
+        """
+        for partial in self.output_folder.glob(".*.partial*"):
+            partial.unlink()
+
+    def status(self: "FolderWatcher") -> Dict[str, Union[int, float]]:
+        """
+        Gather queue depth and throughput numbers
+        :return: status dictionary
+        """
+        uptime = time.time() - self.started
+        return {
+            "queue_depth": len(self.pending),
+            "waiting_for_completion": len(self.candidates),
+            "files_done": len(self.done),
+            "files_failed": len(self.failed),
+            "frames_processed": self.frames_processed,
+            "frames_per_second": self.frames_processed / self.processing_time if self.processing_time else 0.0,
+            "files_per_hour": len(self.done) / uptime * 3600 if uptime else 0.0,
+            "uptime": uptime,
+        }
+
+    def write_status(self: "FolderWatcher") -> None:
+        """
+        Write the current status next to the output files for monitoring
+        """
+        write_json_atomically(self.status_path, self.status())
+
+    def scan(self: "FolderWatcher") -> None:
+        """
+        Scan the input folder and enqueue all new files whose size did not change for settle_polls scans
+        """
+        known = set(self.pending) | set(self.done) | set(self.failed)
+        seen = set()
+        for input_file in sorted(self.input_folder.iterdir()):
+            name = input_file.name
+            if name.startswith(".") or input_file.suffix.lower() not in VIDEO_SUFFIXES or name in known:
+                continue
+            if (self.output_folder / name).exists():
+                continue
+            try:
+                stat = input_file.stat()
+            except FileNotFoundError:
+                continue
+            seen.add(name)
+            size, mtime, unchanged = self.candidates.get(name, (-1, -1.0, 0))
+            unchanged = unchanged + 1 if (stat.st_size, stat.st_mtime) == (size, mtime) and size > 0 else 0
+            if unchanged >= self.settle_polls:
+                self.pending.append(name)
+                del self.candidates[name]
+                print(f"Enqueued {name}")
+            else:
+                self.candidates[name] = (stat.st_size, stat.st_mtime, unchanged)
+
+        # forget candidates that disappeared from the input folder
+        for name in set(self.candidates) - seen:
+            del self.candidates[name]
+        self.save_queue()
+
+    def process_next(self: "FolderWatcher") -> None:
+        """
+        Blur the oldest queued file and atomically move the result into the output folder
+        """
+        name = self.pending.pop(0)
+        self.save_queue(current=name)
+        input_file = self.input_folder / name
+        output_file = self.output_folder / name
+        partial_file = self.output_folder / f".{input_file.stem}.partial{input_file.suffix}"
+
+        self.blurrer.parameters = {**self.parameters, "input_path": str(input_file), "output_path": str(partial_file)}
+        print("Start blurring video:", input_file)
+        start = timer()
+        try:
+            frames = self.blurrer.blur_video()
+            os.replace(partial_file, output_file)
+            # sidecar files like detections or metrics are named after the partial file, too
+            for sidecar in self.output_folder.glob(f"{partial_file.stem}.*"):
+                os.replace(sidecar, self.output_folder / f"{input_file.stem}{sidecar.name[len(partial_file.stem):]}")
+        except Exception as e:
+            print(f"Blurring {name} failed: {e}")
+            exporter.file_finished(False)
+            self.failed.append(name)
+            for leftover in self.output_folder.glob(f".{input_file.stem}.partial*"):
+                leftover.unlink()
+        else:
+            exporter.file_finished(True)
+            self.done.append(name)
+            self.frames_processed += frames
+            print("Blurred video successfully written to:", output_file)
+        finally:
+            self.processing_time += timer() - start
+            self.save_queue()
+            self.write_status()
+
+    def run(self: "FolderWatcher") -> None:
+        """
+        Watch the input folder until interrupted
+        """
+        print(f"Watching {self.input_folder}, writing to {self.output_folder}")
+        try:
+            while True:
+                self.scan()
+                while self.pending:
+                    self.process_next()
+                    self.scan()
+                self.write_status()
+                time.sleep(self.poll_interval)
+        finally:
+            self.blurrer.close()
+
+
+def write_json_atomically(path: Path, content: Dict) -> None:
+    """
+    Write a JSON file via a temporary file so readers never see a half written file
+    :param path: target path
+    :param content: JSON serializable content
+    """
+    temp_path = path.with_name(f"{path.name}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(content, f, indent=2)
+    os.replace(temp_path, path)
@@ -0,0 +1,23 @@
+import re
+from pathlib import Path
+
+WEIGHTS_FOLDER = Path(__file__).resolve().parents[1] / "weights"
+
+
+def get_weights_path(weights_name: str) -> Path:
+    """
+    Resolve a weights name to its .pt file in the weights folder
+    :param weights_name: file name of the weights, with or without .pt suffix
+    :return: path to the .pt file
+    """
+    return WEIGHTS_FOLDER / f"{weights_name}.pt".replace(".pt.pt", ".pt")
+
+
+def get_inference_size(weights_name: str) -> int:
+    """
+    Derive the inference width from the training resolution in the weights name, e.g. 720p_medium_mosaic -> 1280
+    :param weights_name: file name of the weights
+    :return: inference size
+    """
+    training_inference_size = int(re.search(r"(?P<imgsz>\d*)p\_", weights_name).group("imgsz"))
+    return int(training_inference_size * 16 / 9)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the application imports its modules as src.*, relative to the dashcamcleaner folder
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
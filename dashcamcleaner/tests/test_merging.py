@@ -0,0 +1,34 @@
+import numpy as np
+from src.blending import render_mask
+from src.bounds import Bounds
+from src.detection import Detection
+from src.merging import merge_detections
+
+
+def uncovered_pixels(detections, merged, shape):
+    before = render_mask(shape, detections, 0, colored=False) > 0
+    after = render_mask(shape, merged, 0, colored=False) > 0
+    return np.count_nonzero(before & ~after)
+
+
+def test_merged_thin_faces_stay_covered():
+    shape = (120, 160, 3)
+    detections = [Detection(Bounds(20, 105, 48, 109), 0.9, "face"), Detection(Bounds(48, 105, 102, 109), 0.8, "face")]
+    merged = merge_detections(detections, shape, merge_distance=10, max_regions=1)
+    assert uncovered_pixels(detections, merged, shape) == 0
+
+
+def test_merging_keeps_every_pixel_of_the_original_masks_covered():
+    rng = np.random.default_rng(0)
+    shape = (120, 160, 3)
+    for _ in range(300):
+        detections = []
+        for _ in range(rng.integers(2, 12)):
+            # many thin boxes, their ellipses are the hardest to cover after rounding
+            width = rng.integers(2, 6) if rng.random() < 0.3 else rng.integers(2, 60)
+            height = rng.integers(2, 6) if rng.random() < 0.3 else rng.integers(2, 60)
+            x, y = rng.integers(0, shape[1] - width + 1), rng.integers(0, shape[0] - height + 1)
+            kind = "face" if rng.random() < 0.8 else "plate"
+            detections.append(Detection(Bounds(x, y, x + width, y + height), float(rng.random()), kind))
+        merged = merge_detections(detections, shape, merge_distance=int(rng.integers(0, 10)), max_regions=int(rng.integers(1, 4)))
+        assert uncovered_pixels(detections, merged, shape) == 0
@@ -0,0 +1,29 @@
+import json
+
+import numpy as np
+from cli import parse_arguments
+from src.blurrer import apply_blur
+from src.bounds import Bounds
+from src.detection import Detection
+from src.profiles import load_profile
+
+
+def test_detection_straddling_an_exclusion_region_is_blurred_outside_of_it(tmp_path):
+    profile_path = tmp_path / "hood.json"
+    profile_path.write_text(json.dumps({"exclusions": [[0.0, 0.5, 1.0, 1.0]]}))
+    shape = (100, 200, 3)
+    straddling = Detection(Bounds(50, 30, 110, 70), 0.9, "plate")
+    inside = Detection(Bounds(50, 60, 110, 90), 0.9, "plate")
+    assert load_profile(str(profile_path)).filter_detections([straddling, inside], shape) == [straddling]
+
+    parameters = vars(parse_arguments(["-i", ".", "-o", "."]))
+    parameters.update(profile=str(profile_path), feather_edges=0, blur_size=9, roi_multi=1.0, blur_memory=0)
+    frame = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    blurred = apply_blur(frame, 0, {0: [straddling]}, parameters)
+    changed = (blurred != frame).any(axis=2)
+    assert changed[30:50, 50:110].mean() > 0.95
+    assert not changed[:30].any() and not changed[50:].any()
+
+    parameters.update(export_mask=True)
+    mask = apply_blur(frame, 0, {0: [straddling]}, parameters)
+    assert mask[30:50, 50:110].all() and not mask[50:].any()
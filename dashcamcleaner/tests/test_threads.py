@@ -0,0 +1,21 @@
+from src.threads import allocate_threads
+
+
+def allocated(allocation, videos):
+    return allocation["detector"] + videos * (allocation["blur_workers"] * allocation["blur_threads_per_worker"] + allocation["encoder"] + allocation["decoder"])
+
+
+def test_allocation_stays_within_budget():
+    for videos in (1, 2, 3):
+        for blur_workers in (1, 2, 4, 8):
+            minimum = 1 + videos * (blur_workers + 2)
+            for total in range(1, 65):
+                allocation = allocate_threads(total, blur_workers, videos)
+                assert allocated(allocation, videos) == allocation["total"] == max(total, minimum)
+                assert min(allocation[part] for part in ("detector", "blur_threads_per_worker", "encoder", "decoder")) >= 1
+
+
+def test_small_budget_reports_real_sum():
+    allocation = allocate_threads(2, 1)
+    assert allocation["budget"] == 2
+    assert allocation["total"] == 4